@@ -1,4 +1,7 @@
+import multiprocessing
+
 from imagepy.app import shell
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     shell()
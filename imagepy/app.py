@@ -1,8 +1,11 @@
 import logging
+import multiprocessing
 import tkinter as tk
 
 from imagepy import ROOT_DIR
 from imagepy.utils.gui.menu import create_menu
+from imagepy.utils.gui.widgets import JobStatusBar
+from imagepy.utils.jobs import job_executor
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +19,9 @@ class App:
         menubar = create_menu(root)
         root.config(menu=menubar)
         root.title("ImagePy")
-        root.geometry("400x0")
+        root.geometry("400x30")
+        job_executor.attach(root)
+        JobStatusBar(root).pack(fill=tk.X)
 
         logger.info("Starting...")
         root.mainloop()
@@ -28,10 +33,13 @@ def setup_logging(log_level: int = logging.INFO) -> None:
 
 
 def shell() -> None:
+    # workers of frozen executable measuring in parallel would otherwise start the app again
+    multiprocessing.freeze_support()
     setup_logging()
     app = App()
     app.run()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     shell()
@@ -1,7 +1,9 @@
 import logging
 from tkinter import Menu
 
+from imagepy.utils.image_buffer import copy_counter
 from imagepy.utils.image_manager import ImageManager
+from imagepy.utils.result_cache import result_cache
 
 logger = logging.getLogger(__name__)
 
@@ -17,4 +19,13 @@ def create_debug_menu(menubar: Menu) -> Menu:
             [window.window_title for window in ImageManager.image_windows]
         ),
     )
+    debug_menu.add_command(
+        label="Result cache statistics",
+        command=lambda: logger.debug(result_cache.statistics),
+    )
+    debug_menu.add_command(label="Clear result cache", command=result_cache.clear)
+    debug_menu.add_command(
+        label="Image buffer copies", command=lambda: logger.debug(copy_counter)
+    )
+    debug_menu.add_command(label="Reset image copy counter", command=copy_counter.reset)
     return debug_menu
@@ -5,6 +5,7 @@ from typing import Any
 from PIL import Image
 
 from imagepy.lab1.histogram import HistogramCanvas, HistogramWidget
+from imagepy.pipeline.pipeline import PipelineStep
 from imagepy.utils.constants import (
     MAX_INTENSITY_LEVEL,
     MIN_INTENSITY_LEVEL,
@@ -32,7 +33,8 @@ class LinearAdjustmentWidget(tk.Toplevel):
         self.geometry("350x400")
         self.pack_propagate(False)
         self.image_window = source_image_window
-        self.image = source_image_window.image
+        self.buffer = source_image_window.buffer
+        self.image = self.buffer.image
         self.histogram_max_height = 200
         self.widget_frame: tk.Frame = tk.Frame(self)
 
@@ -120,7 +122,7 @@ class LinearAdjustmentWidget(tk.Toplevel):
         )
 
     def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
         for child in self.histogram_canvas.lines:
             self.histogram_canvas.delete(child)
 
@@ -152,8 +154,10 @@ class LinearAdjustmentWidget(tk.Toplevel):
 
         min_in = min(list_of_pixels)
         max_in = max(list_of_pixels)
-        min_out = max(self.lower_boundary_variable.get(), min_in)
-        max_out = min(self.higher_boundary_variable.get(), max_in)
+        lower = int(self.lower_boundary_variable.get())
+        higher = int(self.higher_boundary_variable.get())
+        min_out = max(lower, min_in)
+        max_out = min(higher, max_in)
         match image.mode:
             case ImageModeEnum.GREYSCALE:
                 list_of_pixels = [
@@ -165,7 +169,11 @@ class LinearAdjustmentWidget(tk.Toplevel):
 
         inverted_image = Image.new(image.mode, image.size)
         inverted_image.putdata(list_of_pixels)
-        self.image_window.update_image(inverted_image)
+        self.image_window.update_image(
+            inverted_image,
+            PipelineStep("linear_stretch", {"lower": lower, "upper": higher}),
+            self,
+        )
 
         for child in self.histogram_canvas.lines:
             self.histogram_canvas.delete(child)
@@ -209,7 +217,7 @@ def histogram_equalization(image_window: ImageWindow | None) -> None:
 
     inverted_image = Image.new(image.mode, image.size)
     inverted_image.putdata(list_of_pixels)
-    image_window.update_image(inverted_image)
+    image_window.update_image(inverted_image, PipelineStep("equalize"))
 
 
 def gamma_correction(image_window: ImageWindow | None) -> None:
@@ -226,7 +234,8 @@ class GammaCorrectionWidget(tk.Toplevel):
         self.geometry("350x400")
         self.pack_propagate(False)
         self.image_window = source_image_window
-        self.image = source_image_window.image
+        self.buffer = source_image_window.buffer
+        self.image = self.buffer.image
         self.histogram_max_height = 200
         self.widget_frame: tk.Frame = tk.Frame(self)
 
@@ -271,7 +280,7 @@ class GammaCorrectionWidget(tk.Toplevel):
         self.widget_frame.pack()
 
     def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
         self.percent.set(1)
         for child in self.histogram_canvas.lines:
             self.histogram_canvas.delete(child)
@@ -311,7 +320,11 @@ class GammaCorrectionWidget(tk.Toplevel):
 
         inverted_image = Image.new(image.mode, image.size)
         inverted_image.putdata(list_of_pixels)
-        self.image_window.update_image(inverted_image)
+        self.image_window.update_image(
+            inverted_image,
+            PipelineStep("gamma", {"gamma": gamma_coefficient}),
+            self,
+        )
 
         for child in self.histogram_canvas.lines:
             self.histogram_canvas.delete(child)
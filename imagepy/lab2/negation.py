@@ -2,6 +2,7 @@ import logging
 
 from PIL import Image
 
+from imagepy.pipeline.pipeline import PipelineStep
 from imagepy.utils.constants import MAX_INTENSITY_LEVEL, ImageModeEnum
 from imagepy.utils.image_manager import ImageWindow
 
@@ -27,4 +28,4 @@ def invert_image(image_window: ImageWindow | None) -> None:
 
     inverted_image = Image.new(source_image.mode, source_image.size)
     inverted_image.putdata(list_of_pixels)
-    image_window.update_image(inverted_image)
+    image_window.update_image(inverted_image, PipelineStep("invert"))
@@ -3,9 +3,9 @@ from typing import Any
 
 import cv2
 import numpy as np
-from PIL import Image
 
 from imagepy.lab1.histogram import HistogramCanvas, HistogramWidget
+from imagepy.pipeline.pipeline import PipelineStep
 from imagepy.utils.constants import (
     MAX_INTENSITY_LEVEL,
     MIN_INTENSITY_LEVEL,
@@ -31,7 +31,8 @@ class ThresholdWidget(tk.Toplevel):
         self.geometry("350x500")
         self.pack_propagate(False)
         self.image_window = source_image_window
-        self.image = source_image_window.image
+        self.buffer = source_image_window.buffer
+        self.image = self.buffer.image
         self.histogram_max_height = 200
         self.widget_frame: tk.Frame = tk.Frame(self)
 
@@ -100,37 +101,49 @@ class ThresholdWidget(tk.Toplevel):
         self.is_binary.trace("w", self.update_threshold)
 
     def otsu_threshold(self) -> None:
-        img = np.array(self.image)
+        img = self.buffer.array
         ret, thresh1 = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         self.lower_boundary_variable.set(int(ret))
         self.higher_boundary_variable.set(255)
         self.is_binary.set(True)
 
     def adaptive_threshold(self) -> None:
-        img = np.array(self.image)
+        img = self.buffer.array
         thresh1 = cv2.adaptiveThreshold(
             img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
         )
-        threshold_image = Image.fromarray(thresh1.astype("uint8"), "L")
-        self.image_window.update_image(threshold_image)
+        self.image_window.update_array(
+            thresh1.astype(np.uint8, copy=False),
+            PipelineStep("adaptive_threshold"),
+            self,
+        )
 
     def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
         self.lower_boundary_variable.set(MIN_INTENSITY_LEVEL)
         self.higher_boundary_variable.set(MAX_INTENSITY_LEVEL)
         self.is_binary.set(False)
 
     def threshold_image(self) -> None:
+        lower = int(self.lower_boundary_variable.get())
+        higher = int(self.higher_boundary_variable.get())
+        is_binary = self.is_binary.get()
         filtered_image = self.image.point(
             lambda p: self.threshold(
                 p,
-                int(self.lower_boundary_variable.get()),
-                int(self.higher_boundary_variable.get()),
+                lower,
+                higher,
                 MIN_INTENSITY_LEVEL,
-                MAX_INTENSITY_LEVEL if self.is_binary.get() else p,
+                MAX_INTENSITY_LEVEL if is_binary else p,
             )
         )
-        self.image_window.update_image(filtered_image)
+        self.image_window.update_image(
+            filtered_image,
+            PipelineStep(
+                "threshold", {"lower": lower, "upper": higher, "binary": is_binary}
+            ),
+            self,
+        )
 
     def update_threshold(self, var: str, _b: Any = None, _c: Any = None) -> None:
         if self.lower_boundary_variable.get() > self.higher_boundary_variable.get():
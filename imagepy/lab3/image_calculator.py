@@ -8,7 +8,9 @@ from PIL import Image
 from PIL.Image import Image as PILImage
 
 from imagepy.utils.constants import ImageModeEnum
+from imagepy.utils.image_buffer import ImageBuffer
 from imagepy.utils.image_manager import ImageWindow
+from imagepy.utils.packed_binary import PackedBinaryImage
 from imagepy.utils.utils import duplicate_image
 
 logger = logging.getLogger(__name__)
@@ -44,6 +46,19 @@ def image_calculator(image_windows: list[ImageWindow], operation_type: str) -> N
             logger.error(ValueError(f"Incorrect image operator! {operation_type}"))
 
 
+def packed_images(image_windows: list[ImageWindow]) -> list[PackedBinaryImage] | None:
+    """
+    Packed pixels of the windows, when all of them are binary images of the same size.
+    Binary buffers are stored packed, so logic operations run on them without unpacking.
+    """
+    buffers = [window.buffer for window in image_windows]
+    if any(buffer.mode != ImageModeEnum.BINARY for buffer in buffers):
+        return None
+    if len({buffer.size for buffer in buffers}) != 1:
+        return None
+    return [buffer.packed for buffer in buffers]
+
+
 def check_window_images(image1: PILImage, image2: PILImage) -> bool:
     return (
         image1.size == image2.size
@@ -79,6 +94,11 @@ class ImageNotWidget(tk.Toplevel):
             for image_window in self.image_windows
             if image_window.window_title == self.selected_image.get()
         ][0]
+        if selected_window.mode == ImageModeEnum.BINARY:
+            ImageWindow(ImageBuffer(~selected_window.buffer.packed))
+            self.destroy()
+            return None
+
         selected_image = selected_window.image
         list_of_pixels = list(selected_image.getdata())
         match selected_image.mode:
@@ -132,6 +152,12 @@ class ImageAndWidget(tk.Toplevel):
         ]
         if selected_window_titles[0] == selected_window_titles[1]:
             selected_windows.append(selected_windows[0])
+        packed = packed_images(selected_windows)
+        if packed is not None:
+            ImageWindow(ImageBuffer(packed[0] & packed[1]))
+            self.destroy()
+            return None
+
         selected_images = [window.image for window in selected_windows]
         if not check_window_images(selected_images[0], selected_images[1]):
             self.warning_label.set(
@@ -194,6 +220,12 @@ class ImageOrWidget(tk.Toplevel):
         ]
         if selected_window_titles[0] == selected_window_titles[1]:
             selected_windows.append(selected_windows[0])
+        packed = packed_images(selected_windows)
+        if packed is not None:
+            ImageWindow(ImageBuffer(packed[0] | packed[1]))
+            self.destroy()
+            return None
+
         selected_images = [window.image for window in selected_windows]
         if not check_window_images(selected_images[0], selected_images[1]):
             self.warning_label.set(
@@ -256,6 +288,12 @@ class ImageXorWidget(tk.Toplevel):
         ]
         if selected_window_titles[0] == selected_window_titles[1]:
             selected_windows.append(selected_windows[0])
+        packed = packed_images(selected_windows)
+        if packed is not None:
+            ImageWindow(ImageBuffer(packed[0] ^ packed[1]))
+            self.destroy()
+            return None
+
         selected_images = [window.image for window in selected_windows]
         if not check_window_images(selected_images[0], selected_images[1]):
             self.warning_label.set(
@@ -35,7 +35,8 @@ class ImageMathWidget(tk.Toplevel):
         super(ImageMathWidget, self).__init__()
         self.title(source_image.window_title)
         self.image_window = source_image
-        self.image = source_image.image
+        self.buffer = source_image.buffer
+        self.image = self.buffer.image
         self.geometry("300x150")
         self.pack_propagate(False)
         self.widget_frame: tk.Frame = tk.Frame(self)
@@ -68,7 +69,7 @@ class ImageMathWidget(tk.Toplevel):
         self.widget_frame.pack()
 
     def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
         self.input_number.set(0)
         self.selected_math_operation.set(MathOperators.ADDITION)
         self.normalize_flag.set(False)
@@ -127,4 +128,4 @@ class ImageMathWidget(tk.Toplevel):
 
         inverted_image = Image.new(self.image.mode, self.image.size)
         inverted_image.putdata(list_of_pixels)
-        self.image_window.update_image(inverted_image)
+        self.image_window.update_image(inverted_image, source=self)
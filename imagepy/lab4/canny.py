@@ -0,0 +1,157 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TAN_22_5 = np.tan(np.deg2rad(22.5))
+TAN_67_5 = np.tan(np.deg2rad(67.5))
+# gradients of least recently used parameters are dropped, each one is a float32 copy of the image
+MAX_CACHED_GRADIENTS = 4
+
+
+def suppressed_gradient(
+    image_array: np.ndarray, aperture_size: int = 3, l2_gradient: bool = False
+) -> np.ndarray:
+    """
+    Calculates Sobel gradient magnitude and keeps it only on ridges along gradient direction
+    (non-maximum suppression). It is the threshold independent part of Canny operator.
+
+    :param image_array: greyscale image array
+    :param aperture_size: Sobel aperture size, one of 3, 5, 7
+    :param l2_gradient: use exact magnitude instead of sum of absolute derivatives
+    :return: float32 array with gradient magnitude on ridges and zeros elsewhere
+    """
+    grad_x = cv2.Sobel(image_array, cv2.CV_32F, 1, 0, ksize=aperture_size)
+    grad_y = cv2.Sobel(image_array, cv2.CV_32F, 0, 1, ksize=aperture_size)
+    abs_x, abs_y = np.abs(grad_x), np.abs(grad_y)
+    if l2_gradient:
+        magnitude = np.sqrt(grad_x**2 + grad_y**2)
+    else:
+        magnitude = abs_x + abs_y
+
+    padded = np.pad(magnitude, 1)
+    height, width = magnitude.shape
+
+    def neighbour(dy: int, dx: int) -> np.ndarray:
+        return padded[1 + dy : 1 + dy + height, 1 + dx : 1 + dx + width]
+
+    horizontal = abs_y < abs_x * TAN_22_5
+    vertical = abs_y > abs_x * TAN_67_5
+    # image rows grow downwards, so equal derivative signs mean a "\" shaped gradient direction
+    falling_diagonal = ~horizontal & ~vertical & ((grad_x > 0) == (grad_y > 0))
+    rising_diagonal = ~horizontal & ~vertical & ~falling_diagonal
+
+    # along axes one side is compared with ">" and the other with ">=" so plateaus keep a single pixel,
+    # it follows conditions used by cv2.Canny
+    is_ridge = (
+        (horizontal & (magnitude > neighbour(0, -1)) & (magnitude >= neighbour(0, 1)))
+        | (vertical & (magnitude > neighbour(-1, 0)) & (magnitude >= neighbour(1, 0)))
+        | (
+            falling_diagonal
+            & (magnitude > neighbour(-1, -1))
+            & (magnitude > neighbour(1, 1))
+        )
+        | (
+            rising_diagonal
+            & (magnitude > neighbour(-1, 1))
+            & (magnitude > neighbour(1, -1))
+        )
+    )
+    return np.where(is_ridge, magnitude, np.float32(0))
+
+
+def hysteresis(
+    magnitude: np.ndarray, threshold1: float, threshold2: float
+) -> np.ndarray:
+    """
+    Keeps weak edges (above lower threshold) only if they are 8-connected with a strong edge
+    (above higher threshold). Thresholds may be given in any order, as in cv2.Canny.
+
+    :param magnitude: output of suppressed_gradient
+    :param threshold1: first hysteresis threshold
+    :param threshold2: second hysteresis threshold
+    :return: uint8 edge map with values 0 and 255
+    """
+    low, high = sorted((threshold1, threshold2))
+    return connect_strong_edges(magnitude, weak_edge_labels(magnitude, low), high)
+
+
+def weak_edge_labels(magnitude: np.ndarray, low: float) -> np.ndarray:
+    """
+    Labels 8-connected groups of pixels above lower threshold. Background has label 0.
+    """
+    weak = (magnitude > low).astype(np.uint8)
+    _n_labels, labels = cv2.connectedComponents(weak, connectivity=8)
+    return labels
+
+
+def connect_strong_edges(
+    magnitude: np.ndarray, labels: np.ndarray, high: float
+) -> np.ndarray:
+    """
+    Keeps labelled groups which contain at least one pixel above higher threshold.
+    """
+    is_strong_label = np.zeros(labels.max() + 1, dtype=bool)
+    is_strong_label[labels[magnitude > high]] = True
+    is_strong_label[0] = False
+    return np.where(is_strong_label[labels], np.uint8(255), np.uint8(0))
+
+
+class CannyCache:
+    """
+    Keeps threshold independent parts of Canny operator for a single image,
+    so moving threshold sliders reruns only the hysteresis step. It is used from background jobs,
+    a superseded job may still be running while a newer one reads the cache.
+    """
+
+    def __init__(self) -> None:
+        self.gradients: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        self._labels: tuple[Hashable, float, np.ndarray] | None = None
+        self._lock = threading.Lock()
+
+    def gradient(
+        self, key: Hashable, compute_gradient: Callable[[], np.ndarray]
+    ) -> np.ndarray:
+        """
+        :param key: gradient parameters, i.e. aperture size and border fill
+        :param compute_gradient: called only when gradient for given key is not cached yet
+        :return: non-maximum suppressed gradient magnitude
+        """
+        with self._lock:
+            if key in self.gradients:
+                self.gradients.move_to_end(key)
+                return self.gradients[key]
+        # computed outside of the lock, so a job for other parameters does not wait for it
+        logger.debug(f"Calculating Canny gradient for {key}")
+        gradient = compute_gradient()
+        with self._lock:
+            self.gradients[key] = gradient
+            while len(self.gradients) > MAX_CACHED_GRADIENTS:
+                self.gradients.popitem(last=False)
+        return gradient
+
+    def edges(
+        self,
+        key: Hashable,
+        compute_gradient: Callable[[], np.ndarray],
+        threshold1: float,
+        threshold2: float,
+    ) -> np.ndarray:
+        magnitude = self.gradient(key, compute_gradient)
+        low, high = sorted((threshold1, threshold2))
+        # weak edge labels depend only on lower threshold, so moving the higher one is even cheaper
+        with self._lock:
+            cached_labels = self._labels
+        if cached_labels is not None and cached_labels[:2] == (key, low):
+            labels = cached_labels[2]
+        else:
+            labels = weak_edge_labels(magnitude, low)
+            with self._lock:
+                self._labels = (key, low, labels)
+        # the local labels are used, another job may replace the cached ones meanwhile
+        return connect_strong_edges(magnitude, labels, high)
@@ -2,18 +2,25 @@ import logging
 import tkinter as tk
 from dataclasses import asdict, dataclass
 from enum import StrEnum, unique
+from typing import Any
 
 import cv2
 import numpy as np
-from PIL import Image
 
+from imagepy.lab4.canny import CannyCache, suppressed_gradient
 from imagepy.lab4.filters import edge_detection_filters, prewitt_filters
+from imagepy.utils.border_fill import border_fill
 from imagepy.utils.constants import ImageModeEnum
 from imagepy.utils.gui.widgets import BorderFillWidget, SliderWidget
 from imagepy.utils.image_manager import ImageWindow
+from imagepy.utils.jobs import run_job
+from imagepy.utils.result_cache import result_cache
 
 logger = logging.getLogger(__name__)
 
+CANNY_MAX_THRESHOLD = 2000
+CANNY_APERTURE_SIZES = (3, 5, 7)
+
 
 def edge_detection(
     image_window: ImageWindow | None,
@@ -36,7 +43,7 @@ class EdgeDetectionWidget(tk.Toplevel):
         super(EdgeDetectionWidget, self).__init__()
         self.title(source_window.window_title)
         self.image_window = source_window
-        self.image = source_window.image
+        self.buffer = source_window.buffer
         self.geometry("300x150")
         self.pack_propagate(False)
         self.widget_frame: tk.Frame = tk.Frame(self)
@@ -51,18 +58,27 @@ class EdgeDetectionWidget(tk.Toplevel):
         self.widget_frame.pack()
 
     def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
 
     def update_image(self) -> None:
         filter_kernel = edge_detection_filters.get(
             self.chosen_filter.get(), list(edge_detection_filters.values())[0]
         )
 
-        image_array = np.array(self.image)
-        filtered_image_array = cv2.filter2D(image_array, -1, np.array(filter_kernel))
-        filtered_image = Image.fromarray(filtered_image_array.astype("uint8"), "L")
-
-        self.image_window.update_image(filtered_image)
+        image_array = self.buffer.array
+        run_job(
+            "Edge detection",
+            lambda _token: result_cache.get_or_compute(
+                "edge_detection",
+                image_array,
+                {"kernel": filter_kernel},
+                lambda: cv2.filter2D(image_array, -1, np.array(filter_kernel)),
+            ),
+            lambda result: self.image_window.update_array(
+                result.astype(np.uint8, copy=False), source=self
+            ),
+            owner=self.image_window,
+        )
 
 
 @unique
@@ -76,7 +92,7 @@ class AdvancedEdgeDetectionWidget(tk.Toplevel):
         super(AdvancedEdgeDetectionWidget, self).__init__()
         self.title(source_window.window_title)
         self.image_window = source_window
-        self.image = source_window.image
+        self.buffer = source_window.buffer
         self.geometry("300x250")
         self.pack_propagate(False)
         self.widget_frame: tk.Frame = tk.Frame(self)
@@ -99,40 +115,67 @@ class AdvancedEdgeDetectionWidget(tk.Toplevel):
         self.widget_frame.pack()
 
     def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
 
     def update_image(self) -> None:
-        image_array = np.array(self.image)
+        image_array = self.buffer.array
+        filter_name = self.chosen_filter.get()
+        exact = self.exact_results.get()
+        border = self.border_widget.get()
+        run_job(
+            "Edge detection",
+            lambda _token: result_cache.get_or_compute(
+                "advanced_edge_detection",
+                image_array,
+                {"filter": filter_name, "exact": exact, "border": border},
+                lambda: self.calculate_gradient(
+                    image_array, filter_name, exact, border
+                ),
+            ),
+            lambda result: self.image_window.update_array(
+                result.astype(np.uint8, copy=False), source=self
+            ),
+            owner=self.image_window,
+        )
 
-        match self.chosen_filter.get():
+    @staticmethod
+    def calculate_gradient(
+        image_array: np.ndarray,
+        filter_name: str,
+        exact: bool,
+        border: tuple[int | None] | tuple[int | None, int],
+    ) -> np.ndarray:
+        match filter_name:
             case AdvancedFilters.SOBEL:
-                grad_x = self.border_widget.apply_border_fill(
-                    image_array, 1, cv2.Sobel, ddepth=-1, dx=1, dy=0
+                grad_x = border_fill(
+                    image_array, 1, border, cv2.Sobel, ddepth=-1, dx=1, dy=0
                 ).astype(float)
-                grad_y = self.border_widget.apply_border_fill(
-                    image_array, 1, cv2.Sobel, ddepth=-1, dx=0, dy=1
+                grad_y = border_fill(
+                    image_array, 1, border, cv2.Sobel, ddepth=-1, dx=0, dy=1
                 ).astype(float)
-                if self.exact_results.get():
+                if exact:
                     filtered_image_array = np.sqrt(grad_x**2 + grad_y**2)
                 else:
                     filtered_image_array = np.abs(grad_x) + np.abs(grad_y)
 
             case AdvancedFilters.PREWITT:
-                grad_x = self.border_widget.apply_border_fill(
+                grad_x = border_fill(
                     image_array,
                     1,
+                    border,
                     cv2.filter2D,
                     ddepth=-1,
                     kernel=np.array(prewitt_filters["x"]),
                 ).astype(float)
-                grad_y = self.border_widget.apply_border_fill(
+                grad_y = border_fill(
                     image_array,
                     1,
+                    border,
                     cv2.filter2D,
                     ddepth=-1,
                     kernel=np.array(prewitt_filters["y"]),
                 ).astype(float)
-                if self.exact_results.get():
+                if exact:
                     filtered_image_array = np.sqrt(grad_x**2 + grad_y**2)
                 else:
                     filtered_image_array = np.abs(grad_x) + np.abs(grad_y)
@@ -140,8 +183,7 @@ class AdvancedEdgeDetectionWidget(tk.Toplevel):
             case _:
                 raise ValueError()
 
-        filtered_image = Image.fromarray(filtered_image_array.astype("uint8"), "L")
-        self.image_window.update_image(filtered_image)
+        return filtered_image_array
 
 
 class CannyEdgeDetectionWidget(tk.Toplevel):
@@ -149,14 +191,39 @@ class CannyEdgeDetectionWidget(tk.Toplevel):
         super(CannyEdgeDetectionWidget, self).__init__()
         self.title(source_window.window_title)
         self.image_window = source_window
-        self.image = source_window.image
-        self.geometry("300x250")
+        self.buffer = source_window.buffer
+        self.geometry("300x450")
         self.pack_propagate(False)
         self.widget_frame: tk.Frame = tk.Frame(self)
-
-        tk.Label(text="Minimal threshold:")
-        self.slider = SliderWidget(self, 0, 0, None, 255)
-        self.slider.pack()
+        self.canny_cache = CannyCache()
+
+        tk.Label(self.widget_frame, text="Lower threshold:").pack()
+        lower_slider = SliderWidget(
+            self.widget_frame,
+            initial_value=50,
+            max_intensity_level=CANNY_MAX_THRESHOLD,
+            slider_var_flag=True,
+        )
+        lower_slider.pack()
+        tk.Label(self.widget_frame, text="Higher threshold:").pack()
+        higher_slider = SliderWidget(
+            self.widget_frame,
+            initial_value=150,
+            max_intensity_level=CANNY_MAX_THRESHOLD,
+            slider_var_flag=True,
+        )
+        higher_slider.pack()
+        self.lower_threshold = lower_slider.slider_variable
+        self.higher_threshold = higher_slider.slider_variable
+
+        tk.Label(self.widget_frame, text="Aperture size:").pack()
+        aperture_options = [str(size) for size in CANNY_APERTURE_SIZES]
+        self.aperture_size = tk.StringVar(value=aperture_options[0])
+        tk.OptionMenu(self.widget_frame, self.aperture_size, *aperture_options).pack()
+        self.exact_results = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            self.widget_frame, text="Use exact results?", variable=self.exact_results
+        ).pack()
 
         self.border_widget = BorderFillWidget(self.widget_frame)
         self.border_widget.pack()
@@ -166,20 +233,42 @@ class CannyEdgeDetectionWidget(tk.Toplevel):
 
         self.widget_frame.pack()
 
-    def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        # thresholds only rerun hysteresis on cached gradient, so image can be updated live
+        self.lower_threshold.trace("w", self.update_image)
+        self.higher_threshold.trace("w", self.update_image)
 
-    def update_image(self) -> None:
-        image_array = np.array(self.image)
-        threshold_value = self.slider.get()
-        filtered_image_array = self.border_widget.apply_border_fill(
-            image_array,
-            1,
-            cv2.Canny,
-            threshold1=threshold_value,
-            threshold2=threshold_value * 3,
-            apertureSize=3,
+    def reset_image(self) -> None:
+        self.image_window.reset_buffer(self.buffer, self)
+
+    def update_image(self, *_: Any) -> None:
+        try:
+            threshold1 = self.lower_threshold.get()
+            threshold2 = self.higher_threshold.get()
+        except tk.TclError:  # slider entry is being edited and is not a number yet
+            return None
+
+        aperture_size = int(self.aperture_size.get())
+        exact_results = self.exact_results.get()
+        border = self.border_widget.get()
+        gradient_key = (aperture_size, exact_results, border)
+        pad_size = aperture_size // 2 + 1
+        image_array = self.buffer.array
+
+        def compute_gradient() -> np.ndarray:
+            return border_fill(
+                image_array,
+                pad_size,
+                border,
+                suppressed_gradient,
+                aperture_size=aperture_size,
+                l2_gradient=exact_results,
+            )
+
+        run_job(
+            "Canny",
+            lambda _token: self.canny_cache.edges(
+                gradient_key, compute_gradient, threshold1, threshold2
+            ),
+            lambda result: self.image_window.update_array(result, source=self),
+            owner=self.image_window,
         )
-
-        filtered_image = Image.fromarray(filtered_image_array.astype("uint8"), "L")
-        self.image_window.update_image(filtered_image)
@@ -4,12 +4,15 @@ from typing import Literal
 
 import cv2
 import numpy as np
-from PIL import Image
 
 from imagepy.lab4.filters import FILTER_3_3, blur_filters, sharpen_filters
+from imagepy.pipeline.pipeline import PipelineStep
+from imagepy.utils.border_fill import border_fill, border_fill_name
 from imagepy.utils.constants import ImageModeEnum
 from imagepy.utils.gui.widgets import BorderFillWidget
 from imagepy.utils.image_manager import ImageWindow
+from imagepy.utils.jobs import run_job
+from imagepy.utils.result_cache import result_cache
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +31,7 @@ class BlurWidget(tk.Toplevel):
         super(BlurWidget, self).__init__()
         self.title(source_window.window_title)
         self.image_window = source_window
-        self.image = source_window.image
+        self.buffer = source_window.buffer
         self.geometry("400x350")
         self.pack_propagate(False)
         self.widget_frame: tk.Frame = tk.Frame(self)
@@ -50,19 +53,45 @@ class BlurWidget(tk.Toplevel):
         self.widget_frame.pack()
 
     def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
 
     def update_image(self) -> None:
-        image_array = np.array(self.image)
+        image_array = self.buffer.array
         kernel = self.filter_widget.get_filter(self.chosen_filter.get())
+        border = self.border_widget.get()
+
+        border_name, border_constant = border_fill_name(border)
+        step = PipelineStep(
+            "blur",
+            {
+                "kernel": self.filter_widget.get_index(self.chosen_filter.get()),
+                "weight": self.filter_widget.k_entry.get(),
+                "border": border_name,
+                "border_constant": border_constant,
+            },
+        )
 
         pad_size = (kernel.shape[0] - 1) // 2
-        modified_image_array = self.border_widget.apply_border_fill(
-            image_array, pad_size, cv2.filter2D, ddepth=-1, kernel=kernel
+        run_job(
+            "Blur",
+            lambda _token: result_cache.get_or_compute(
+                "filter2D",
+                image_array,
+                {"kernel": kernel, "border": border},
+                lambda: border_fill(
+                    image_array,
+                    pad_size,
+                    border,
+                    cv2.filter2D,
+                    ddepth=-1,
+                    kernel=kernel,
+                ),
+            ),
+            lambda result: self.image_window.update_array(
+                result.astype(np.uint8, copy=False), step, self
+            ),
+            owner=self.image_window,
         )
-        modified_image = Image.fromarray(modified_image_array.astype("uint8"), "L")
-
-        self.image_window.update_image(modified_image)
 
 
 class SharpenWidget(tk.Toplevel):
@@ -70,7 +99,7 @@ class SharpenWidget(tk.Toplevel):
         super(SharpenWidget, self).__init__()
         self.title(source_window.window_title)
         self.image_window = source_window
-        self.image = source_window.image
+        self.buffer = source_window.buffer
         self.geometry("400x350")
         self.pack_propagate(False)
         self.widget_frame: tk.Frame = tk.Frame(self)
@@ -92,19 +121,44 @@ class SharpenWidget(tk.Toplevel):
         self.widget_frame.pack()
 
     def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
 
     def update_image(self) -> None:
-        image_array = np.array(self.image)
+        image_array = self.buffer.array
         kernel = self.filter_widget.get_filter(self.chosen_filter.get())
+        border = self.border_widget.get()
+
+        border_name, border_constant = border_fill_name(border)
+        step = PipelineStep(
+            "sharpen",
+            {
+                "kernel": self.filter_widget.get_index(self.chosen_filter.get()),
+                "border": border_name,
+                "border_constant": border_constant,
+            },
+        )
 
         pad_size = (kernel.shape[0] - 1) // 2
-        modified_image_array = self.border_widget.apply_border_fill(
-            image_array, pad_size, cv2.filter2D, ddepth=-1, kernel=kernel
+        run_job(
+            "Sharpen",
+            lambda _token: result_cache.get_or_compute(
+                "filter2D",
+                image_array,
+                {"kernel": kernel, "border": border},
+                lambda: border_fill(
+                    image_array,
+                    pad_size,
+                    border,
+                    cv2.filter2D,
+                    ddepth=-1,
+                    kernel=kernel,
+                ),
+            ),
+            lambda result: self.image_window.update_array(
+                result.astype(np.uint8, copy=False), step, self
+            ),
+            owner=self.image_window,
         )
-        modified_image = Image.fromarray(modified_image_array.astype("uint8"), "L")
-
-        self.image_window.update_image(modified_image)
 
 
 class FilterWidget(tk.Frame):
@@ -131,6 +185,12 @@ class FilterWidget(tk.Frame):
     def get_options(self) -> list[str]:
         return list(self.options.keys())
 
+    def get_index(self, filter_name: str) -> int:
+        """
+        Position of the kernel in the filter list, which pipelines use to name it.
+        """
+        return list(self.options).index(filter_name)
+
     def get_filter(self, filter_name: str) -> np.ndarray:
         kernel = self.options[filter_name]
         if self.is_blur:
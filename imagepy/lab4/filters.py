@@ -27,13 +27,6 @@ edge_detection_filters = {
     "NE": ((0, 1, 2), (-1, 0, 1), (-2, -1, 0)),
 }
 
-median_blur_filters = {
-    "3x3": 3,
-    "5x5": 5,
-    "7x7": 7,
-    "9x9": 9,
-}
-
 prewitt_filters = {
     "x": ((-1, 0, 1), (-1, 0, 1), (-1, 0, 1)),
     "y": ((-1, -1, -1), (0, 0, 0), (1, 1, 1)),
@@ -1,20 +1,24 @@
 import logging
 import tkinter as tk
+from typing import Any, Callable
 
-import cv2
-import numpy
-from PIL import Image
-
-from imagepy.lab4.filters import median_blur_filters
-from imagepy.utils.constants import ImageModeEnum
-from imagepy.utils.gui.widgets import BorderFillWidget
+from imagepy.lab4.rank_filters import range_filter, rank_filter
+from imagepy.pipeline.pipeline import PipelineStep
+from imagepy.utils.border_fill import border_fill, border_fill_name
+from imagepy.utils.constants import RANK_FILTER_MAX_SIZE, ImageModeEnum, RankFilterEnum
+from imagepy.utils.gui.widgets import BorderFillWidget, SliderWidget
 from imagepy.utils.image_manager import ImageWindow
+from imagepy.utils.jobs import run_job
+from imagepy.utils.result_cache import result_cache
 
 logger = logging.getLogger(__name__)
 
 
 def median_blur(image_window: ImageWindow | None) -> None:
-    if not image_window or image_window.mode != ImageModeEnum.GREYSCALE:
+    if not image_window or image_window.mode not in (
+        ImageModeEnum.GREYSCALE,
+        ImageModeEnum.GREYSCALE_16,
+    ):
         return None
     MedianBlurWidget(image_window)
 
@@ -24,16 +28,37 @@ class MedianBlurWidget(tk.Toplevel):
         super(MedianBlurWidget, self).__init__()
         self.title(source_window.window_title)
         self.image_window = source_window
-        self.image = source_window.image
-        self.geometry("300x250")
+        self.buffer = source_window.buffer
+        self.geometry("300x400")
         self.pack_propagate(False)
         self.widget_frame: tk.Frame = tk.Frame(self)
 
-        self.chosen_filter = tk.StringVar(value=list(median_blur_filters.keys())[0])
-        options = list(median_blur_filters.keys())
-        tk.Label(self.widget_frame, text="Choose kernel size:").pack()
+        options = [p.value for p in RankFilterEnum]
+        self.chosen_filter = tk.StringVar(value=options[0])
+        tk.Label(self.widget_frame, text="Choose rank filter:").pack()
         tk.OptionMenu(self.widget_frame, self.chosen_filter, *options).pack()
 
+        tk.Label(self.widget_frame, text="Kernel size (odd):").pack()
+        self.size_slider = SliderWidget(
+            self.widget_frame,
+            initial_value=3,
+            min_intensity_level=3,
+            max_intensity_level=RANK_FILTER_MAX_SIZE,
+            tick_interval=RANK_FILTER_MAX_SIZE - 3,
+            slider_var_flag=True,
+        )
+        self.size_slider.pack()
+
+        tk.Label(self.widget_frame, text="Percentile:").pack()
+        self.percentile_slider = SliderWidget(
+            self.widget_frame,
+            initial_value=50,
+            max_intensity_level=100,
+            tick_interval=50,
+            slider_var_flag=True,
+        )
+        self.percentile_slider.pack()
+
         self.border_widget = BorderFillWidget(self.widget_frame)
         self.border_widget.pack()
         tk.Button(self.widget_frame, text="Reset", command=self.reset_image).pack()
@@ -42,18 +67,49 @@ class MedianBlurWidget(tk.Toplevel):
         self.widget_frame.pack()
 
     def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
 
     def update_image(self) -> None:
-        filter_size = median_blur_filters.get(
-            self.chosen_filter.get(), list(median_blur_filters.values())[0]
-        )
-        image_array = numpy.array(self.image)
+        # even kernels have no center pixel, so they are rounded up to the next odd size
+        filter_size = int(self.size_slider.get()) | 1
+        image_array = self.buffer.array
+
+        filter_operation: Callable = rank_filter
+        filter_args: dict[str, Any] = {"size": filter_size}
+        match self.chosen_filter.get():
+            case RankFilterEnum.MEDIAN:
+                filter_args["percentile"] = 50
+            case RankFilterEnum.PERCENTILE:
+                filter_args["percentile"] = self.percentile_slider.get()
+            case RankFilterEnum.MIN:
+                filter_args["percentile"] = 0
+            case RankFilterEnum.MAX:
+                filter_args["percentile"] = 100
+            case RankFilterEnum.RANGE:
+                filter_operation = range_filter
+            case _:
+                raise ValueError()
 
         pad_size = (filter_size - 1) // 2
-        blurred_image_array = self.border_widget.apply_border_fill(
-            image_array, pad_size, cv2.medianBlur, ksize=filter_size
+        border = self.border_widget.get()
+        params = {"filter": self.chosen_filter.get(), "border": border, **filter_args}
+        border_name, border_constant = border_fill_name(border)
+        step = PipelineStep(
+            "range_filter" if filter_operation is range_filter else "rank_filter",
+            {**filter_args, "border": border_name, "border_constant": border_constant},
+        )
+        run_job(
+            "Rank filter",
+            lambda _token: result_cache.get_or_compute(
+                "rank_filter",
+                image_array,
+                params,
+                lambda: border_fill(
+                    image_array, pad_size, border, filter_operation, **filter_args
+                ),
+            ),
+            lambda result: self.image_window.update_array(
+                result.astype(image_array.dtype, copy=False), step, self
+            ),
+            owner=self.image_window,
         )
-        blurred_image = Image.fromarray(blurred_image_array.astype("uint8"), "L")
-
-        self.image_window.update_image(blurred_image)
@@ -0,0 +1,124 @@
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import cv2
+import numpy as np
+
+from imagepy.lab4.rank_filters import (
+    PARTITION_MAX_SIZE_8BIT,
+    PARTITION_MAX_SIZE_16BIT,
+    median_filter,
+)
+from imagepy.utils.constants import RANK_FILTER_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+# cv2.medianBlur accepts kernels bigger than 5 only for 8-bit images
+CV2_MAX_16BIT_SIZE = 5
+
+
+@dataclass
+class BenchmarkResult:
+    size: int
+    dtype: str
+    image: str
+    rank_filter_seconds: float
+    cv2_seconds: float | None
+
+
+def measure(operation: Callable[[], object], repeats: int) -> float:
+    """
+    Returns the best wall time of given number of runs.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def test_images(
+    shape: tuple[int, int], rng: np.random.Generator
+) -> list[tuple[str, np.ndarray]]:
+    """
+    Test images with values in range [0, 1].
+    """
+    ys, xs = np.indices(shape)
+    gradient = (xs + ys) / (shape[0] + shape[1])
+    return [
+        ("noise", rng.random(shape)),
+        ("gradient", np.clip(gradient + rng.normal(0, 0.01, shape), 0, 1)),
+    ]
+
+
+def benchmark_median(
+    shape: tuple[int, int] = (512, 512),
+    sizes: tuple[int, ...] = (
+        3,
+        5,
+        PARTITION_MAX_SIZE_8BIT,
+        PARTITION_MAX_SIZE_8BIT + 2,
+        15,
+        PARTITION_MAX_SIZE_16BIT,
+        PARTITION_MAX_SIZE_16BIT + 2,
+        63,
+        127,
+        RANK_FILTER_MAX_SIZE,
+    ),
+    dtypes: tuple[type, ...] = (np.uint8, np.uint16),
+    repeats: int = 3,
+) -> list[BenchmarkResult]:
+    """
+    Compares rank filter median with cv2.medianBlur for each kernel size, on noise and on a smooth
+    gradient with a little noise. Noisy 16-bit windows spread over many histogram bins, which is the
+    slowest case of sliding histograms.
+
+    :param shape: shape of test images
+    :param sizes: odd kernel sizes to test
+    :param dtypes: image dtypes to test
+    :param repeats: number of runs, the best one is reported
+    :return: list of benchmark results
+    """
+    rng = np.random.default_rng(0)
+    results = []
+    for dtype, (image_name, image_array) in itertools.product(
+        dtypes, test_images(shape, rng)
+    ):
+        image_array = (image_array * np.iinfo(dtype).max).astype(dtype)
+        for size in sizes:
+            rank_seconds = measure(lambda: median_filter(image_array, size), repeats)
+            cv2_seconds = None
+            if dtype == np.uint8 or size <= CV2_MAX_16BIT_SIZE:
+                cv2_seconds = measure(
+                    lambda: cv2.medianBlur(image_array, size), repeats
+                )
+            results.append(
+                BenchmarkResult(
+                    size, np.dtype(dtype).name, image_name, rank_seconds, cv2_seconds
+                )
+            )
+            logger.info(results[-1])
+    return results
+
+
+def format_results(results: list[BenchmarkResult]) -> str:
+    lines = [
+        f"{'dtype':>6} {'image':>8} {'size':>5} {'rank filter [s]':>16} {'cv2 [s]':>10}"
+    ]
+    for result in results:
+        cv2_seconds = (
+            f"{result.cv2_seconds:10.4f}" if result.cv2_seconds is not None else "n/a"
+        )
+        lines.append(
+            f"{result.dtype:>6} {result.image:>8} {result.size:>5} "
+            f"{result.rank_filter_seconds:16.4f} {cv2_seconds:>10}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(format_results(benchmark_median()))
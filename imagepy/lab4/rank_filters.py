@@ -0,0 +1,297 @@
+import logging
+
+import cv2
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from imagepy.utils.constants import RANK_FILTER_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+# number of bins in a single histogram level, 8-bit images use one level, 16-bit images use two
+HISTOGRAM_BINS = 256
+# maximum number of lazily maintained fine histograms for 16-bit images, bins used in the current row are kept
+MAX_FINE_HISTOGRAMS = 32
+# largest kernels for which partitioning every window is faster than sliding histograms, 16-bit windows
+# spread over many coarse bins, so their histograms pay off only for big kernels
+PARTITION_MAX_SIZE_8BIT = 7
+PARTITION_MAX_SIZE_16BIT = 31
+# maximum number of window values copied at once by the partition path
+PARTITION_CHUNK_VALUES = 2**24
+
+
+def percentile_to_rank(percentile: float, kernel_area: int) -> int:
+    """
+    Converts percentile to zero based rank in sorted kernel values.
+
+    :param percentile: percentile in range [0, 100]
+    :param kernel_area: number of pixels in kernel
+    :return: rank of the value to pick from sorted kernel values
+    """
+    if not 0 <= percentile <= 100:
+        raise ValueError(f"Percentile has to be in range [0, 100]! {percentile}")
+    return round(percentile / 100 * (kernel_area - 1))
+
+
+def rank_filter(
+    image_array: np.ndarray,
+    size: int,
+    percentile: float = 50,
+    border_type: int = cv2.BORDER_REPLICATE,
+) -> np.ndarray:
+    """
+    Sliding histogram rank filter. Cost per pixel does not depend on kernel size,
+    small kernels partition values of every window instead, which is faster for them.
+
+    :param image_array: 8-bit or 16-bit single channel image array
+    :param size: odd kernel size in range [3, RANK_FILTER_MAX_SIZE]
+    :param percentile: percentile of kernel values to pick, 0 is min filter, 50 median and 100 max filter
+    :param border_type: OpenCV border type used to extend image before filtering
+    :return: filtered image array with the same shape and dtype as input
+    """
+    rank = percentile_to_rank(percentile, size * size)
+    return sliding_ranks(image_array, size, (rank,), border_type)[0]
+
+
+def median_filter(
+    image_array: np.ndarray, size: int, border_type: int = cv2.BORDER_REPLICATE
+) -> np.ndarray:
+    return rank_filter(image_array, size, 50, border_type)
+
+
+def range_filter(
+    image_array: np.ndarray, size: int, border_type: int = cv2.BORDER_REPLICATE
+) -> np.ndarray:
+    """
+    Difference between max and min value in kernel. Both are picked in a single pass.
+    """
+    min_array, max_array = sliding_ranks(
+        image_array, size, (0, size * size - 1), border_type
+    )
+    return max_array - min_array
+
+
+def sliding_ranks(
+    image_array: np.ndarray,
+    size: int,
+    ranks: tuple[int, ...],
+    border_type: int = cv2.BORDER_REPLICATE,
+) -> list[np.ndarray]:
+    """
+    Picks values of given ranks from each square kernel. Every rank is read from the same histograms,
+    so asking for several ranks costs almost the same as asking for one.
+
+    :param image_array: 8-bit or 16-bit single channel image array
+    :param size: odd kernel size in range [3, RANK_FILTER_MAX_SIZE]
+    :param ranks: zero based ranks in sorted kernel values
+    :param border_type: OpenCV border type used to extend image before filtering
+    :return: one filtered image array per rank
+    """
+    if size % 2 == 0 or not 3 <= size <= RANK_FILTER_MAX_SIZE:
+        raise ValueError(
+            f"Kernel size has to be odd and in range [3, {RANK_FILTER_MAX_SIZE}]! {size}"
+        )
+    if image_array.ndim != 2:
+        raise ValueError("Rank filters work only with single channel images!")
+    if any(not 0 <= rank < size * size for rank in ranks):
+        raise ValueError(f"Ranks have to be in range [0, {size * size - 1}]! {ranks}")
+
+    pad_size = (size - 1) // 2
+    padded_array = cv2.copyMakeBorder(
+        image_array, pad_size, pad_size, pad_size, pad_size, border_type
+    )
+    match image_array.dtype:
+        case np.uint8 if size <= PARTITION_MAX_SIZE_8BIT:
+            return _partition_ranks(padded_array, size, ranks)
+        case np.uint8:
+            return _sliding_ranks_8bit(padded_array, size, ranks)
+        case np.uint16 if size <= PARTITION_MAX_SIZE_16BIT:
+            return _partition_ranks(padded_array, size, ranks)
+        case np.uint16:
+            return _sliding_ranks_16bit(padded_array, size, ranks)
+        case _:
+            raise ValueError(f"Unsupported image dtype! {image_array.dtype}")
+
+
+def _partition_ranks(
+    padded_array: np.ndarray, size: int, ranks: tuple[int, ...]
+) -> list[np.ndarray]:
+    """
+    Picks ranks by partitioning values of every window, rows are processed in chunks to bound memory.
+    """
+    height, width = padded_array.shape
+    out_height, out_width = height - size + 1, width - size + 1
+    results = [
+        np.empty((out_height, out_width), dtype=padded_array.dtype) for _ in ranks
+    ]
+    chunk_rows = max(1, PARTITION_CHUNK_VALUES // (out_width * size * size))
+    for y in range(0, out_height, chunk_rows):
+        rows = min(chunk_rows, out_height - y)
+        windows = sliding_window_view(
+            padded_array[y : y + rows + size - 1], (size, size)
+        ).reshape(rows, out_width, size * size)
+        partitioned = np.partition(windows, ranks, axis=-1)
+        for result, rank in zip(results, ranks):
+            result[y : y + rows] = partitioned[..., rank]
+    return results
+
+
+def _kernel_cdf(column_histograms: np.ndarray, size: int) -> np.ndarray:
+    """
+    Cumulative histograms of each run of `size` neighbouring columns.
+    Column counts never exceed kernel size, so column histograms fit in uint8
+    and both sums are read from a single integral image.
+
+    :param column_histograms: uint8 array of shape (columns, bins)
+    :param size: kernel size
+    :return: int32 array of shape (columns - size + 1, bins)
+    """
+    integral = cv2.integral(column_histograms, sdepth=cv2.CV_32S)
+    return integral[size:, 1:] - integral[:-size, 1:]
+
+
+def _pick_rank(cdf: np.ndarray, rank: np.ndarray | int) -> np.ndarray:
+    """
+    Returns index of the first bin for which cumulative count exceeds rank.
+    """
+    return np.count_nonzero(cdf <= np.reshape(rank, (-1, 1)), axis=1)
+
+
+def _sliding_ranks_8bit(
+    padded_array: np.ndarray, size: int, ranks: tuple[int, ...]
+) -> list[np.ndarray]:
+    height, width = padded_array.shape
+    columns = np.arange(width)
+    # bins above the brightest pixel are always empty, so there is no need to scan them
+    n_bins = int(padded_array.max()) + 1
+    column_histograms = np.zeros((width, n_bins), dtype=np.uint8)
+    for row in padded_array[:size]:
+        column_histograms[columns, row] += 1
+
+    results = [
+        np.empty((height - size + 1, width - size + 1), dtype=padded_array.dtype)
+        for _ in ranks
+    ]
+    for y in range(height - size + 1):
+        if y:
+            column_histograms[columns, padded_array[y - 1]] -= 1
+            column_histograms[columns, padded_array[y + size - 1]] += 1
+
+        cdf = _kernel_cdf(column_histograms, size)
+        for result, rank in zip(results, ranks):
+            result[y] = _pick_rank(cdf, rank)
+
+    return results
+
+
+def _sliding_ranks_16bit(
+    padded_array: np.ndarray, size: int, ranks: tuple[int, ...]
+) -> list[np.ndarray]:
+    """
+    Two level (coarse and fine) sliding histogram. Coarse histograms of the high byte are kept for every
+    column, fine histograms of the low byte are created lazily only for coarse bins which hold picked ranks.
+    """
+    height, width = padded_array.shape
+    columns = np.arange(width)
+    coarse_array = (padded_array >> 8).astype(np.intp)
+    fine_array = (padded_array & 0xFF).astype(np.intp)
+
+    column_histograms = np.zeros((width, HISTOGRAM_BINS), dtype=np.uint8)
+    for row in coarse_array[:size]:
+        column_histograms[columns, row] += 1
+    # coarse bin -> (column fine histograms, last row it was used in)
+    fine_histograms: dict[int, tuple[np.ndarray, int]] = {}
+
+    results = [
+        np.empty((height - size + 1, width - size + 1), dtype=padded_array.dtype)
+        for _ in ranks
+    ]
+    for y in range(height - size + 1):
+        if y:
+            _shift_histograms(
+                column_histograms, fine_histograms, coarse_array, fine_array, y, size
+            )
+
+        coarse_cdf = _kernel_cdf(column_histograms, size)
+        used_bins = 0
+        for result, rank in zip(results, ranks):
+            coarse_bins = _pick_rank(coarse_cdf, rank)
+            below = np.where(
+                coarse_bins > 0,
+                coarse_cdf[np.arange(len(coarse_bins)), coarse_bins - 1],
+                0,
+            )
+            residual_ranks = rank - below
+
+            row_bins = np.unique(coarse_bins).tolist()
+            used_bins += len(row_bins)
+            for coarse_bin in row_bins:
+                if coarse_bin in fine_histograms:
+                    fine_histogram = fine_histograms[coarse_bin][0]
+                else:
+                    fine_histogram = _build_fine_histogram(
+                        coarse_array[y : y + size], fine_array[y : y + size], coarse_bin
+                    )
+                fine_histograms[coarse_bin] = (fine_histogram, y)
+
+                xs = np.flatnonzero(coarse_bins == coarse_bin)
+                if len(xs) * size < width:
+                    # only a few pixels use this bin, so summing their windows directly is cheaper
+                    fine_cdf = np.cumsum(
+                        fine_histogram[xs[:, None] + np.arange(size)].sum(
+                            axis=1, dtype=np.int32
+                        ),
+                        axis=1,
+                    )
+                else:
+                    fine_cdf = _kernel_cdf(fine_histogram, size)[xs]
+                result[y, xs] = coarse_bin * HISTOGRAM_BINS + _pick_rank(
+                    fine_cdf, residual_ranks[xs]
+                )
+
+        # bins picked in this row are likely picked again in the next one, so they are never evicted,
+        # otherwise windows spread over many bins would rebuild their histograms in every row
+        max_histograms = max(MAX_FINE_HISTOGRAMS, used_bins)
+        if len(fine_histograms) > max_histograms:
+            # evict histograms which were used least recently
+            by_last_use = sorted(fine_histograms, key=lambda b: fine_histograms[b][1])
+            for coarse_bin in by_last_use[: len(fine_histograms) - max_histograms]:
+                del fine_histograms[coarse_bin]
+
+    return results
+
+
+def _shift_histograms(
+    column_histograms: np.ndarray,
+    fine_histograms: dict[int, tuple[np.ndarray, int]],
+    coarse_array: np.ndarray,
+    fine_array: np.ndarray,
+    y: int,
+    size: int,
+) -> None:
+    """
+    Moves coarse and all active fine histograms one row down.
+    """
+    columns = np.arange(coarse_array.shape[1])
+    leaving_row, entering_row = y - 1, y + size - 1
+    column_histograms[columns, coarse_array[leaving_row]] -= 1
+    column_histograms[columns, coarse_array[entering_row]] += 1
+    for coarse_bin, (fine_histogram, _) in fine_histograms.items():
+        mask = coarse_array[leaving_row] == coarse_bin
+        fine_histogram[columns[mask], fine_array[leaving_row][mask]] -= 1
+        mask = coarse_array[entering_row] == coarse_bin
+        fine_histogram[columns[mask], fine_array[entering_row][mask]] += 1
+
+
+def _build_fine_histogram(
+    coarse_window: np.ndarray, fine_window: np.ndarray, coarse_bin: int
+) -> np.ndarray:
+    width = coarse_window.shape[1]
+    mask = coarse_window == coarse_bin
+    _rows, cols = np.nonzero(mask)
+    flat_index = cols * HISTOGRAM_BINS + fine_window[mask]
+    return (
+        np.bincount(flat_index, minlength=width * HISTOGRAM_BINS)
+        .reshape(width, HISTOGRAM_BINS)
+        .astype(np.uint8)
+    )
@@ -1,28 +1,66 @@
+import logging
 import tkinter as tk
-from dataclasses import asdict
 
-import cv2
 import numpy as np
-from PIL import Image
 
-from imagepy.utils.constants import BinaryOperationEnum, ImageModeEnum
-from imagepy.utils.gui.widgets import BorderFillWidget
+from imagepy.lab6.morphology import (
+    LINE_STEPS,
+    StructuringElement,
+    morphology,
+    packed_morphology,
+)
+from imagepy.pipeline.pipeline import PipelineStep
+from imagepy.utils.constants import (
+    MAX_INTENSITY_LEVEL,
+    BinaryOperationEnum,
+    ImageModeEnum,
+    StructuringElementEnum,
+)
+from imagepy.utils.gui.widgets import SliderWidget
+from imagepy.utils.image_buffer import ImageBuffer
 from imagepy.utils.image_manager import ImageWindow
+from imagepy.utils.jobs import run_job
+from imagepy.utils.packed_binary import PackedBinaryImage
+from imagepy.utils.result_cache import result_cache
+
+logger = logging.getLogger(__name__)
+
+MAX_ITERATIONS = 20
 
 
 def binary_calculation(image_window: ImageWindow | None) -> None:
-    if not image_window or image_window.mode != ImageModeEnum.GREYSCALE:
+    if not image_window or image_window.mode not in (
+        ImageModeEnum.GREYSCALE,
+        ImageModeEnum.BINARY,
+    ):
         return None
     BinaryOperationsWidget(image_window)
 
 
+def parse_custom_kernel(kernel_text: str) -> tuple[tuple[int, ...], ...]:
+    """
+    Parses kernel written as rows separated by semicolons, i.e. "0 1 0; 1 1 1; 0 1 0".
+
+    :param kernel_text: kernel typed by user
+    :return: kernel rows with 0 and 1 values
+    """
+    kernel = tuple(
+        tuple(int(bool(int(value))) for value in row.split())
+        for row in kernel_text.split(";")
+        if row.strip()
+    )
+    if not kernel or len({len(row) for row in kernel}) != 1:
+        raise ValueError(f"Kernel rows have to be of equal length! {kernel_text}")
+    return kernel
+
+
 class BinaryOperationsWidget(tk.Toplevel):
     def __init__(self, source_window: ImageWindow):
         super(BinaryOperationsWidget, self).__init__()
         self.title(source_window.window_title)
         self.image_window = source_window
-        self.image = source_window.image
-        self.geometry("300x250")
+        self.buffer = source_window.buffer
+        self.geometry("300x500")
         self.pack_propagate(False)
         self.widget_frame: tk.Frame = tk.Frame(self)
 
@@ -30,8 +68,52 @@ class BinaryOperationsWidget(tk.Toplevel):
         self.chosen_filter = tk.StringVar(value=options[0])
         tk.OptionMenu(self.widget_frame, self.chosen_filter, *options).pack()
 
-        self.border_widget = BorderFillWidget(self.widget_frame)
-        self.border_widget.pack()
+        tk.Label(self.widget_frame, text="Structuring element:").pack()
+        element_options = [p.value for p in StructuringElementEnum]
+        self.chosen_element = tk.StringVar(value=StructuringElementEnum.CROSS)
+        tk.OptionMenu(self.widget_frame, self.chosen_element, *element_options).pack()
+
+        tk.Label(self.widget_frame, text="Size (width, length or diameter):").pack()
+        self.size_slider = SliderWidget(
+            self.widget_frame,
+            initial_value=3,
+            min_intensity_level=1,
+            max_intensity_level=MAX_INTENSITY_LEVEL,
+            tick_interval=MAX_INTENSITY_LEVEL - 1,
+            slider_var_flag=True,
+        )
+        self.size_slider.pack()
+        tk.Label(self.widget_frame, text="Height (rectangle and cross):").pack()
+        self.height_slider = SliderWidget(
+            self.widget_frame,
+            initial_value=3,
+            min_intensity_level=1,
+            max_intensity_level=MAX_INTENSITY_LEVEL,
+            tick_interval=MAX_INTENSITY_LEVEL - 1,
+            slider_var_flag=True,
+        )
+        self.height_slider.pack()
+
+        tk.Label(self.widget_frame, text="Line angle:").pack()
+        angle_options = [str(angle) for angle in LINE_STEPS]
+        self.chosen_angle = tk.StringVar(value=angle_options[0])
+        tk.OptionMenu(self.widget_frame, self.chosen_angle, *angle_options).pack()
+
+        tk.Label(self.widget_frame, text="Custom kernel (rows separated by ;):").pack()
+        self.custom_kernel_entry = tk.Entry(self.widget_frame, width=20)
+        self.custom_kernel_entry.insert(tk.END, "0 1 0; 1 1 1; 0 1 0")
+        self.custom_kernel_entry.pack()
+
+        tk.Label(self.widget_frame, text="Iterations:").pack()
+        self.iterations_slider = SliderWidget(
+            self.widget_frame,
+            initial_value=1,
+            min_intensity_level=1,
+            max_intensity_level=MAX_ITERATIONS,
+            tick_interval=MAX_ITERATIONS - 1,
+            slider_var_flag=True,
+        )
+        self.iterations_slider.pack()
 
         tk.Button(self.widget_frame, text="Reset", command=self.reset_image).pack()
         tk.Button(self.widget_frame, text="Apply", command=self.update_image).pack()
@@ -39,27 +121,78 @@ class BinaryOperationsWidget(tk.Toplevel):
         self.widget_frame.pack()
 
     def reset_image(self) -> None:
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
+
+    def get_element(self) -> StructuringElement:
+        shape = StructuringElementEnum(self.chosen_element.get())
+        custom_kernel = None
+        if shape == StructuringElementEnum.CUSTOM:
+            custom_kernel = parse_custom_kernel(self.custom_kernel_entry.get())
+        return StructuringElement(
+            shape,
+            size=int(self.size_slider.get()),
+            height=int(self.height_slider.get()),
+            angle=int(self.chosen_angle.get()),
+            custom_kernel=custom_kernel,
+        )
 
     def update_image(self) -> None:
-        image_array = np.array(self.image)
-        kernel = np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]], dtype=np.uint8)
-
-        match self.chosen_filter.get():
-            case BinaryOperationEnum.ERODE:
-                filtered_image_array = cv2.erode(image_array, kernel)
-            case BinaryOperationEnum.DILATE:
-                filtered_image_array = cv2.dilate(image_array, kernel)
-            case BinaryOperationEnum.OPEN:
-                filtered_image_array = cv2.morphologyEx(
-                    image_array, cv2.MORPH_OPEN, kernel
-                )
-            case BinaryOperationEnum.CLOSE:
-                filtered_image_array = cv2.morphologyEx(
-                    image_array, cv2.MORPH_CLOSE, kernel
-                )
-            case _:
-                raise ValueError()
-
-        filtered_image = Image.fromarray(filtered_image_array.astype("uint8"), "L")
-        self.image_window.update_image(filtered_image)
+        try:
+            element = self.get_element()
+            iterations = int(self.iterations_slider.get())
+        except (ValueError, tk.TclError) as e:
+            logger.error(e)
+            return None
+
+        operation = self.chosen_filter.get()
+        step = PipelineStep(
+            "morphology",
+            {
+                "method": operation,
+                "element": element.shape,
+                "size": element.size,
+                "height": element.height,
+                "angle": element.angle,
+                "custom_kernel": (
+                    [list(row) for row in element.custom_kernel]
+                    if element.custom_kernel
+                    else None
+                ),
+                "iterations": iterations,
+            },
+        )
+        params = {"operation": operation, "element": element, "iterations": iterations}
+        if self.buffer.mode == ImageModeEnum.BINARY:
+            # binary images stay packed, rectangles are eroded and dilated on packed words
+            packed = self.buffer.packed
+            run_job(
+                "Binary operation",
+                lambda _token: result_cache.get_or_compute(
+                    "packed morphology",
+                    packed.words,
+                    params,
+                    lambda: packed_morphology(
+                        packed, operation, element, iterations
+                    ).words,
+                ),
+                lambda words: self.image_window.update_buffer(
+                    ImageBuffer(PackedBinaryImage(words, packed.width)), step, self
+                ),
+                owner=self.image_window,
+            )
+            return None
+
+        image_array = self.buffer.array
+        run_job(
+            "Binary operation",
+            lambda _token: result_cache.get_or_compute(
+                "morphology",
+                image_array,
+                params,
+                lambda: morphology(image_array, operation, element, iterations),
+            ),
+            lambda result: self.image_window.update_array(
+                result.astype(np.uint8, copy=False), step, self
+            ),
+            owner=self.image_window,
+        )
@@ -0,0 +1,211 @@
+import logging
+import os
+import sqlite3
+import zipfile
+from abc import ABC, abstractmethod
+from types import TracebackType
+from typing import Sequence, TextIO
+
+import numpy as np
+
+from imagepy.lab6.shape_measures import MeasureTable, table_length
+from imagepy.utils.constants import MeasuresFormatEnum
+
+logger = logging.getLogger(__name__)
+
+CSV_SEPARATOR = ";"
+SQLITE_TABLE = "measures"
+# columns which get an SQLite index, rows are most often filtered by object size
+SQLITE_INDEXED_COLUMNS = ("area", "perimeter")
+
+
+class MeasuresExporter(ABC):
+    """
+    Writes measure tables to a file chunk by chunk. Use as a context manager, the file is finalized on exit.
+    """
+
+    def __init__(self, path: str, columns: Sequence[str], n_rows: int):
+        """
+        :param path: output file path
+        :param columns: names of exported columns, in order
+        :param n_rows: total number of rows which will be written
+        """
+        self.path = path
+        self.columns = tuple(columns)
+        self.n_rows = n_rows
+        self.rows_written = 0
+
+    def write(self, table: MeasureTable) -> None:
+        rows = table_length(table)
+        if self.rows_written + rows > self.n_rows:
+            raise ValueError(
+                f"Too many rows written! {self.rows_written + rows} > {self.n_rows}"
+            )
+        self._write_chunk(table)
+        self.rows_written += rows
+
+    def close(self) -> None:
+        if self.rows_written != self.n_rows:
+            logger.warning(
+                f"Only {self.rows_written} of {self.n_rows} rows written to {self.path}"
+            )
+        self._finalize()
+
+    def __enter__(self) -> "MeasuresExporter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    @abstractmethod
+    def _write_chunk(self, table: MeasureTable) -> None:
+        pass
+
+    @abstractmethod
+    def _finalize(self) -> None:
+        pass
+
+
+class CsvMeasuresExporter(MeasuresExporter):
+    """
+    Semicolon separated text, with a `sep=` line so spreadsheet programs detect the separator.
+    """
+
+    def __init__(self, path: str, columns: Sequence[str], n_rows: int):
+        super().__init__(path, columns, n_rows)
+        self.file: TextIO = open(path, "w")
+        self.file.write(f'"sep={CSV_SEPARATOR}"\n')
+        self.file.write(CSV_SEPARATOR.join(self.columns) + "\n")
+
+    def _write_chunk(self, table: MeasureTable) -> None:
+        # noinspection PyTypeChecker
+        np.savetxt(
+            self.file,
+            np.column_stack([table[column] for column in self.columns]),
+            fmt=" %1.4f",
+            delimiter=CSV_SEPARATOR,
+        )
+
+    def _finalize(self) -> None:
+        self.file.close()
+
+
+class NpyMeasuresExporter(MeasuresExporter):
+    """
+    Single NPY file with a structured array, field names are column names.
+    Rows are written straight into a memory mapped file.
+    """
+
+    def __init__(self, path: str, columns: Sequence[str], n_rows: int):
+        super().__init__(path, columns, n_rows)
+        dtype = np.dtype([(column, np.float64) for column in self.columns])
+        self.array: np.memmap = np.lib.format.open_memmap(
+            path, mode="w+", dtype=dtype, shape=(n_rows,)
+        )
+
+    def _write_chunk(self, table: MeasureTable) -> None:
+        rows = slice(self.rows_written, self.rows_written + table_length(table))
+        for column in self.columns:
+            self.array[column][rows] = table[column]
+
+    def _finalize(self) -> None:
+        self.array.flush()
+        del self.array
+
+
+class NpzMeasuresExporter(MeasuresExporter):
+    """
+    Compressed NPZ archive with one array per column, loads directly with `np.load`.
+    Rows are spooled to a temporary NPY file and packed column by column on close.
+    """
+
+    def __init__(self, path: str, columns: Sequence[str], n_rows: int):
+        super().__init__(path, columns, n_rows)
+        self.spool = NpyMeasuresExporter(f"{path}.spool.npy", columns, n_rows)
+
+    def _write_chunk(self, table: MeasureTable) -> None:
+        self.spool.write(table)
+
+    def _finalize(self) -> None:
+        spool_path = self.spool.path
+        self.spool.close()
+        spool = np.load(spool_path, mmap_mode="r")
+        try:
+            with zipfile.ZipFile(
+                self.path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True
+            ) as archive:
+                for column in self.columns:
+                    with archive.open(f"{column}.npy", "w", force_zip64=True) as f:
+                        np.lib.format.write_array(
+                            f, np.ascontiguousarray(spool[column][: self.rows_written])
+                        )
+        finally:
+            del spool
+            os.remove(spool_path)
+
+
+class SqliteMeasuresExporter(MeasuresExporter):
+    """
+    SQLite database with a single table, `id` is the contour index. Indexes are created after all rows
+    are inserted, which is much faster than updating them on every insert.
+    """
+
+    def __init__(self, path: str, columns: Sequence[str], n_rows: int):
+        super().__init__(path, columns, n_rows)
+        if os.path.exists(path):
+            os.remove(path)
+        self.connection = sqlite3.connect(path)
+        column_definitions = ", ".join(f'"{column}" REAL' for column in self.columns)
+        self.connection.execute(
+            f"CREATE TABLE {SQLITE_TABLE} (id INTEGER PRIMARY KEY, {column_definitions})"
+        )
+        placeholders = ", ".join("?" for _ in range(len(self.columns) + 1))
+        self.insert_query = f"INSERT INTO {SQLITE_TABLE} VALUES ({placeholders})"
+
+    def _write_chunk(self, table: MeasureTable) -> None:
+        values = np.column_stack([table[column] for column in self.columns])
+        rows = (
+            (row_id, *row)
+            for row_id, row in enumerate(values.tolist(), start=self.rows_written)
+        )
+        with self.connection:
+            self.connection.executemany(self.insert_query, rows)
+
+    def _finalize(self) -> None:
+        with self.connection:
+            for column in SQLITE_INDEXED_COLUMNS:
+                if column in self.columns:
+                    self.connection.execute(
+                        f'CREATE INDEX "{SQLITE_TABLE}_{column}" ON {SQLITE_TABLE} ("{column}")'
+                    )
+        self.connection.close()
+
+
+EXPORTERS: dict[MeasuresFormatEnum, type[MeasuresExporter]] = {
+    MeasuresFormatEnum.CSV: CsvMeasuresExporter,
+    MeasuresFormatEnum.NPY: NpyMeasuresExporter,
+    MeasuresFormatEnum.NPZ: NpzMeasuresExporter,
+    MeasuresFormatEnum.SQLITE: SqliteMeasuresExporter,
+}
+
+
+def open_exporter(path: str, columns: Sequence[str], n_rows: int) -> MeasuresExporter:
+    """
+    Creates exporter matching file extension.
+
+    :param path: output file path, extension selects the format
+    :param columns: names of exported columns, in order
+    :param n_rows: total number of rows which will be written
+    :return: exporter, use it as a context manager
+    """
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    try:
+        measures_format = MeasuresFormatEnum(extension)
+    except ValueError:
+        raise ValueError(f"Unsupported measures file format! {path}")
+    return EXPORTERS[measures_format](path, columns, n_rows)
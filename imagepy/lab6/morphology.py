@@ -0,0 +1,398 @@
+import logging
+import math
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from imagepy.utils.constants import BinaryOperationEnum, StructuringElementEnum
+from imagepy.utils.packed_binary import PackedBinaryImage
+
+logger = logging.getLogger(__name__)
+
+# (row step, column step) of a line segment for each supported angle
+LINE_STEPS = {0: (0, 1), 45: (-1, 1), 90: (1, 0), 135: (1, 1)}
+# disks with smaller radius are applied with dense kernel, decomposition error is too visible for them
+MIN_DECOMPOSED_DISK_RADIUS = 4
+
+# (row step, column step, length, anchor), anchor is the number of segment pixels before the center
+LineSegment = tuple[int, int, int, int]
+
+
+@dataclass(frozen=True)
+class StructuringElement:
+    """
+    Flat structuring element.
+
+    :param shape: element type
+    :param size: width of rectangle and cross, length of line, diameter of disk
+    :param height: height of rectangle and cross, defaults to size
+    :param angle: line angle in degrees, one of LINE_STEPS keys
+    :param custom_kernel: binary kernel rows used for custom elements
+    """
+
+    shape: StructuringElementEnum
+    size: int = 3
+    height: int | None = None
+    angle: int = 0
+    custom_kernel: tuple[tuple[int, ...], ...] | None = None
+
+    def __post_init__(self) -> None:
+        if self.size < 1 or (self.height is not None and self.height < 1):
+            raise ValueError(f"Structuring element size has to be positive! {self}")
+        if self.shape == StructuringElementEnum.LINE and self.angle not in LINE_STEPS:
+            raise ValueError(f"Line angle has to be one of {list(LINE_STEPS)}!")
+        if self.shape == StructuringElementEnum.CUSTOM and not self.custom_kernel:
+            raise ValueError("Custom structuring element requires kernel!")
+
+    def segments(self, iterations: int = 1) -> list[LineSegment]:
+        """
+        Line segments whose Minkowski sum is equal to the element applied given number of times.
+        Disks are approximated with octagons. Crosses, custom elements and small disks
+        are not decomposed, so for them the list is empty.
+        """
+        height = self.height or self.size
+        match self.shape:
+            case StructuringElementEnum.RECTANGLE:
+                return [
+                    (0, 1, *_repeat_line(self.size, iterations)),
+                    (1, 0, *_repeat_line(height, iterations)),
+                ]
+            case StructuringElementEnum.LINE:
+                step_y, step_x = LINE_STEPS[self.angle]
+                return [(step_y, step_x, *_repeat_line(self.size, iterations))]
+            case StructuringElementEnum.DISK if (
+                self.size // 2 >= MIN_DECOMPOSED_DISK_RADIUS
+            ):
+                return _octagon_segments(self.size // 2 * iterations)
+            case _:
+                return []
+
+    def radius(self, iterations: int = 1) -> int:
+        """
+        Farthest distance, along either axis, of a pixel affecting the result when the element
+        is applied given number of times.
+        """
+        segments = self.segments(iterations)
+        if segments:
+            return sum(
+                max(anchor, length - 1 - anchor)
+                for _step_y, _step_x, length, anchor in segments
+            )
+        return iterations * (max(self.kernel().shape) // 2)
+
+    def kernel(self) -> np.ndarray:
+        """
+        Dense uint8 kernel of the element, as accepted by cv2.erode and cv2.dilate.
+        """
+        height = self.height or self.size
+        match self.shape:
+            case StructuringElementEnum.CROSS:
+                return cv2.getStructuringElement(cv2.MORPH_CROSS, (self.size, height))
+            case StructuringElementEnum.CUSTOM:
+                return np.array(self.custom_kernel, dtype=np.uint8)
+            case (
+                StructuringElementEnum.DISK
+            ) if self.size // 2 < MIN_DECOMPOSED_DISK_RADIUS:
+                return cv2.getStructuringElement(
+                    cv2.MORPH_ELLIPSE, (self.size, self.size)
+                )
+            case _:
+                return segments_kernel(self.segments())
+
+
+def _repeat_line(length: int, iterations: int) -> tuple[int, int]:
+    """
+    Applying line of length L n times is equal to applying line of length n * (L - 1) + 1 once.
+    Anchor of each line lies in its center, same as in OpenCV kernels.
+
+    :return: length and anchor of the resulting line
+    """
+    return iterations * (length - 1) + 1, iterations * (length // 2)
+
+
+def _octagon_segments(radius: int) -> list[LineSegment]:
+    """
+    Horizontal, vertical and both diagonal segments which sum up to an octagon
+    with equal distance to its axial and diagonal faces.
+    """
+    axial_extent = 2 * round(radius * (math.sqrt(2) - 1))
+    diagonal_extent = 2 * round((radius - axial_extent / 2) / 2)
+    return [
+        (0, 1, axial_extent + 1, axial_extent // 2),
+        (1, 0, axial_extent + 1, axial_extent // 2),
+        (1, 1, diagonal_extent + 1, diagonal_extent // 2),
+        (-1, 1, diagonal_extent + 1, diagonal_extent // 2),
+    ]
+
+
+def segments_kernel(segments: list[LineSegment]) -> np.ndarray:
+    """
+    Builds dense kernel being Minkowski sum of given line segments.
+    """
+    offsets = {(0, 0)}
+    for step_y, step_x, length, anchor in segments:
+        start = -anchor
+        offsets = {
+            (y + step_y * t, x + step_x * t)
+            for y, x in offsets
+            for t in range(start, start + length)
+        }
+    min_y = min(y for y, _x in offsets)
+    min_x = min(x for _y, x in offsets)
+    max_y = max(y for y, _x in offsets)
+    max_x = max(x for _y, x in offsets)
+    # keep kernel center in the middle, so anchor matches the decomposed version
+    radius_y, radius_x = max(-min_y, max_y), max(-min_x, max_x)
+    kernel = np.zeros((2 * radius_y + 1, 2 * radius_x + 1), dtype=np.uint8)
+    for y, x in offsets:
+        kernel[y + radius_y, x + radius_x] = 1
+    return kernel
+
+
+def _extremum_operation(is_max: bool) -> np.ufunc:
+    if is_max:
+        return np.maximum
+    return np.minimum
+
+
+def _identity(dtype: np.dtype, is_max: bool) -> int:
+    """
+    Value which never changes result of max (or min) operation.
+    """
+    return int(np.iinfo(dtype).min if is_max else np.iinfo(dtype).max)
+
+
+def _window_extremum_1d(
+    array: np.ndarray, length: int, before: int, is_max: bool
+) -> np.ndarray:
+    """
+    van Herk/Gil-Werman running max or min along axis 0 in window [y - before, y - before + length).
+    It costs three comparisons per pixel regardless of window length.
+    """
+    if length == 1:
+        return array
+    operation = _extremum_operation(is_max)
+    identity = _identity(array.dtype, is_max)
+    n_rows = array.shape[0]
+    padded_rows = n_rows + length - 1
+    n_blocks = -(-padded_rows // length)
+    padded = np.full((n_blocks * length, *array.shape[1:]), identity, array.dtype)
+    padded[before : before + n_rows] = array
+
+    blocks = padded.reshape(n_blocks, length, *array.shape[1:])
+    # prefix extremum from block start and suffix extremum from block end
+    prefix = operation.accumulate(blocks, axis=1).reshape(padded.shape)
+    suffix = operation.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(
+        padded.shape
+    )
+    return operation(suffix[:n_rows], prefix[length - 1 : length - 1 + n_rows])
+
+
+def _segment_extremum(
+    array: np.ndarray, segment: LineSegment, is_max: bool
+) -> np.ndarray:
+    step_y, step_x, length, before = segment
+    match (step_y, step_x):
+        case (0, 1):
+            return _window_extremum_1d(array.T, length, before, is_max).T
+        case (1, 0):
+            return _window_extremum_1d(array, length, before, is_max)
+        case (1, 1) | (-1, 1):
+            # skew image so each diagonal becomes a column
+            height, width = array.shape
+            rows = np.arange(height)[:, None]
+            if step_y == 1:
+                columns = np.arange(width)[None, :] - rows + height - 1
+            else:
+                columns = np.arange(width)[None, :] + rows
+                # rows decrease along anti-diagonal, so window is mirrored
+                before = length - 1 - before
+            identity = _identity(array.dtype, is_max)
+            skewed = np.full((height, width + height - 1), identity, array.dtype)
+            skewed[rows, columns] = array
+            return _window_extremum_1d(skewed, length, before, is_max)[rows, columns]
+        case _:
+            raise ValueError(f"Unsupported line segment! {segment}")
+
+
+def _extremum(
+    image_array: np.ndarray,
+    element: StructuringElement,
+    iterations: int,
+    is_max: bool,
+) -> np.ndarray:
+    segments = element.segments(iterations)
+    if segments:
+        # with diagonal segments intermediate results have to cover pixels outside of the image,
+        # otherwise consecutive segments would lose paths which leave the image and come back
+        is_diagonal = any(step_y and step_x for step_y, step_x, _, _ in segments)
+        if len(segments) == 1 or not is_diagonal:
+            result = image_array
+            for segment in segments:
+                result = _segment_extremum(result, segment, is_max)
+            return result
+
+        pad_size = sum(length for _step_y, _step_x, length, _anchor in segments)
+        identity = _identity(image_array.dtype, is_max)
+        result = cv2.copyMakeBorder(
+            image_array,
+            pad_size,
+            pad_size,
+            pad_size,
+            pad_size,
+            cv2.BORDER_CONSTANT,
+            value=(identity,),
+        )
+        for segment in segments:
+            result = _segment_extremum(result, segment, is_max)
+        return result[pad_size:-pad_size, pad_size:-pad_size]
+
+    if element.shape == StructuringElementEnum.CROSS:
+        # cross is a union of two lines, so it is an extremum of both line results
+        height = element.height or element.size
+        horizontal = StructuringElement(StructuringElementEnum.LINE, element.size)
+        vertical = StructuringElement(StructuringElementEnum.LINE, height, angle=90)
+        operation = _extremum_operation(is_max)
+        result = image_array
+        # union of lines does not scale with iterations, so cross is applied repeatedly
+        for _ in range(iterations):
+            result = operation(
+                _extremum(result, horizontal, 1, is_max),
+                _extremum(result, vertical, 1, is_max),
+            )
+        return result
+
+    morphology_operation = cv2.dilate if is_max else cv2.erode
+    return morphology_operation(image_array, element.kernel(), iterations=iterations)
+
+
+def _saturating_subtract(minuend: np.ndarray, subtrahend: np.ndarray) -> np.ndarray:
+    # elements with even size are not centered, so opening may be brighter than the source
+    return np.maximum(minuend, subtrahend) - subtrahend
+
+
+def erode(
+    image_array: np.ndarray, element: StructuringElement, iterations: int = 1
+) -> np.ndarray:
+    return _extremum(image_array, element, iterations, is_max=False)
+
+
+def dilate(
+    image_array: np.ndarray, element: StructuringElement, iterations: int = 1
+) -> np.ndarray:
+    return _extremum(image_array, element, iterations, is_max=True)
+
+
+def morphology(
+    image_array: np.ndarray,
+    operation: BinaryOperationEnum | str,
+    element: StructuringElement,
+    iterations: int = 1,
+) -> np.ndarray:
+    """
+    Applies morphological operation. Pixels outside of the image never affect the result,
+    same as default border in OpenCV morphology.
+
+    :param image_array: 8-bit or 16-bit image array
+    :param operation: operation type
+    :param element: structuring element
+    :param iterations: number of times erosion and dilation are applied
+    :return: result array with the same dtype as input
+    """
+    if iterations < 1:
+        raise ValueError(f"Number of iterations has to be positive! {iterations}")
+
+    match operation:
+        case BinaryOperationEnum.ERODE:
+            return erode(image_array, element, iterations)
+        case BinaryOperationEnum.DILATE:
+            return dilate(image_array, element, iterations)
+        case BinaryOperationEnum.OPEN:
+            return dilate(erode(image_array, element, iterations), element, iterations)
+        case BinaryOperationEnum.CLOSE:
+            return erode(dilate(image_array, element, iterations), element, iterations)
+        case BinaryOperationEnum.GRADIENT:
+            return _saturating_subtract(
+                dilate(image_array, element, iterations),
+                erode(image_array, element, iterations),
+            )
+        case BinaryOperationEnum.TOP_HAT:
+            opened = dilate(
+                erode(image_array, element, iterations), element, iterations
+            )
+            return _saturating_subtract(image_array, opened)
+        case BinaryOperationEnum.BLACK_HAT:
+            closed = erode(
+                dilate(image_array, element, iterations), element, iterations
+            )
+            return _saturating_subtract(closed, image_array)
+        case _:
+            raise ValueError(f"Unsupported morphological operation! {operation}")
+
+
+def _packed_rectangle(
+    image: PackedBinaryImage,
+    element: StructuringElement,
+    iterations: int,
+    is_max: bool,
+) -> PackedBinaryImage:
+    width, before_x = _repeat_line(element.size, iterations)
+    height, before_y = _repeat_line(element.height or element.size, iterations)
+    repeats = 1
+    if before_x != width // 2 or before_y != height // 2:
+        # repeated elements of even size are not centred like a single larger element
+        width, height = element.size, element.height or element.size
+        repeats = iterations
+    for _ in range(repeats):
+        image = image.dilate(height, width) if is_max else image.erode(height, width)
+    return image
+
+
+def packed_morphology(
+    image: PackedBinaryImage,
+    operation: BinaryOperationEnum | str,
+    element: StructuringElement,
+    iterations: int = 1,
+) -> PackedBinaryImage:
+    """
+    Same as `morphology` for binary images. Rectangles are applied to packed words, other elements
+    to the unpacked image.
+
+    :param image: binary image
+    :param operation: operation type
+    :param element: structuring element
+    :param iterations: number of times erosion and dilation are applied
+    :return: binary result
+    """
+    if element.shape != StructuringElementEnum.RECTANGLE:
+        image_array = image.to_array().view(np.uint8)
+        return PackedBinaryImage.from_array(
+            morphology(image_array, operation, element, iterations)
+        )
+    if iterations < 1:
+        raise ValueError(f"Number of iterations has to be positive! {iterations}")
+
+    def erode_packed(source: PackedBinaryImage) -> PackedBinaryImage:
+        return _packed_rectangle(source, element, iterations, is_max=False)
+
+    def dilate_packed(source: PackedBinaryImage) -> PackedBinaryImage:
+        return _packed_rectangle(source, element, iterations, is_max=True)
+
+    match operation:
+        case BinaryOperationEnum.ERODE:
+            return erode_packed(image)
+        case BinaryOperationEnum.DILATE:
+            return dilate_packed(image)
+        case BinaryOperationEnum.OPEN:
+            return dilate_packed(erode_packed(image))
+        case BinaryOperationEnum.CLOSE:
+            return erode_packed(dilate_packed(image))
+        case BinaryOperationEnum.GRADIENT:
+            return dilate_packed(image) & ~erode_packed(image)
+        case BinaryOperationEnum.TOP_HAT:
+            return image & ~dilate_packed(erode_packed(image))
+        case BinaryOperationEnum.BLACK_HAT:
+            return erode_packed(dilate_packed(image)) & ~image
+        case _:
+            raise ValueError(f"Unsupported morphological operation! {operation}")
@@ -0,0 +1,289 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import cv2
+import numpy as np
+
+from imagepy.lab6.shape_measures import (
+    MEASURE_COLUMNS,
+    MeasureTable,
+    concatenate_measure_tables,
+    contour_regions,
+    find_contours,
+    measure_contours,
+)
+from imagepy.utils.constants import WORKER_START_METHOD
+
+logger = logging.getLogger(__name__)
+
+# strips thinner than this spend more time on merging than on measuring
+MIN_STRIP_ROWS = 256
+
+
+@dataclass
+class StripResult:
+    """
+    Measures of objects which lie entirely in one strip, plus what is needed to merge the others.
+
+    :param table: measures of contours whose objects do not touch strip cuts
+    :param keys: global discovery key of every row in table
+    :param top_labels: component labels of the first strip row, 0 is background
+    :param bottom_labels: component labels of the last strip row, 0 is background
+    :param boxes: bounding box (top, left, bottom, right) of each cut component, global coordinates
+    """
+
+    table: MeasureTable
+    keys: np.ndarray
+    top_labels: np.ndarray
+    bottom_labels: np.ndarray
+    boxes: dict[int, tuple[int, int, int, int]] = field(default_factory=dict)
+
+
+def measure_image_parallel(
+    image_array: np.ndarray,
+    workers: int | None = None,
+    max_strip_pixels: int | None = None,
+) -> MeasureTable:
+    """
+    Measures all contours of a binary image in worker processes. The image is cut into horizontal strips,
+    objects lying inside one strip are measured by the strip worker, objects crossing strip cuts are merged
+    with union-find over the cut rows and measured from their own crops.
+    Rows are returned in the same order and with the same values as `measure_image`.
+    Workers only get their strips and crops, so a memory-mapped array is never read into memory at once.
+
+    :param image_array: binary single channel image array, bool or uint8 with non-zero foreground
+    :param workers: number of worker processes, all cores by default
+    :param max_strip_pixels: cut the image into more strips than workers so no strip is bigger
+    :return: measure table, see `measure_contours`
+    """
+    workers = workers or os.cpu_count() or 1
+    height, width = image_array.shape
+    n_strips = max(1, min(workers, height // MIN_STRIP_ROWS))
+    if max_strip_pixels:
+        n_strips = max(n_strips, min(height, -(-height * width // max_strip_pixels)))
+    bounds = np.linspace(0, height, n_strips + 1).astype(int).tolist()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+    ) as executor:
+        strip_futures = [
+            executor.submit(
+                _measure_strip,
+                image_array[top:bottom],
+                top,
+                width,
+                top > 0,
+                bottom < height,
+            )
+            for top, bottom in zip(bounds[:-1], bounds[1:])
+        ]
+        strips = [future.result() for future in strip_futures]
+
+        crossing_futures = [
+            executor.submit(
+                _measure_component,
+                image_array[top : bottom + 1, left : right + 1],
+                (top, left),
+                seed,
+                width,
+            )
+            for (top, left, bottom, right), seed in _merge_cut_components(
+                strips, bounds
+            )
+        ]
+        crossing = [future.result() for future in crossing_futures]
+
+    tables = [strip.table for strip in strips] + [table for table, _ in crossing]
+    keys = np.concatenate(
+        [strip.keys for strip in strips] + [keys for _, keys in crossing]
+    )
+    # findContours lists contours from the last discovered to the first one
+    order = np.argsort(keys)[::-1]
+    table = concatenate_measure_tables(tables)
+    return {column: table[column][order] for column in MEASURE_COLUMNS}
+
+
+def discovery_keys(
+    mask: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds where the raster scan of `cv2.findContours` discovers every contour: the first pixel of each
+    8-connected object for outer borders, the first pixel of each 4-connected enclosed background region for
+    holes. `cv2.findContours` with RETR_LIST returns contours in descending order of these positions.
+
+    :param mask: binary single channel image array
+    :return: discovery points (y, x) in ascending raster order, object label owning each contour,
+        object labels of the mask and their `cv2.connectedComponentsWithStats` statistics
+    """
+    _n, labels, object_stats, _centroids = cv2.connectedComponentsWithStats(
+        mask, connectivity=8, ltype=cv2.CV_32S
+    )
+    object_labels, object_points = _first_pixels(labels, object_stats)
+    object_points = object_points[object_labels != 0]
+
+    background = np.pad(mask == 0, 1, constant_values=True).astype(np.uint8)
+    _n, background_labels, stats, _centroids = cv2.connectedComponentsWithStats(
+        background, connectivity=4, ltype=cv2.CV_32S
+    )
+    hole_labels, hole_points = _first_pixels(background_labels, stats)
+    # background connected to the padding is not a hole
+    hole_points = (
+        hole_points[(hole_labels != 0) & (hole_labels != background_labels[0, 0])] - 1
+    )
+
+    points = np.concatenate([object_points, hole_points])
+    order = np.lexsort((points[:, 1], points[:, 0]))
+    points = points[order]
+    # pixel left of the first hole pixel belongs to the object enclosing the hole
+    is_hole = order >= len(object_points)
+    owners = labels[points[:, 0], points[:, 1] - is_hole]
+    return points, owners, labels, object_stats
+
+
+def _first_pixels(
+    labels: np.ndarray, stats: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    First pixel in raster order of every label, it is the leftmost pixel in the top row of the label.
+    """
+    top = stats[:, cv2.CC_STAT_TOP]
+    on_top_row = top[labels] == np.arange(labels.shape[0])[:, None]
+    ys, xs = np.nonzero(on_top_row)
+    unique_labels, first = np.unique(labels[ys, xs], return_index=True)
+    return unique_labels, np.stack([ys[first], xs[first]], axis=1)
+
+
+def _as_mask(image_array: np.ndarray) -> np.ndarray:
+    """
+    OpenCV does not accept bool arrays, they are viewed as uint8 without copying.
+    """
+    return image_array.view(np.uint8) if image_array.dtype == np.bool_ else image_array
+
+
+def _measure_strip(
+    strip: np.ndarray, top: int, width: int, cut_above: bool, cut_below: bool
+) -> StripResult:
+    strip = _as_mask(strip)
+    contours = find_contours(strip)
+    points, owners, labels, stats = discovery_keys(strip)
+    if len(points) != len(contours):
+        raise ValueError(
+            f"Contours do not match discovered objects! {len(contours)} != {len(points)}"
+        )
+    # contours come in descending discovery order
+    points, owners = points[::-1], owners[::-1]
+
+    cut_labels = np.union1d(
+        labels[0] if cut_above else [], labels[-1] if cut_below else []
+    )
+    cut_labels = cut_labels[cut_labels != 0].astype(np.int32)
+    keep = ~np.isin(owners, cut_labels)
+    kept_contours = [
+        contour + (0, top) for contour, is_kept in zip(contours, keep) if is_kept
+    ]
+    kept_regions = contour_regions(strip, contours)[keep]
+    kept_regions[:, 1] += top
+
+    boxes = {}
+    for label in cut_labels.tolist():
+        left, box_top, box_width, box_height = stats[label, :4].tolist()
+        boxes[label] = (
+            top + box_top,
+            left,
+            top + box_top + box_height - 1,
+            left + box_width - 1,
+        )
+
+    return StripResult(
+        table=measure_contours(kept_contours, kept_regions),
+        keys=(points[keep, 0] + top).astype(np.int64) * width + points[keep, 1],
+        top_labels=labels[0].copy(),
+        bottom_labels=labels[-1].copy(),
+        boxes=boxes,
+    )
+
+
+def _merge_cut_components(
+    strips: list[StripResult], bounds: list[int]
+) -> list[tuple[tuple[int, int, int, int], tuple[int, int]]]:
+    """
+    Joins components cut by strip borders with union-find over 8-connected pixel pairs of neighbouring rows.
+
+    :return: bounding box and one global pixel of every merged component
+    """
+    parents: dict[tuple[int, int], tuple[int, int]] = {
+        (index, label): (index, label)
+        for index, strip in enumerate(strips)
+        for label in strip.boxes
+    }
+
+    def find(node: tuple[int, int]) -> tuple[int, int]:
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    for index in range(len(strips) - 1):
+        upper, lower = strips[index].bottom_labels, strips[index + 1].top_labels
+        for shift in (-1, 0, 1):
+            a = upper[max(0, -shift) : len(upper) - max(0, shift)]
+            b = lower[max(0, shift) : len(lower) - max(0, -shift)]
+            touching = (a != 0) & (b != 0)
+            for label_a, label_b in np.unique(
+                np.stack([a[touching], b[touching]], axis=1), axis=0
+            ).tolist():
+                root_a, root_b = find((index, label_a)), find((index + 1, label_b))
+                if root_a != root_b:
+                    parents[root_b] = root_a
+
+    merged: dict[tuple[int, int], tuple[int, int, int, int]] = {}
+    for node in parents:
+        root = find(node)
+        box = strips[node[0]].boxes[node[1]]
+        if root in merged:
+            top, left, bottom, right = merged[root]
+            box = (
+                min(top, box[0]),
+                min(left, box[1]),
+                max(bottom, box[2]),
+                max(right, box[3]),
+            )
+        merged[root] = box
+
+    components = []
+    for (index, label), box in merged.items():
+        # seed is any pixel of the component in one of its cut rows
+        strip = strips[index]
+        if label in strip.top_labels:
+            seed = (bounds[index], int(np.argmax(strip.top_labels == label)))
+        else:
+            seed = (bounds[index + 1] - 1, int(np.argmax(strip.bottom_labels == label)))
+        components.append((box, seed))
+    return components
+
+
+def _measure_component(
+    crop: np.ndarray, origin: tuple[int, int], seed: tuple[int, int], width: int
+) -> tuple[MeasureTable, np.ndarray]:
+    """
+    Measures contours of the single object covering `seed`, other objects in the crop are ignored.
+    """
+    top, left = origin
+    crop = _as_mask(crop)
+    _n, labels = cv2.connectedComponents(crop, connectivity=8, ltype=cv2.CV_32S)
+    mask = (labels == labels[seed[0] - top, seed[1] - left]).astype(np.uint8)
+    contours = find_contours(mask)
+    points, _owners, _labels, _stats = discovery_keys(mask)
+    points = points[::-1]
+    keys = (points[:, 0] + top).astype(np.int64) * width + points[:, 1] + left
+    # holes are labelled in the crop, objects inside them are not part of the hole
+    regions = contour_regions(crop, contours)
+    regions[:, :2] += (left, top)
+    return (
+        measure_contours([contour + (left, top) for contour in contours], regions),
+        keys,
+    )
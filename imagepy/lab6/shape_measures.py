@@ -0,0 +1,341 @@
+import logging
+from typing import Callable, Final, Iterator, Sequence
+
+import cv2
+import numpy as np
+
+from imagepy.utils.constants import MEASURES_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+MOMENT_COLUMNS: Final = (
+    "m00",
+    "m10",
+    "m01",
+    "m20",
+    "m11",
+    "m02",
+    "m30",
+    "m21",
+    "m12",
+    "m03",
+    "mu20",
+    "mu11",
+    "mu02",
+    "mu30",
+    "mu21",
+    "mu12",
+    "mu03",
+    "nu20",
+    "nu11",
+    "nu02",
+    "nu30",
+    "nu21",
+    "nu12",
+    "nu03",
+)
+BOUNDING_BOX_COLUMNS: Final = ("bbox_left", "bbox_top", "bbox_width", "bbox_height")
+MEASURE_COLUMNS: Final = (
+    "area",
+    "perimeter",
+    *BOUNDING_BOX_COLUMNS,
+    "w1",
+    "w2",
+    "w3",
+    "w9",
+    "w10",
+    "m1",
+    "m2",
+    "m3",
+    *MOMENT_COLUMNS,
+)
+# same threshold OpenCV uses to decide whether a contour has any area
+MOMENT_EPSILON: Final = 2.220446049250313e-16
+
+MeasureTable = dict[str, np.ndarray]
+# connectedComponentsWithStats statistics of the region bounded by every contour
+REGION_STATS: Final = [
+    cv2.CC_STAT_LEFT,
+    cv2.CC_STAT_TOP,
+    cv2.CC_STAT_WIDTH,
+    cv2.CC_STAT_HEIGHT,
+    cv2.CC_STAT_AREA,
+]
+
+
+def find_contours(image_array: np.ndarray) -> Sequence[np.ndarray]:
+    contours, _hierarchy = cv2.findContours(
+        image_array, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE
+    )
+    return contours
+
+
+def measure_image(image_array: np.ndarray) -> MeasureTable:
+    """
+    Finds all contours of binary image and measures them.
+
+    :param image_array: binary single channel image array
+    :return: measure table, see `measure_contours`
+    """
+    contours = find_contours(image_array)
+    return measure_contours(contours, contour_regions(image_array, contours))
+
+
+def contour_regions(
+    image_array: np.ndarray, contours: Sequence[np.ndarray]
+) -> np.ndarray:
+    """
+    Pixel statistics of the region every contour bounds: the 8-connected object for outer contours,
+    the 4-connected background hole for hole contours. Hole contours are told apart by their orientation,
+    the background is only labelled when there are any.
+
+    :param image_array: binary single channel image array the contours were found in
+    :param contours: contours in `find_contours` format
+    :return: int array of shape (n, 5) with left, top, width, height and pixel area of every region
+    """
+    if not contours:
+        return np.empty((0, len(REGION_STATS)), dtype=np.int64)
+    x, y, x_prev, y_prev, starts = _contour_points(contours)
+    # findContours traces holes in the opposite direction than outer contours, holes have positive signed area
+    is_hole = np.add.reduceat(x_prev * y - x * y_prev, starts) > 0
+
+    _n, labels, stats, _centroids = cv2.connectedComponentsWithStats(
+        image_array, connectivity=8, ltype=cv2.CV_32S
+    )
+    # every contour point is a pixel of the object it belongs to
+    first_x = x[starts].astype(np.intp)
+    first_y = y[starts].astype(np.intp)
+    regions = stats[labels[first_y, first_x]][:, REGION_STATS].astype(np.int64)
+    if is_hole.any():
+        _n, hole_labels, hole_stats, _centroids = cv2.connectedComponentsWithStats(
+            (image_array == 0).view(np.uint8), connectivity=4, ltype=cv2.CV_32S
+        )
+        # hole contours run through object pixels 4-adjacent to the hole, so pixels below
+        # the topmost contour points belong to the hole
+        top = np.minimum.reduceat(y, starts)
+        contour_index = np.repeat(
+            np.arange(len(starts)), np.diff(np.append(starts, len(y)))
+        )
+        top_points = np.flatnonzero(y == top[contour_index])
+        first_top = top_points[np.searchsorted(top_points, starts[is_hole])]
+        holes = hole_labels[
+            y[first_top].astype(np.intp) + 1, x[first_top].astype(np.intp)
+        ]
+        regions[is_hole] = hole_stats[holes][:, REGION_STATS]
+    return regions
+
+
+def iter_measure_chunks(
+    contours: Sequence[np.ndarray],
+    regions: np.ndarray,
+    chunk_size: int = MEASURES_CHUNK_SIZE,
+) -> Iterator[MeasureTable]:
+    """
+    Measures contours in chunks, so only one chunk of results has to be kept in memory at a time.
+
+    :param contours: contours in OpenCV format
+    :param regions: statistics of regions bounded by the contours, see `contour_regions`
+    :param chunk_size: maximum number of contours measured at once
+    :return: iterator of measure tables in contour order
+    """
+    for start in range(0, len(contours), chunk_size):
+        yield measure_contours(
+            contours[start : start + chunk_size], regions[start : start + chunk_size]
+        )
+
+
+def iter_table_chunks(
+    table: MeasureTable, chunk_size: int = MEASURES_CHUNK_SIZE
+) -> Iterator[MeasureTable]:
+    for start in range(0, table_length(table), chunk_size):
+        yield {
+            column: values[start : start + chunk_size]
+            for column, values in table.items()
+        }
+
+
+def measure_contours(
+    contours: Sequence[np.ndarray], regions: np.ndarray
+) -> MeasureTable:
+    """
+    Computes shape measures of all contours at once. Points of every contour are concatenated into a single
+    array, so each measure is a handful of array operations no matter how many objects there are.
+    Area and bounding box are pixel statistics of the bounded region, perimeter and moments are those
+    of the contour polygon through pixel centres. Convex hulls are the only work done per contour.
+
+    :param contours: contours in OpenCV format, arrays of shape (n, 1, 2)
+    :param regions: statistics of regions bounded by the contours, see `contour_regions`
+    :return: table mapping every name from MEASURE_COLUMNS to a float64 array with one value per contour
+    """
+    if not contours:
+        return empty_measure_table()
+
+    x, y, x_prev, y_prev, starts = _contour_points(contours)
+
+    def per_contour(values: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values, starts)
+
+    perimeter = per_contour(np.hypot(x - x_prev, y - y_prev))
+    table = _polygon_moments(x_prev, y_prev, x, y, per_contour)
+    regions = regions.astype(np.float64)
+    area = regions[:, 4]
+    # hull of the pixel squares is the hull of pixel centres grown by half a pixel, its area grows
+    # by the extents of the centres plus one pixel
+    hull_area = (
+        _hull_areas(contours)
+        + np.maximum.reduceat(x, starts)
+        - np.minimum.reduceat(x, starts)
+        + np.maximum.reduceat(y, starts)
+        - np.minimum.reduceat(y, starts)
+        + 1
+    )
+
+    # single pixels and lines have no perimeter, they get inf instead of an error
+    with np.errstate(divide="ignore", invalid="ignore"):
+        table.update(
+            area=area,
+            perimeter=perimeter,
+            bbox_left=regions[:, 0],
+            bbox_top=regions[:, 1],
+            bbox_width=regions[:, 2],
+            bbox_height=regions[:, 3],
+            w1=2 * np.sqrt(area / np.pi),
+            w2=perimeter / np.pi,
+            w3=perimeter / (2 * np.sqrt(area * np.pi)) - 1,
+            w9=2 * np.sqrt(np.pi * area) / perimeter,
+            w10=area / hull_area,
+            m1=table["nu20"] + table["nu02"],
+            m2=(table["nu20"] - table["nu02"]) ** 2 + 4 * table["nu11"] ** 2,
+            m3=(table["nu30"] - 3 * table["nu12"]) ** 2
+            + (3 * table["nu21"] - table["nu03"]) ** 2,
+        )
+    return {column: table[column] for column in MEASURE_COLUMNS}
+
+
+def empty_measure_table() -> MeasureTable:
+    return {column: np.empty(0, dtype=np.float64) for column in MEASURE_COLUMNS}
+
+
+def concatenate_measure_tables(tables: Sequence[MeasureTable]) -> MeasureTable:
+    if not tables:
+        return empty_measure_table()
+    return {
+        column: np.concatenate([table[column] for table in tables])
+        for column in MEASURE_COLUMNS
+    }
+
+
+def table_length(table: MeasureTable) -> int:
+    return len(table[MEASURE_COLUMNS[0]])
+
+
+def _contour_points(
+    contours: Sequence[np.ndarray],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :return: x and y of all contour points concatenated, coordinates of the previous point of every point,
+        wrapping around within each contour, and index of the first point of every contour
+    """
+    lengths = np.fromiter(map(len, contours), dtype=np.intp, count=len(contours))
+    starts = np.zeros_like(lengths)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    previous = np.arange(len(points)) - 1
+    previous[starts] = starts + lengths - 1
+
+    x, y = points[:, 0], points[:, 1]
+    return x, y, x[previous], y[previous], starts
+
+
+def _hull_areas(contours: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Areas of convex hulls of contour polygons, hulls are summed up with one shoelace formula for all of them.
+    """
+    hulls = [cv2.convexHull(contour) for contour in contours]
+    x, y, x_prev, y_prev, starts = _contour_points(hulls)
+    return np.abs(np.add.reduceat(x_prev * y - x * y_prev, starts)) / 2
+
+
+def _polygon_moments(
+    x_prev: np.ndarray,
+    y_prev: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+    per_contour: Callable[[np.ndarray], np.ndarray],
+) -> MeasureTable:
+    """
+    Spatial, central and normalized moments of polygons with Green's theorem, same formulas as `cv2.moments`.
+    """
+    x2, y2 = x * x, y * y
+    x_prev2, y_prev2 = x_prev * x_prev, y_prev * y_prev
+    dxy = x_prev * y - x * y_prev
+    x_sum, y_sum = x_prev + x, y_prev + y
+
+    a00 = per_contour(dxy)
+    a10 = per_contour(dxy * x_sum)
+    a01 = per_contour(dxy * y_sum)
+    a20 = per_contour(dxy * (x_prev * x_sum + x2))
+    a11 = per_contour(dxy * (x_prev * (y_sum + y_prev) + x * (y_sum + y)))
+    a02 = per_contour(dxy * (y_prev * y_sum + y2))
+    a30 = per_contour(dxy * x_sum * (x_prev2 + x2))
+    a21 = per_contour(
+        dxy
+        * (x_prev2 * (3 * y_prev + y) + 2 * x * x_prev * y_sum + x2 * (y_prev + 3 * y))
+    )
+    a12 = per_contour(
+        dxy
+        * (y_prev2 * (3 * x_prev + x) + 2 * y * y_prev * x_sum + y2 * (x_prev + 3 * x))
+    )
+    a03 = per_contour(dxy * y_sum * (y_prev2 + y2))
+
+    # contours with no area have all moments equal to zero, orientation of the contour is ignored
+    scale = np.where(np.abs(a00) > MOMENT_EPSILON, np.sign(a00), 0.0)
+    m00 = a00 * scale / 2
+    m10, m01 = a10 * scale / 6, a01 * scale / 6
+    m20, m11, m02 = a20 * scale / 12, a11 * scale / 24, a02 * scale / 12
+    m30, m21 = a30 * scale / 20, a21 * scale / 60
+    m12, m03 = a12 * scale / 60, a03 * scale / 20
+
+    has_area = np.abs(m00) > MOMENT_EPSILON
+    safe_m00 = np.where(has_area, m00, 1.0)
+    cx = np.where(has_area, m10 / safe_m00, 0.0)
+    cy = np.where(has_area, m01 / safe_m00, 0.0)
+
+    mu20 = m20 - m10 * cx
+    mu11 = m11 - m10 * cy
+    mu02 = m02 - m01 * cy
+    mu30 = m30 - cx * (3 * mu20 + cx * m10)
+    mu21 = m21 - cx * (2 * mu11 + cx * m01) - cy * mu20
+    mu12 = m12 - cy * (2 * mu11 + cy * m10) - cx * mu02
+    mu03 = m03 - cy * (3 * mu02 + cy * m01)
+
+    inv_m00 = np.where(has_area, 1 / np.abs(safe_m00), 0.0)
+    s2 = inv_m00 * inv_m00
+    s3 = s2 * np.sqrt(inv_m00)
+
+    return {
+        "m00": m00,
+        "m10": m10,
+        "m01": m01,
+        "m20": m20,
+        "m11": m11,
+        "m02": m02,
+        "m30": m30,
+        "m21": m21,
+        "m12": m12,
+        "m03": m03,
+        "mu20": mu20,
+        "mu11": mu11,
+        "mu02": mu02,
+        "mu30": mu30,
+        "mu21": mu21,
+        "mu12": mu12,
+        "mu03": mu03,
+        "nu20": mu20 * s2,
+        "nu11": mu11 * s2,
+        "nu02": mu02 * s2,
+        "nu30": mu30 * s3,
+        "nu21": mu21 * s3,
+        "nu12": mu12 * s3,
+        "nu03": mu03 * s3,
+    }
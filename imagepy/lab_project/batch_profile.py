@@ -0,0 +1,156 @@
+import logging
+import time
+import tkinter as tk
+
+import numpy as np
+
+from imagepy.lab_project.profile_sampling import (
+    kymograph,
+    parallel_offsets,
+    path_samples,
+    sample_profiles,
+)
+from imagepy.utils.constants import (
+    MAX_INTENSITY_LEVEL,
+    MAX_INTENSITY_LEVEL_16,
+    MIN_INTENSITY_LEVEL,
+    BatchProfileEnum,
+    ImageModeEnum,
+    InterpolationEnum,
+)
+from imagepy.utils.image_manager import ImageManager, ImageWindow
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_PROFILES = 10_000
+MAX_BATCH_LINE_WIDTH = 50
+
+
+def batch_profile(image_window: ImageWindow | None) -> None:
+    """
+    Entry function checking prerequisites for batch profile functionality.
+    :param image_window: selected image window
+    """
+    # the same condition as for plotting a single profile
+    if image_window is None or len(image_window.drawn_coords) < 2:
+        return None
+    BatchProfileWidget(image_window)
+
+
+def profile_array(image_window: ImageWindow) -> np.ndarray:
+    """
+    Image array with binary images scaled to intensity levels, so profiles can be shown as greyscale.
+    """
+    image_array = image_window.array
+    if image_window.mode == ImageModeEnum.BINARY:
+        return image_array.astype(np.uint8) * MAX_INTENSITY_LEVEL
+    return image_array
+
+
+def kymograph_windows(image_window: ImageWindow) -> list[ImageWindow]:
+    """
+    Open images which can be frames of a kymograph together with the selected one, in opening order.
+    """
+    return [
+        window
+        for window in ImageManager.image_windows
+        if window.buffer.size == image_window.buffer.size
+        and window.mode == image_window.mode
+    ]
+
+
+class BatchProfileWidget(tk.Toplevel):
+    """
+    Samples many profiles of the drawn line at once and shows them as a new image, one profile per row.
+    """
+
+    def __init__(self, source_window: ImageWindow):
+        super(BatchProfileWidget, self).__init__()
+        self.title(source_window.window_title)
+        self.image_window = source_window
+        self.geometry("350x330")
+        self.pack_propagate(False)
+        self.widget_frame: tk.Frame = tk.Frame(self)
+
+        tk.Label(self.widget_frame, text="Choose profiles:").pack()
+        options = [p.value for p in BatchProfileEnum]
+        self.chosen_batch = tk.StringVar(value=options[0])
+        tk.OptionMenu(self.widget_frame, self.chosen_batch, *options).pack()
+
+        # used only by parallel profiles, kymograph takes one profile of every open image of the same size
+        tk.Label(self.widget_frame, text="Number of parallel profiles:").pack()
+        self.n_profiles = tk.IntVar(value=21)
+        tk.Spinbox(
+            self.widget_frame,
+            from_=1,
+            to=MAX_BATCH_PROFILES,
+            textvariable=self.n_profiles,
+        ).pack()
+        tk.Label(self.widget_frame, text="Distance between profiles:").pack()
+        self.spacing = tk.DoubleVar(value=1.0)
+        tk.Entry(self.widget_frame, textvariable=self.spacing).pack()
+
+        tk.Label(self.widget_frame, text="Interpolation:").pack()
+        interpolations = [p.value for p in InterpolationEnum]
+        self.interpolation = tk.StringVar(value=interpolations[0])
+        tk.OptionMenu(self.widget_frame, self.interpolation, *interpolations).pack()
+        tk.Label(self.widget_frame, text="Line width:").pack()
+        self.line_width = tk.IntVar(value=1)
+        tk.Spinbox(
+            self.widget_frame,
+            from_=1,
+            to=MAX_BATCH_LINE_WIDTH,
+            textvariable=self.line_width,
+        ).pack()
+
+        tk.Button(self.widget_frame, text="Create", command=self.create_image).pack()
+
+        self.widget_frame.pack()
+
+    def sample(self) -> np.ndarray:
+        """
+        Samples profiles chosen in the widget.
+
+        :return: float array with one profile per row, plus channel axis for color images
+        """
+        path = path_samples(self.image_window.drawn_vertices)
+        line_width = self.line_width.get()
+        interpolation = InterpolationEnum(self.interpolation.get())
+        match self.chosen_batch.get():
+            case BatchProfileEnum.PARALLEL:
+                offsets = parallel_offsets(self.n_profiles.get(), self.spacing.get())
+                return sample_profiles(
+                    profile_array(self.image_window),
+                    path,
+                    offsets,
+                    line_width,
+                    interpolation,
+                )
+            case BatchProfileEnum.KYMOGRAPH:
+                windows = kymograph_windows(self.image_window)
+                logger.info(f"Kymograph of {len(windows)} images")
+                image_stack = np.stack([profile_array(window) for window in windows])
+                return kymograph(image_stack, path, line_width, interpolation)
+            case _:
+                raise ValueError(f"Unknown batch profile! {self.chosen_batch.get()}")
+
+    def create_image(self) -> None:
+        start = time.perf_counter()
+        try:
+            values = self.sample()
+        except (ValueError, tk.TclError) as e:
+            logger.error(e)
+            return None
+        logger.info(
+            f"Sampled {values.shape[0]} profiles of {values.shape[1]} samples "
+            f"in {time.perf_counter() - start:.3f} s"
+        )
+
+        # 16-bit images give 16-bit profile images, other modes give 8-bit ones
+        is_16bit = self.image_window.mode == ImageModeEnum.GREYSCALE_16
+        image_array = np.clip(
+            np.rint(values),
+            MIN_INTENSITY_LEVEL,
+            MAX_INTENSITY_LEVEL_16 if is_16bit else MAX_INTENSITY_LEVEL,
+        ).astype(np.uint16 if is_16bit else np.uint8)
+        ImageWindow(image_array)
@@ -1,13 +1,18 @@
 import tkinter as tk
 from dataclasses import asdict
-from typing import Callable
+from typing import Any, Callable
 
+import cv2
 import numpy as np
-from PIL import Image
 
+from imagepy.lab_project.predicate_compiler import ARGUMENT_NAMES, compile_predicate
+from imagepy.utils.border_fill import BorderFill
 from imagepy.utils.constants import ImageModeEnum, LogicFilterEnum
 from imagepy.utils.gui.widgets import BorderFillWidget
+from imagepy.utils.image_buffer import ImageBuffer
 from imagepy.utils.image_manager import ImageWindow
+from imagepy.utils.jobs import run_job
+from imagepy.utils.packed_binary import PackedBinaryImage, apply_truth_table
 
 
 def logic_filter(image_window: ImageWindow | None) -> None:
@@ -20,28 +25,69 @@ def logic_filter(image_window: ImageWindow | None) -> None:
     LogicFiltersWidget(image_window)
 
 
+# filter formula applied to whole arrays of neighbours: a - top, b - left, c - right, d - bottom, x - centre
+NeighbourhoodPredicate = Callable[
+    [np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray], np.ndarray
+]
+
+# user filters added with register_logic_filter, listed after the built-in ones
+custom_logic_filters: dict[str, NeighbourhoodPredicate] = {}
+
+
+def register_logic_filter(
+    name: str, predicate: Callable[[int, int, int, int, int], Any]
+) -> None:
+    """
+    Adds filter written as a scalar formula, i.e. `lambda a, b, c, d, x: a if a == d else x`,
+    to the logic filters widget. The formula is compiled to array code once, here.
+
+    :param name: name shown in filter type menu
+    :param predicate: function of top, left, right, bottom and centre pixel values returning new centre value
+    """
+    if name in set(LogicFilterEnum):
+        raise ValueError(f"Logic filter name is already used! {name}")
+    custom_logic_filters[name] = compile_predicate(predicate)
+
+
+def truth_table(predicate: NeighbourhoodPredicate) -> np.ndarray:
+    """
+    Values of the predicate for every combination of binary neighbours,
+    bits of the index from the lowest one are a, b, c, d and x.
+    """
+    combinations = np.arange(2 ** len(ARGUMENT_NAMES))[:, None] >> np.arange(
+        len(ARGUMENT_NAMES)
+    )
+    neighbours = (combinations & 1).astype(np.uint8).T
+    return np.broadcast_to(
+        np.asarray(predicate(*neighbours)) != 0, (len(combinations),)
+    )
+
+
 class LogicFiltersWidget(tk.Toplevel):
-    # define filter formulas for each type
-    predicates_per_filter_type = {
-        LogicFilterEnum.HORIZONTAL: lambda a, b, c, d, x: a if a == d else x,
-        LogicFilterEnum.VERTICAL: lambda a, b, c, d, x: b if b == c else x,
-        LogicFilterEnum.ISOLATED_POINTS: lambda a, b, c, d, x: (
-            a if a == b == c == d else x
-        ),
+    # define filter formulas for each type, they are compiled to array code
+    predicates_per_filter_type: dict[LogicFilterEnum, NeighbourhoodPredicate] = {
+        filter_type: compile_predicate(predicate, strict=True)
+        for filter_type, predicate in {
+            LogicFilterEnum.HORIZONTAL: lambda a, b, c, d, x: a if a == d else x,
+            LogicFilterEnum.VERTICAL: lambda a, b, c, d, x: b if b == c else x,
+            LogicFilterEnum.ISOLATED_POINTS: lambda a, b, c, d, x: (
+                a if a == b == c == d else x
+            ),
+        }.items()
     }
 
     def __init__(self, source_window: ImageWindow):
         super(LogicFiltersWidget, self).__init__()
         self.title(source_window.window_title)
         self.image_window = source_window
-        self.image = source_window.image
+        self.buffer = source_window.buffer
         self.geometry("300x250")
         self.pack_propagate(False)
         self.widget_frame: tk.Frame = tk.Frame(self)
 
         # UI for choosing logic filter
         tk.Label(self.widget_frame, text="Choose filter type:").pack()
-        options = [p.value for p in LogicFilterEnum]
+        options = [p.value for p in LogicFilterEnum] + list(custom_logic_filters)
         self.chosen_filter = tk.StringVar(value=options[0])
         tk.OptionMenu(self.widget_frame, self.chosen_filter, *options).pack()
 
@@ -58,46 +104,88 @@ class LogicFiltersWidget(tk.Toplevel):
         """
         Resets image to previous state.
         """
-        self.image_window.update_image(self.image)
+        self.image_window.reset_buffer(self.buffer, self)
 
     def update_image(self) -> None:
-        image_array = np.array(self.image)
-
-        modified_image_array = self.border_widget.apply_border_fill(
-            image_array=image_array.astype(int),
-            pad_size=1,
-            filter_operation=self.run_filter,
-            func=self.predicates_per_filter_type.get(
-                LogicFilterEnum(self.chosen_filter.get())
+        packed = self.buffer.packed
+        border = self.border_widget.get()
+        predicate = self.get_predicate(self.chosen_filter.get())
+
+        run_job(
+            "Logic filter",
+            lambda _token: self.run_packed_filter(packed, predicate, border),
+            lambda result: self.image_window.update_buffer(
+                ImageBuffer(result), source=self
             ),
+            owner=self.image_window,
+        )
+
+    def get_predicate(self, filter_name: str) -> NeighbourhoodPredicate:
+        if filter_name in custom_logic_filters:
+            return custom_logic_filters[filter_name]
+        return self.predicates_per_filter_type[LogicFilterEnum(filter_name)]
+
+    @staticmethod
+    def run_packed_filter(
+        image: PackedBinaryImage, func: NeighbourhoodPredicate, border: BorderFill
+    ) -> PackedBinaryImage:
+        """
+        Same filter as `run_filter` with `border_fill`, evaluated on packed words. The formula is turned into
+        its truth table over binary neighbours, so any formula costs a few word operations per 8 pixels.
+        Neighbours beyond the image edges come from the border fill. Constant fill applied after filtering
+        sets the outermost rows and columns, which lack neighbours, to the constant.
+
+        :param image: binary image to filter
+        :param func: function to apply, non-zero results are foreground
+        :param border: border fill, non-zero constants are foreground
+        :return: filtered image
+        """
+        border_type = border[0]
+        constant = len(border) == 2 and bool(border[1])
+        # neighbours in a, b, c, d order with the edge pixel of the image and the one across it
+        offsets = (
+            (-1, 0, image.row(0), image.row(image.height - 1)),
+            (0, -1, image.column(0), image.column(image.width - 1)),
+            (0, 1, image.column(image.width - 1), image.column(0)),
+            (1, 0, image.row(image.height - 1), image.row(0)),
         )
-        modified_image = Image.fromarray(modified_image_array.astype(bool))
-        self.image_window.update_image(modified_image)
+        neighbours = []
+        for dy, dx, reflected, wrapped in offsets:
+            edge: np.ndarray | bool
+            match border_type:
+                case cv2.BORDER_REFLECT:
+                    edge = reflected
+                case cv2.BORDER_WRAP:
+                    edge = wrapped
+                case _:
+                    edge = constant
+            neighbours.append(image.neighbour(dy, dx, edge))
+        result = apply_truth_table([*neighbours, image], truth_table(func))
+        if border_type is None:
+            return result.with_frame(constant)
+        return result
 
     @staticmethod
-    def run_filter(
-        image_array: np.ndarray, func: Callable[[int, int, int, int, int], int]
-    ) -> np.ndarray:
+    def run_filter(image_array: np.ndarray, func: NeighbourhoodPredicate) -> np.ndarray:
         """
-        Filter method operating on neighbouring pixels.
+        Filter method operating on neighbouring pixels. Neighbours are passed to `func` as shifted views
+        of the whole array, so the formula is evaluated once for all pixels.
+        Pixels in the outermost rows and columns lack some neighbours and are not changed,
+        border fill modes pad the image beforehand so that the original image has all neighbours.
 
         :param image_array: image array to filter
         :param func: function to apply. One from LogicFiltersWidget.predicates_per_filter_type
         :return: filtered image array
         """
-        target_array = np.copy(
-            image_array
-        )  # array copy is needed to prevent cascade pixel changing
-        for (row, col), val in np.ndenumerate(image_array):
-            try:
-                target_array[row][col] = func(
-                    image_array[row - 1][col],
-                    image_array[row][col - 1],
-                    image_array[row][col + 1],
-                    image_array[row + 1][col],
-                    image_array[row][col],
-                )
-            except IndexError:  # if index is out of bounds element will not be changed
-                pass
-
+        target_array = np.copy(image_array)
+        if min(image_array.shape) < 3:
+            return target_array
+
+        target_array[1:-1, 1:-1] = func(
+            image_array[:-2, 1:-1],
+            image_array[1:-1, :-2],
+            image_array[1:-1, 2:],
+            image_array[2:, 1:-1],
+            image_array[1:-1, 1:-1],
+        )
         return target_array
@@ -0,0 +1,122 @@
+import logging
+import tkinter as tk
+
+import numpy as np
+
+from imagepy.lab_project.neighbourhood_lut import (
+    apply_lut,
+    guo_hall_luts,
+    hit_or_miss_lut,
+    iterate_luts,
+    parse_templates,
+    removal_lut,
+    template_rotations,
+    zhang_suen_luts,
+)
+from imagepy.pipeline.pipeline import PipelineStep
+from imagepy.utils.constants import ImageModeEnum, LutFilterEnum
+from imagepy.utils.image_manager import ImageWindow
+from imagepy.utils.jobs import CancellationToken, run_job
+
+logger = logging.getLogger(__name__)
+
+
+def lut_filter(image_window: ImageWindow | None) -> None:
+    """
+    Entry function checking prerequisites for neighbourhood LUT filter functionality.
+    :param image_window: selected image window
+    """
+    if not image_window or image_window.mode != ImageModeEnum.BINARY:
+        return None
+    LutFiltersWidget(image_window)
+
+
+class LutFiltersWidget(tk.Toplevel):
+    def __init__(self, source_window: ImageWindow):
+        super(LutFiltersWidget, self).__init__()
+        self.title(source_window.window_title)
+        self.image_window = source_window
+        self.buffer = source_window.buffer
+        self.geometry("350x250")
+        self.pack_propagate(False)
+        self.widget_frame: tk.Frame = tk.Frame(self)
+
+        tk.Label(self.widget_frame, text="Choose filter type:").pack()
+        options = [p.value for p in LutFilterEnum]
+        self.chosen_filter = tk.StringVar(value=options[0])
+        tk.OptionMenu(self.widget_frame, self.chosen_filter, *options).pack()
+
+        # templates are used only by hit-or-miss based filters, "x" marks pixels which are not checked
+        tk.Label(self.widget_frame, text="Templates (rows ';', templates '|'):").pack()
+        self.templates_entry = tk.Entry(self.widget_frame, width=40)
+        self.templates_entry.insert(tk.END, "0 0 0; x 1 x; 1 1 1 | x 0 0; 1 1 0; x 1 x")
+        self.templates_entry.pack()
+        self.use_rotations = tk.BooleanVar(value=True)
+        tk.Checkbutton(
+            self.widget_frame, text="Include rotations", variable=self.use_rotations
+        ).pack()
+
+        tk.Button(self.widget_frame, text="Reset", command=self.reset_image).pack()
+        tk.Button(self.widget_frame, text="Apply", command=self.update_image).pack()
+
+        self.widget_frame.pack()
+
+    def reset_image(self) -> None:
+        """
+        Resets image to previous state.
+        """
+        self.image_window.reset_buffer(self.buffer, self)
+
+    def get_templates(self) -> list[np.ndarray]:
+        templates = parse_templates(self.templates_entry.get())
+        if self.use_rotations.get():
+            templates = [
+                rotation
+                for template in templates
+                for rotation in template_rotations(template)
+            ]
+        return templates
+
+    def update_image(self) -> None:
+        image_array = self.buffer.array
+        chosen_filter = LutFilterEnum(self.chosen_filter.get())
+        try:
+            templates = (
+                self.get_templates()
+                if chosen_filter
+                in (LutFilterEnum.HIT_OR_MISS, LutFilterEnum.REMOVE_MATCHES)
+                else []
+            )
+        except ValueError as e:
+            logger.error(e)
+            return None
+
+        def run(_token: CancellationToken) -> np.ndarray:
+            match chosen_filter:
+                case LutFilterEnum.ZHANG_SUEN:
+                    result, _ = iterate_luts(image_array, zhang_suen_luts())
+                case LutFilterEnum.GUO_HALL:
+                    result, _ = iterate_luts(image_array, guo_hall_luts())
+                case LutFilterEnum.HIT_OR_MISS:
+                    result = apply_lut(image_array, hit_or_miss_lut(templates))
+                case LutFilterEnum.REMOVE_MATCHES:
+                    # every template is its own sub-iteration, like in sequential thinning
+                    luts = [
+                        removal_lut(hit_or_miss_lut([template]))
+                        for template in templates
+                    ]
+                    result, _ = iterate_luts(image_array, luts)
+            return result
+
+        step = None
+        match chosen_filter:
+            case LutFilterEnum.ZHANG_SUEN:
+                step = PipelineStep("thinning", {"method": "zhang_suen"})
+            case LutFilterEnum.GUO_HALL:
+                step = PipelineStep("thinning", {"method": "guo_hall"})
+        run_job(
+            "LUT filter",
+            run,
+            lambda result: self.image_window.update_array(result, step, self),
+            owner=self.image_window,
+        )
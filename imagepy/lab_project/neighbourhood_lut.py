@@ -0,0 +1,262 @@
+import logging
+from typing import Callable, Final, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# (dy, dx) of every 3x3 neighbour in raster order, neighbour k sets bit k of the neighbourhood code
+NEIGHBOUR_OFFSETS: Final = tuple((dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1))
+CENTRE_BIT: Final = 4
+LUT_SIZE: Final = 2 ** len(NEIGHBOUR_OFFSETS)
+# template value meaning that the pixel may be either foreground or background
+DONT_CARE: Final = -1
+
+# value of every neighbour for every code, shape (LUT_SIZE, 3, 3)
+CODE_NEIGHBOURHOODS: Final = (
+    ((np.arange(LUT_SIZE)[:, None] >> np.arange(len(NEIGHBOUR_OFFSETS))) & 1)
+    .astype(bool)
+    .reshape(LUT_SIZE, 3, 3)
+)
+
+NeighbourhoodRule = Callable[[np.ndarray], np.ndarray]
+
+
+def neighbourhood_codes(
+    image_array: np.ndarray, rows: np.ndarray | None = None, border_value: bool = False
+) -> np.ndarray:
+    """
+    Encodes 3x3 neighbourhood of every pixel as a 9-bit code built from shifted views of the image.
+
+    :param image_array: 2D binary array, non-zero values are foreground
+    :param rows: indices of rows to encode, all rows by default
+    :param border_value: value of pixels outside of the image
+    :return: uint16 array of codes, one row per requested row
+    """
+    height, width = image_array.shape
+    if rows is None:
+        rows = np.arange(height)
+
+    # 3-bit codes of (left, centre, right) pixels, computed once for every row taking part
+    needed = np.unique(np.concatenate([rows - 1, rows, rows + 1]))
+    needed = needed[(needed >= 0) & (needed < height)]
+    padded = np.pad(
+        image_array[needed] != 0, ((0, 0), (1, 1)), constant_values=border_value
+    ).astype(np.uint16)
+    row_codes = padded[:, :-2] | padded[:, 1:-1] << 1 | padded[:, 2:] << 2
+    # rows outside of the image point to an extra row filled with the border value
+    outside_code = 0b111 if border_value else 0
+    row_codes = np.vstack(
+        [row_codes, np.full((1, width), outside_code, dtype=np.uint16)]
+    )
+
+    def row_index(source: np.ndarray) -> np.ndarray:
+        inside = (source >= 0) & (source < height)
+        return np.where(inside, np.searchsorted(needed, source), len(needed))
+
+    codes: np.ndarray = row_codes[row_index(rows - 1)]
+    codes |= row_codes[row_index(rows)] << 3
+    codes |= row_codes[row_index(rows + 1)] << 6
+    return codes
+
+
+def apply_lut(
+    image_array: np.ndarray, lut: np.ndarray, border_value: bool = False
+) -> np.ndarray:
+    """
+    Sets every pixel to the LUT value of its neighbourhood code.
+
+    :param image_array: 2D binary array
+    :param lut: bool array of LUT_SIZE values
+    :param border_value: value of pixels outside of the image
+    :return: bool array
+    """
+    return lut[neighbourhood_codes(image_array, border_value=border_value)]
+
+
+def lut_from_rule(rule: NeighbourhoodRule) -> np.ndarray:
+    """
+    Builds LUT from a rule evaluated once for all 512 neighbourhoods.
+
+    :param rule: function taking bool array of shape (n, 3, 3) and returning n new centre values
+    :return: bool LUT
+    """
+    lut = np.asarray(rule(CODE_NEIGHBOURHOODS), dtype=bool)
+    if lut.shape != (LUT_SIZE,):
+        raise ValueError(f"Rule has to return one value per neighbourhood! {lut.shape}")
+    return lut
+
+
+def hit_or_miss_lut(templates: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    LUT marking pixels whose neighbourhood matches any of the templates.
+
+    :param templates: 3x3 arrays of 1 (foreground), 0 (background) and DONT_CARE values
+    :return: bool LUT
+    """
+    lut = np.zeros(LUT_SIZE, dtype=bool)
+    for template in templates:
+        template = np.asarray(template)
+        if template.shape != (3, 3):
+            raise ValueError(f"Template has to be 3x3! {template.shape}")
+        care = template != DONT_CARE
+        lut |= np.all((CODE_NEIGHBOURHOODS == (template == 1)) | ~care, axis=(1, 2))
+    return lut
+
+
+def template_rotations(template: np.ndarray) -> list[np.ndarray]:
+    """
+    Template rotated by 0, 90, 180 and 270 degrees, without duplicates.
+    """
+    rotations: list[np.ndarray] = []
+    for k in range(4):
+        rotated = np.rot90(template, k)
+        if not any(np.array_equal(rotated, other) for other in rotations):
+            rotations.append(rotated)
+    return rotations
+
+
+def parse_templates(templates_text: str) -> list[np.ndarray]:
+    """
+    Parses templates written as rows separated by semicolons, templates separated by "|",
+    i.e. "x 1 x; 0 1 0; 0 0 0 | 1 x x; x 1 x; x x 1". "x" marks pixels which are not checked.
+
+    :param templates_text: templates typed by user
+    :return: 3x3 template arrays
+    """
+    templates = []
+    for template_text in templates_text.split("|"):
+        rows = [row.split() for row in template_text.split(";") if row.strip()]
+        template = np.array(
+            [
+                [DONT_CARE if value == "x" else int(bool(int(value))) for value in row]
+                for row in rows
+            ]
+        )
+        if template.shape != (3, 3):
+            raise ValueError(f"Template has to be 3x3! {template_text}")
+        templates.append(template)
+    return templates
+
+
+def removal_lut(match_lut: np.ndarray) -> np.ndarray:
+    """
+    LUT which removes foreground pixels whose neighbourhood is marked by `match_lut`.
+    """
+    centre = (np.arange(LUT_SIZE) >> CENTRE_BIT & 1).astype(bool)
+    return centre & ~match_lut
+
+
+def _compass_neighbours(
+    neighbourhoods: np.ndarray,
+) -> tuple[np.ndarray, ...]:
+    """
+    Neighbours P2..P9 in the usual thinning notation: clockwise starting at north.
+    """
+    n = neighbourhoods.astype(np.int8)
+    return (
+        n[:, 0, 1],
+        n[:, 0, 2],
+        n[:, 1, 2],
+        n[:, 2, 2],
+        n[:, 2, 1],
+        n[:, 2, 0],
+        n[:, 1, 0],
+        n[:, 0, 0],
+    )
+
+
+def zhang_suen_luts() -> tuple[np.ndarray, np.ndarray]:
+    """
+    Both sub-iterations of Zhang-Suen thinning as LUTs giving the new pixel value.
+    """
+    p2, p3, p4, p5, p6, p7, p8, p9 = _compass_neighbours(CODE_NEIGHBOURHOODS)
+    sequence = (p2, p3, p4, p5, p6, p7, p8, p9, p2)
+    transitions = sum(
+        (first == 0) & (second == 1) for first, second in zip(sequence, sequence[1:])
+    )
+    foreground_neighbours = p2 + p3 + p4 + p5 + p6 + p7 + p8 + p9
+    common = (
+        (transitions == 1) & (foreground_neighbours >= 2) & (foreground_neighbours <= 6)
+    )
+    first = common & (p2 * p4 * p6 == 0) & (p4 * p6 * p8 == 0)
+    second = common & (p2 * p4 * p8 == 0) & (p2 * p6 * p8 == 0)
+    return removal_lut(first), removal_lut(second)
+
+
+def guo_hall_luts() -> tuple[np.ndarray, np.ndarray]:
+    """
+    Both sub-iterations of Guo-Hall thinning as LUTs giving the new pixel value.
+    """
+    p2, p3, p4, p5, p6, p7, p8, p9 = _compass_neighbours(CODE_NEIGHBOURHOODS)
+    connectivity = (
+        ((1 - p2) & (p3 | p4))
+        + ((1 - p4) & (p5 | p6))
+        + ((1 - p6) & (p7 | p8))
+        + ((1 - p8) & (p9 | p2))
+    )
+    n1 = (p9 | p2) + (p3 | p4) + (p5 | p6) + (p7 | p8)
+    n2 = (p2 | p3) + (p4 | p5) + (p6 | p7) + (p8 | p9)
+    n = np.minimum(n1, n2)
+    common = (connectivity == 1) & (n >= 2) & (n <= 3)
+    first = common & (((p6 | p7 | (1 - p9)) & p8) == 0)
+    second = common & (((p2 | p3 | (1 - p5)) & p4) == 0)
+    return removal_lut(first), removal_lut(second)
+
+
+def iterate_luts(
+    image_array: np.ndarray,
+    luts: Sequence[np.ndarray],
+    max_iterations: int | None = None,
+    border_value: bool = False,
+) -> tuple[np.ndarray, int]:
+    """
+    Applies LUTs one after another in parallel mode, until a whole cycle changes nothing.
+    Each LUT only re-evaluates rows whose neighbourhood changed since that LUT last ran,
+    so late iterations of thinning touch just a few rows.
+
+    :param image_array: 2D binary array
+    :param luts: LUTs giving new pixel values, applied in order in every iteration
+    :param max_iterations: maximum number of cycles, unlimited by default
+    :param border_value: value of pixels outside of the image
+    :return: bool result array and number of cycles run
+    """
+    result = image_array != 0
+    height = result.shape[0]
+    # rows each LUT has to evaluate again
+    dirty = [np.ones(height, dtype=bool) for _ in luts]
+
+    iterations = 0
+    while any(mask.any() for mask in dirty):
+        if max_iterations is not None and iterations >= max_iterations:
+            break
+        iterations += 1
+        for lut, lut_dirty in zip(luts, dirty):
+            rows = np.flatnonzero(lut_dirty)
+            lut_dirty[:] = False
+            if not len(rows):
+                continue
+
+            new_rows = lut[neighbourhood_codes(result, rows, border_value)]
+            changed = new_rows != result[rows]
+            changed_rows = rows[np.any(changed, axis=1)]
+            if not len(changed_rows):
+                continue
+            result[rows] = new_rows
+
+            touched = np.zeros(height + 2, dtype=bool)
+            for dy in (0, 1, 2):
+                touched[changed_rows + dy] = True
+            for mask in dirty:
+                mask |= touched[1:-1]
+
+    logger.debug(f"LUT iteration finished after {iterations} cycles")
+    return result, iterations
+
+
+def zhang_suen_thinning(image_array: np.ndarray) -> np.ndarray:
+    return iterate_luts(image_array, zhang_suen_luts())[0]
+
+
+def guo_hall_thinning(image_array: np.ndarray) -> np.ndarray:
+    return iterate_luts(image_array, guo_hall_luts())[0]
@@ -1,10 +1,34 @@
+import logging
 import tkinter as tk
+from tkinter import filedialog as fd
 from tkinter.messagebox import showinfo
 
 import numpy as np
 
-from imagepy.utils.constants import MAX_INTENSITY_LEVEL, ImageModeEnum
+from imagepy.lab_project.profile_sampling import (
+    decimate_profile,
+    path_samples,
+    sample_profile,
+    save_profile_csv,
+)
+from imagepy.utils.constants import (
+    MAX_INTENSITY_LEVEL,
+    MAX_INTENSITY_LEVEL_16,
+    FileDialogArgs,
+    ImageModeEnum,
+    InterpolationEnum,
+)
 from imagepy.utils.image_manager import ImageWindow
+from imagepy.utils.packed_binary import PackedBinaryImage
+
+logger = logging.getLogger(__name__)
+
+# widest profile line user can choose, in pixels
+MAX_PROFILE_LINE_WIDTH = 50
+# zooming in stops when this many samples are visible
+MIN_VISIBLE_SAMPLES = 10
+# distance axis grid has at most this many lines, at round distances
+MAX_GRID_LINES = 10
 
 
 def plot_profile(image_window: ImageWindow | None) -> None:
@@ -34,17 +58,34 @@ def show_plot_info() -> None:
         Click to draw another line.
         To erase current lines press RMB.
 2. Select Plot option to generate profile plot.
+    Select Batch profiles to sample parallel profiles or one profile
+    of every open image of the same size (kymograph) into a new image.
+    Choose interpolation and line width, wide lines average parallel profiles.
+    Save CSV writes distance, position and value of every sample.
+    Scroll mouse wheel over the plot to zoom, press RMB to show the whole profile.
 3. To stop drawing and clear image canvas select Clear option.
 """
     showinfo(title="Plot functionality info", message=msg)
 
 
+def grid_step(span: int, max_lines: int) -> int:
+    """
+    Smallest of 1, 2, 5, 10, 20, 50... which divides span into at most max_lines parts.
+    """
+    step = 1
+    while True:
+        for multiplier in (1, 2, 5):
+            if span <= step * multiplier * max_lines:
+                return step * multiplier
+        step *= 10
+
+
 class PlotProfileWidget(tk.Toplevel):
     def __init__(self, source_window: ImageWindow):
         super(PlotProfileWidget, self).__init__()
         self.title(source_window.window_title)
         self.image_window = source_window
-        self.geometry("550x400")
+        self.geometry("550x480")
         self.pack_propagate(False)
         self.widget_frame: tk.Frame = tk.Frame(self)
 
@@ -54,20 +95,41 @@ class PlotProfileWidget(tk.Toplevel):
         self.line_width = 1
         self.checkerboard_size = 50
         self.checkerboard_lines_interval = 5
-        self.checkerboard_lines_size = (
-            self.checkerboard_size // self.checkerboard_lines_interval
-        )
         self.checkerboard_lines_length = 10
         self.legend_canvas_size = 40
-        self.n_points = len(self.image_window.drawn_coords) - 1
+        self.legend_padding = 10
+        self.legend_offset = 5
         self.min_height = self.line_width * 2
         self.max_height = self.plot_height - self.line_width * 2
 
-        self.drawn_coords = self.image_window.drawn_coords
-        self.image_array = np.array(self.image_window.image)
+        # binary images are sampled straight from their packed pixels
+        self.image_array: np.ndarray | PackedBinaryImage = (
+            self.image_window.buffer.packed
+            if self.image_window.mode == ImageModeEnum.BINARY
+            else self.image_window.array
+        )
+        # top of the value axis, 16-bit images are plotted with their whole range
+        self.max_value = (
+            MAX_INTENSITY_LEVEL_16
+            if self.image_window.mode == ImageModeEnum.GREYSCALE_16
+            else MAX_INTENSITY_LEVEL
+        )
+        # pixel values between value grid lines, grid lines are at the same heights for every mode
+        self.value_step = (
+            self.checkerboard_size * (self.max_value + 1) // (MAX_INTENSITY_LEVEL + 1)
+        )
+        self.profile_path = path_samples(self.image_window.drawn_vertices)
+        self.profiles: list[np.ndarray] = []
+        # visible range of samples, first index and index after the last one
+        self.view_start = 0
+        self.view_stop = len(self.profile_path)
+
+        self.interpolation = tk.StringVar(value=InterpolationEnum.NEAREST.value)
+        self.profile_line_width = tk.IntVar(value=1)
 
         plot_frame = self.create_plot_frame()
         plot_frame.pack(pady=(10, 0))
+        self.create_options_frame().pack()
         self.widget_frame.pack()
 
         self.pixel_value_var = tk.StringVar()
@@ -78,210 +140,305 @@ class PlotProfileWidget(tk.Toplevel):
         tk.Label(self.widget_frame, textvariable=self.pixel_distance_var).pack()
         tk.Label(self.widget_frame, textvariable=self.pixel_value_var).pack()
 
+    def create_options_frame(self) -> tk.Frame:
+        """
+        Creates frame with sampling options and CSV export button.
+        """
+        frame = tk.Frame(self.widget_frame)
+        tk.Label(frame, text="Interpolation:").grid(column=0, row=0)
+        options = [p.value for p in InterpolationEnum]
+        tk.OptionMenu(
+            frame, self.interpolation, *options, command=lambda _: self.replot()
+        ).grid(column=1, row=0)
+        tk.Label(frame, text="Line width:").grid(column=2, row=0)
+        tk.Spinbox(
+            frame,
+            from_=1,
+            to=MAX_PROFILE_LINE_WIDTH,
+            width=4,
+            textvariable=self.profile_line_width,
+            command=self.replot,
+        ).grid(column=3, row=0)
+        tk.Button(frame, text="Save CSV", command=self.save_profile).grid(
+            column=4, row=0, padx=(10, 0)
+        )
+        return frame
+
+    def sample_profiles(self) -> None:
+        """
+        Samples image along drawn line with currently chosen options.
+        """
+        try:
+            line_width = self.profile_line_width.get()
+        except tk.TclError:
+            # spinbox text is not a number
+            line_width = 1
+        self.profiles = sample_profile(
+            self.image_array,
+            self.profile_path,
+            min(max(line_width, 1), MAX_PROFILE_LINE_WIDTH),
+            InterpolationEnum(self.interpolation.get()),
+        )
+        if isinstance(self.image_array, PackedBinaryImage):
+            # packed pixels are read as 0 and 1, binary images are shown as 0 and 255
+            self.profiles = [profile * MAX_INTENSITY_LEVEL for profile in self.profiles]
+
+    def replot(self) -> None:
+        """
+        Samples profiles again and replaces plotted lines.
+        """
+        self.sample_profiles()
+        self.redraw()
+
+    def redraw(self) -> None:
+        """
+        Draws grid and profiles of currently visible samples.
+        """
+        self.plot_canvas.delete("profile", "grid")
+        self.horizontal_canvas.delete("grid")
+        self.draw_distance_grid(self.plot_canvas, self.horizontal_canvas)
+        match self.image_window.mode:
+            case (
+                ImageModeEnum.BINARY
+                | ImageModeEnum.GREYSCALE
+                | ImageModeEnum.GREYSCALE_16
+            ):
+                self.plot_mono_profile(self.plot_canvas)
+            case ImageModeEnum.COLOR:
+                self.plot_color_profile(self.plot_canvas)
+            case _:
+                raise AttributeError("Not allowed image mode to profile!")
+
+    def save_profile(self) -> None:
+        default_ask_save_params: FileDialogArgs = {
+            "filetypes": (("CSV file", "*.csv"),),
+            "defaultextension": "csv",
+        }
+        save_path = fd.asksaveasfilename(**default_ask_save_params)
+        if not save_path:
+            return None
+
+        channel_names = (
+            ["red", "green", "blue"] if len(self.profiles) > 1 else ["value"]
+        )
+        try:
+            save_profile_csv(save_path, self.profile_path, self.profiles, channel_names)
+        except OSError as e:
+            logger.error(e)
+            return None
+        logger.info(f"Profile of {len(self.profile_path)} samples saved at {save_path}")
+
     def create_plot_frame(self) -> tk.Frame:
         """
         Creates widget_frame containing plot and legend
         """
         frame = tk.Frame(self.widget_frame)
-        horizontal_canvas = tk.Canvas(
+        self.horizontal_canvas = tk.Canvas(
             frame, width=self.plot_width, height=self.legend_canvas_size
         )
         vertical_canvas = tk.Canvas(
             frame, width=self.legend_canvas_size, height=self.plot_height
         )
-        plot_canvas = tk.Canvas(
+        self.plot_canvas = tk.Canvas(
             frame,
             width=self.plot_width,
             height=self.plot_height,
             bg="white",
             cursor="tcross",
         )
-        self.draw_checkerboard(plot_canvas, horizontal_canvas, vertical_canvas)
-        match self.image_window.mode:
-            case ImageModeEnum.BINARY:
-                self.image_array = self.image_array.astype(int) * MAX_INTENSITY_LEVEL
-                self.plot_mono_profile(plot_canvas)
-            case ImageModeEnum.GREYSCALE:
-                self.plot_mono_profile(plot_canvas)
-            case ImageModeEnum.COLOR:
-                self.plot_color_profile(plot_canvas)
-            case _:
-                raise AttributeError("Not allowed image mode to profile!")
+        self.draw_value_grid(self.plot_canvas, vertical_canvas)
+        self.horizontal_canvas.create_text(
+            self.plot_width // 2, self.legend_padding * 3, text="pixel distance"
+        )
+        self.replot()
 
-        plot_canvas.bind("<Motion>", self.set_string_vars)
-        plot_canvas.bind("<Leave>", self.unset_string_vars)
+        self.plot_canvas.bind("<Motion>", self.set_string_vars)
+        self.plot_canvas.bind("<Leave>", self.unset_string_vars)
+        self.plot_canvas.bind("<MouseWheel>", self.zoom)
+        self.plot_canvas.bind("<Button-3>", self.reset_zoom)
 
-        horizontal_canvas.grid(column=1, row=1)
+        self.horizontal_canvas.grid(column=1, row=1)
         vertical_canvas.grid(column=0, row=0)
-        plot_canvas.grid(column=1, row=0)
+        self.plot_canvas.grid(column=1, row=0)
 
         return frame
 
-    def draw_checkerboard(
-        self,
-        canvas: tk.Canvas,
-        horizontal_canvas: tk.Canvas,
-        vertical_canvas: tk.Canvas,
-    ) -> None:
-        def scale_width(size: int) -> int:
-            return size * self.plot_width // self.n_points
-
-        def scale_height(size: int) -> int:
-            return size * self.plot_height // MAX_INTENSITY_LEVEL
-
-        checkerboard_width_scaled = scale_width(self.checkerboard_size)
-        checkerboard_height_scaled = scale_height(self.checkerboard_size)
-        lines_width_interval = (
-            checkerboard_width_scaled // self.checkerboard_lines_interval
-        )
-        lines_height_interval = (
-            checkerboard_height_scaled // self.checkerboard_lines_interval
-        )
-        offset = 5
-        legend_padding = 10
-
-        for ii, i in enumerate(range(0, self.plot_width, checkerboard_width_scaled)):
-            canvas.create_line(i, 0, i, self.plot_height, fill="gray")
-            for j in range(
-                i + lines_width_interval,
-                i + checkerboard_width_scaled - lines_width_interval,
-                lines_width_interval,
-            ):
-                canvas.create_line(
-                    j,
-                    self.plot_height,
-                    j,
-                    self.plot_height - self.checkerboard_lines_length,
-                    fill="gray",
-                )
-            horizontal_canvas.create_text(
-                i + offset, legend_padding, text=ii * self.checkerboard_size
-            )
-
-        horizontal_canvas.create_text(
-            self.plot_width // 2, legend_padding * 3, text="pixel distance"
-        )
-
-        for ii, i in enumerate(
-            range(
-                self.plot_height - checkerboard_height_scaled,
-                0,
-                -checkerboard_height_scaled,
-            )
-        ):
-            canvas.create_line(0, i, self.plot_width, i, fill="gray")
-            for j in range(
-                i + checkerboard_height_scaled - lines_height_interval,
-                i,
-                -lines_height_interval,
-            ):
-                canvas.create_line(0, j, self.checkerboard_lines_length, j, fill="gray")
+    def draw_value_grid(self, canvas: tk.Canvas, vertical_canvas: tk.Canvas) -> None:
+        """
+        Draws pixel value grid, it does not change with zoom.
+        Grid lines and ticks are single zigzag polylines running along plot edges, so only a few canvas items
+        are created.
+        """
+        step = self.value_step * self.plot_height // self.max_value
+        tick_step = step // self.checkerboard_lines_interval
+        lines = list(range(self.plot_height - step, 0, -step))
+        ticks = [
+            y
+            for y in range(self.plot_height, 0, -tick_step)
+            if (self.plot_height - y) % step
+        ]
+
+        grid_coords: list[tuple[float, float]] = []
+        for i, y in enumerate(lines):
+            edges = (0, self.plot_width) if i % 2 == 0 else (self.plot_width, 0)
+            grid_coords += [(edges[0], y), (edges[1], y)]
+        tick_coords: list[tuple[float, float]] = [
+            point
+            for y in ticks
+            for point in ((0, y), (self.checkerboard_lines_length, y), (0, y))
+        ]
+        for coords in (grid_coords, tick_coords):
+            if len(coords) > 1:
+                canvas.create_line(coords, fill="gray")
+
+        for i, y in enumerate(lines):
             vertical_canvas.create_text(
-                self.legend_canvas_size - legend_padding,
-                i + offset,
-                text=(ii + 1) * self.checkerboard_size,
+                self.legend_canvas_size - self.legend_padding,
+                y + self.legend_offset,
+                text=(i + 1) * self.value_step,
             )
 
         # PyCharm inspection does not recognize angle argument
         # noinspection PyArgumentList
         vertical_canvas.create_text(
-            self.legend_canvas_size - legend_padding * 3,
+            self.legend_canvas_size - self.legend_padding * 3,
             self.plot_height // 2,
             text="pixel value",
             angle=90,
         )
 
-    def plot_mono_profile(self, canvas: tk.Canvas) -> None:
+    def draw_distance_grid(
+        self, canvas: tk.Canvas, horizontal_canvas: tk.Canvas
+    ) -> None:
         """
-        Plots profile line for mono pixel values.
-        :param canvas: plot canvas
+        Draws pixel distance grid of the visible range, lines are placed at round distances.
         """
-        for i in range(len(self.drawn_coords[:-1])):
-            current_value = (
-                self.min_height
-                + self.max_height
-                - self.image_array[self.drawn_coords[i + 1]]
-                * self.max_height
-                / MAX_INTENSITY_LEVEL
+        step = grid_step(self.view_stop - self.view_start, MAX_GRID_LINES)
+        tick_step = max(1, step // self.checkerboard_lines_interval)
+        first = -(-self.view_start // tick_step) * tick_step
+
+        distances = np.arange(first, self.view_stop, tick_step)
+        grid_coords: list[tuple[float, float]] = []
+        tick_coords: list[tuple[float, float]] = []
+        for distance, x in zip(distances.tolist(), self.to_plot_x(distances).tolist()):
+            if distance % step:
+                tick_coords += [
+                    (x, self.plot_height),
+                    (x, self.plot_height - self.checkerboard_lines_length),
+                    (x, self.plot_height),
+                ]
+                continue
+            edges = (
+                (0, self.plot_height)
+                if len(grid_coords) % 4 == 0
+                else (self.plot_height, 0)
             )
-            previous_value = (
-                self.min_height
-                + self.max_height
-                - self.image_array[self.drawn_coords[i]]
-                * self.max_height
-                / MAX_INTENSITY_LEVEL
+            grid_coords += [(x, edges[0]), (x, edges[1])]
+            horizontal_canvas.create_text(
+                x + self.legend_offset,
+                self.legend_padding,
+                text=distance,
+                tags="grid",
             )
+        for coords in (grid_coords, tick_coords):
+            if len(coords) > 1:
+                canvas.create_line(coords, fill="gray", tags="grid")
 
-            coord_x = self.plot_width * i / self.n_points
-            canvas.create_line(
-                coord_x,
-                previous_value,
-                self.plot_width * (i + 1) / self.n_points,
-                current_value,
-                width=self.line_width,
-            )
+    def to_plot_x(self, distances: np.ndarray) -> np.ndarray:
+        """
+        Plot x coordinates of samples with given indices.
+        """
+        span = max(1, self.view_stop - 1 - self.view_start)
+        return (distances - self.view_start) * self.plot_width / span
+
+    def zoom(self, event: tk.Event) -> None:
+        """
+        Zooms distance axis two times in or out, keeping the sample under mouse in place.
+
+        :param event: tkinter event provided by bind method, contains mouse x coordinate and wheel delta
+        """
+        n_samples = len(self.profile_path)
+        visible = self.view_stop - self.view_start
+        new_visible = visible // 2 if event.delta > 0 else visible * 2
+        new_visible = min(max(new_visible, MIN_VISIBLE_SAMPLES), n_samples)
+        if new_visible == visible:
+            return None
+
+        anchor = self.view_start + event.x * (visible - 1) / self.plot_width
+        start = round(anchor - event.x * (new_visible - 1) / self.plot_width)
+        self.view_start = min(max(start, 0), n_samples - new_visible)
+        self.view_stop = self.view_start + new_visible
+        self.redraw()
+        self.set_string_vars(event)
+
+    def reset_zoom(self, _event: tk.Event | None = None) -> None:
+        """
+        Shows the whole profile.
+        :param _event: Not used.
+        """
+        self.view_start, self.view_stop = 0, len(self.profile_path)
+        self.redraw()
+
+    def plot_mono_profile(self, canvas: tk.Canvas) -> None:
+        """
+        Plots profile line for mono pixel values.
+        :param canvas: plot canvas
+        """
+        self.plot_line(canvas, self.profiles[0], "black")
 
     def plot_color_profile(self, canvas: tk.Canvas) -> None:
         """
         Plots profile line for each RGB channel.
         :param canvas: plot canvas
         """
-        for j, c in enumerate(["red", "green", "blue"]):
-            for i in range(len(self.drawn_coords[:-1])):
-                current_value = (
-                    self.min_height
-                    + self.max_height
-                    - self.image_array[self.drawn_coords[i + 1]][j]
-                    * self.max_height
-                    / MAX_INTENSITY_LEVEL
-                )
-                previous_value = (
-                    self.min_height
-                    + self.max_height
-                    - self.image_array[self.drawn_coords[i]][j]
-                    * self.max_height
-                    / MAX_INTENSITY_LEVEL
-                )
-
-                coord_x = self.plot_width * i / self.n_points
-                canvas.create_line(
-                    coord_x,
-                    previous_value,
-                    self.plot_width * (i + 1) / self.n_points,
-                    current_value,
-                    width=self.line_width,
-                    fill=c,
-                )
+        for profile, c in zip(self.profiles, ["red", "green", "blue"]):
+            self.plot_line(canvas, profile, c)
+
+    def plot_line(self, canvas: tk.Canvas, profile: np.ndarray, color: str) -> None:
+        """
+        Plots visible part of a single channel profile as one canvas polyline,
+        decimated to the minimum and maximum of samples in every plot column.
+        """
+        positions, values = decimate_profile(
+            profile, self.view_start, self.view_stop, self.plot_width
+        )
+        xs = self.to_plot_x(positions)
+        heights = (
+            self.min_height
+            + self.max_height
+            - values * self.max_height / self.max_value
+        )
+        coords = np.column_stack([xs, heights]).ravel().tolist()
+        if len(coords) < 4:
+            # a single sample is drawn as a horizontal line over the whole plot
+            coords = [0, coords[1], self.plot_width, coords[1]]
+        canvas.create_line(coords, width=self.line_width, fill=color, tags="profile")
 
     def set_string_vars(self, event: tk.Event) -> None:
         """
-        Sets string labels based on mouse position.
+        Sets string labels based on mouse position, values come from full resolution profiles.
 
         :param event: tkinter event provided by bind method. Contains mouse x coordinate as event.x
         """
-        pixel_distance = event.x * self.n_points // self.plot_width
+        span = self.view_stop - 1 - self.view_start
+        pixel_distance = self.view_start + round(event.x * span / self.plot_width)
         self.pixel_distance_var.set(f"Pixel distance: {pixel_distance}")
         self.pixel_value_var.set(f"Pixel value: {self.get_pixel_value(pixel_distance)}")
 
-    def get_pixel_value(self, pixel_distance: int) -> str | int:
+    def get_pixel_value(self, pixel_distance: int) -> str:
         """
         For given pixel distance returns pixel value for mono images
         or formatted string with RGB values for color images
-        :param pixel_distance: pixel distance from line starting point, basically an index of self.drawn_coords
-        :return: formatted string with RGB values or pixel value integer
+        :param pixel_distance: pixel distance from line starting point, basically an index of profile samples
+        :return: formatted string with RGB values or pixel value
         """
-        try:
-            pixel_value = self.image_array[self.drawn_coords[pixel_distance]]
-        except IndexError:
-            pixel_value = "---"  # tkinter detects mouse on boundaries, so it may lead to IndexError, which is ok
-
-        # pixel_value is ndarray if image is RGB
-        if type(pixel_value) == np.ndarray:
-            pixel_value = (
-                f"red {pixel_value[0]}, green {pixel_value[1]}, blue: {pixel_value[2]}"
-            )
+        if not 0 <= pixel_distance < len(self.profile_path):
+            return "---"  # tkinter detects mouse on boundaries, so it may lead to index out of range, which is ok
 
-        return pixel_value
+        values = [f"{profile[pixel_distance]:g}" for profile in self.profiles]
+        if len(values) > 1:
+            return f"red {values[0]}, green {values[1]}, blue: {values[2]}"
+        return values[0]
 
     def unset_string_vars(self, _event: tk.Event | None = None) -> None:
         """
@@ -0,0 +1,314 @@
+import itertools
+import logging
+from typing import Any, Callable, Final
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARGUMENT_NAMES: Final = ("a", "b", "c", "d", "x")
+# predicates with more branches than this are not unrolled into np.where trees
+MAX_PATHS: Final = 256
+# values every compiled predicate is checked with against the original, all combinations are tried
+VERIFICATION_VALUES: Final = (0, 1, 2, 255)
+
+ScalarPredicate = Callable[..., Any]
+ArrayPredicate = Callable[..., np.ndarray]
+
+COMPARISONS: Final = {"==", "!=", "<", "<=", ">", ">="}
+# operators whose Python result differs from NumPy one when applied to bools, i.e. True + True
+ARITHMETIC: Final = {"+", "-", "*", "//", "%"}
+BITWISE: Final = {"&", "|", "^"}
+
+
+class PredicateCompilationError(ValueError):
+    pass
+
+
+class _Path:
+    """
+    Decisions taken at symbolic conditions during one run of the traced predicate.
+    """
+
+    def __init__(self, forced: list[bool]):
+        self.forced = forced
+        self.conditions: list[_Expression] = []
+
+    def decide(self, condition: "_Expression") -> bool:
+        index = len(self.conditions)
+        self.conditions.append(condition)
+        return self.forced[index] if index < len(self.forced) else True
+
+
+class _Expression:
+    """
+    Symbolic value recording operations applied to it as NumPy source code.
+    """
+
+    def __init__(self, source: str, path: _Path, is_bool: bool = False):
+        self.source = source
+        self.path = path
+        self.is_bool = is_bool
+
+    def __bool__(self) -> bool:
+        return self.path.decide(self)
+
+    def __hash__(self) -> int:
+        raise PredicateCompilationError("Neighbour values can not be hashed")
+
+    def __index__(self) -> int:
+        raise PredicateCompilationError("Neighbour values can not be used as indices")
+
+    def __int__(self) -> int:
+        raise PredicateCompilationError("Neighbour values can not be converted to int")
+
+    def __float__(self) -> float:
+        raise PredicateCompilationError(
+            "Neighbour values can not be converted to float"
+        )
+
+    def _binary(
+        self, symbol: str, other: Any, reflected: bool = False
+    ) -> "_Expression":
+        left, right = _source(self, symbol), _source(other, symbol)
+        if reflected:
+            left, right = right, left
+        is_bool = symbol in COMPARISONS or (
+            symbol in BITWISE and self.is_bool and _is_bool(other)
+        )
+        return _Expression(f"({left} {symbol} {right})", self.path, is_bool)
+
+    def __eq__(self, other: Any) -> "_Expression":  # type: ignore[override]
+        return self._binary("==", other)
+
+    def __ne__(self, other: Any) -> "_Expression":  # type: ignore[override]
+        return self._binary("!=", other)
+
+    def __lt__(self, other: Any) -> "_Expression":
+        return self._binary("<", other)
+
+    def __le__(self, other: Any) -> "_Expression":
+        return self._binary("<=", other)
+
+    def __gt__(self, other: Any) -> "_Expression":
+        return self._binary(">", other)
+
+    def __ge__(self, other: Any) -> "_Expression":
+        return self._binary(">=", other)
+
+    def __add__(self, other: Any) -> "_Expression":
+        return self._binary("+", other)
+
+    def __radd__(self, other: Any) -> "_Expression":
+        return self._binary("+", other, reflected=True)
+
+    def __sub__(self, other: Any) -> "_Expression":
+        return self._binary("-", other)
+
+    def __rsub__(self, other: Any) -> "_Expression":
+        return self._binary("-", other, reflected=True)
+
+    def __mul__(self, other: Any) -> "_Expression":
+        return self._binary("*", other)
+
+    def __rmul__(self, other: Any) -> "_Expression":
+        return self._binary("*", other, reflected=True)
+
+    def __floordiv__(self, other: Any) -> "_Expression":
+        return self._binary("//", other)
+
+    def __rfloordiv__(self, other: Any) -> "_Expression":
+        return self._binary("//", other, reflected=True)
+
+    def __mod__(self, other: Any) -> "_Expression":
+        return self._binary("%", other)
+
+    def __rmod__(self, other: Any) -> "_Expression":
+        return self._binary("%", other, reflected=True)
+
+    def __and__(self, other: Any) -> "_Expression":
+        return self._binary("&", other)
+
+    def __rand__(self, other: Any) -> "_Expression":
+        return self._binary("&", other, reflected=True)
+
+    def __or__(self, other: Any) -> "_Expression":
+        return self._binary("|", other)
+
+    def __ror__(self, other: Any) -> "_Expression":
+        return self._binary("|", other, reflected=True)
+
+    def __xor__(self, other: Any) -> "_Expression":
+        return self._binary("^", other)
+
+    def __rxor__(self, other: Any) -> "_Expression":
+        return self._binary("^", other, reflected=True)
+
+    def __neg__(self) -> "_Expression":
+        return _Expression(f"(-{_source(self, '-')})", self.path)
+
+    def __invert__(self) -> "_Expression":
+        return _Expression(f"(~{_source(self, '-')})", self.path)
+
+    def __abs__(self) -> "_Expression":
+        return _Expression(f"np.abs({_source(self, '-')})", self.path)
+
+
+def _is_bool(value: Any) -> bool:
+    if isinstance(value, _Expression):
+        return value.is_bool
+    return isinstance(value, (bool, np.bool_))
+
+
+def _source(value: Any, symbol: str) -> str:
+    """
+    Source code of an operand, bools are widened to ints where Python would treat them as ints.
+    """
+    if isinstance(value, _Expression):
+        if value.is_bool and (symbol in ARITHMETIC or symbol == "-"):
+            return f"{value.source}.astype(np.int64)"
+        return value.source
+    if isinstance(value, (bool, np.bool_)):
+        return str(int(value)) if symbol in ARITHMETIC else str(bool(value))
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return repr(value.item() if isinstance(value, np.generic) else value)
+    raise PredicateCompilationError(f"Unsupported value in predicate! {value!r}")
+
+
+def _condition_source(condition: "_Expression") -> str:
+    return condition.source if condition.is_bool else f"({condition.source} != 0)"
+
+
+def _trace(predicate: ScalarPredicate, forced: list[bool]) -> tuple[Any, _Path]:
+    path = _Path(forced)
+    arguments = [_Expression(name, path) for name in ARGUMENT_NAMES]
+    try:
+        result = predicate(*arguments)
+    except PredicateCompilationError:
+        raise
+    except Exception as e:
+        raise PredicateCompilationError(f"Predicate can not be traced! {e!r}") from e
+    return result, path
+
+
+# np.where call in the unrolled predicate: condition, value if true, value if false
+_Branch = tuple[str, "_Node", "_Node"]
+_Node = str | _Branch
+
+
+def _unroll(predicate: ScalarPredicate, forced: list[bool], paths: list[int]) -> _Node:
+    """
+    Explores both outcomes of every symbolic condition, which gives a tree of np.where calls.
+    """
+    result, path = _trace(predicate, forced)
+    if len(path.conditions) == len(forced):
+        paths[0] += 1
+        if paths[0] > MAX_PATHS:
+            raise PredicateCompilationError(
+                f"Predicate has more than {MAX_PATHS} branches"
+            )
+        return _source(result, "")
+
+    condition = _condition_source(path.conditions[len(forced)])
+    if_true = _unroll(predicate, forced + [True], paths)
+    if_false = _unroll(predicate, forced + [False], paths)
+    if if_true == if_false:
+        return if_true
+    # conditions sharing a branch are joined, so equality chains need a single np.where
+    if isinstance(if_true, tuple) and if_true[2] == if_false:
+        return f"({condition} & {if_true[0]})", if_true[1], if_false
+    if isinstance(if_false, tuple) and if_false[1] == if_true:
+        return f"({condition} | {if_false[0]})", if_true, if_false[2]
+    return condition, if_true, if_false
+
+
+def _render(node: _Node) -> str:
+    if isinstance(node, str):
+        return node
+    condition, if_true, if_false = node
+    return f"np.where({condition}, {_render(if_true)}, {_render(if_false)})"
+
+
+def translate_predicate(predicate: ScalarPredicate) -> str:
+    """
+    Traces scalar predicate `(a, b, c, d, x) -> value` and returns an equivalent NumPy expression.
+
+    :param predicate: function of top, left, right, bottom and centre pixel values
+    :return: expression source using names a, b, c, d, x and np
+    """
+    return _render(_unroll(predicate, [], [0]))
+
+
+def compile_predicate(
+    predicate: ScalarPredicate, strict: bool = False
+) -> ArrayPredicate:
+    """
+    Turns scalar neighbourhood predicate into a function working on whole neighbour arrays.
+    Comparisons, arithmetic, equality chains, `and`/`or`/`not` and conditional expressions are supported.
+    The translation is checked against the original predicate on all combinations of VERIFICATION_VALUES.
+    When the predicate can not be translated, a warning is logged and a slow per-pixel version is returned.
+
+    :param predicate: function of top, left, right, bottom and centre pixel values
+    :param strict: raise PredicateCompilationError instead of falling back
+    :return: function taking five neighbour arrays and returning an array of new centre values
+    """
+    try:
+        source = translate_predicate(predicate)
+        compiled = _build(source)
+        _verify(predicate, compiled)
+    except PredicateCompilationError as e:
+        if strict:
+            raise
+        logger.warning(
+            f"Predicate {getattr(predicate, '__name__', predicate)} could not be vectorized and will run "
+            f"per pixel in Python, which is orders of magnitude slower. Reason: {e}"
+        )
+        return _per_pixel(predicate)
+
+    logger.debug(f"Predicate compiled to: {source}")
+    return compiled
+
+
+def _build(source: str) -> ArrayPredicate:
+    arguments = ", ".join(ARGUMENT_NAMES)
+    code = f"def compiled({arguments}):\n"
+    if any(f" {symbol} " in source for symbol in ARITHMETIC) or any(
+        unary in source for unary in ("(-", "(~", "np.abs")
+    ):
+        # small image dtypes would overflow where Python ints do not
+        code += f"    {arguments} = ({', '.join(f'np.asarray({name}, dtype=np.int64)' for name in ARGUMENT_NAMES)})\n"
+    code += f"    return np.broadcast_to({source}, np.shape(x))\n"
+    namespace: dict[str, Any] = {"np": np}
+    exec(compile(code, "<compiled predicate>", "exec"), namespace)
+    compiled: ArrayPredicate = namespace["compiled"]
+    compiled.__doc__ = source
+    return compiled
+
+
+def _verify(predicate: ScalarPredicate, compiled: ArrayPredicate) -> None:
+    combinations = np.array(
+        list(itertools.product(VERIFICATION_VALUES, repeat=len(ARGUMENT_NAMES))),
+        dtype=np.int64,
+    )
+    with np.errstate(all="ignore"):
+        results = compiled(*combinations.T)
+    for combination, result in zip(combinations.tolist(), results.tolist()):
+        try:
+            expected = predicate(*combination)
+        except Exception:
+            # values the original predicate can not handle are not compared
+            continue
+        if expected != result:
+            raise PredicateCompilationError(
+                f"Translation differs for {dict(zip(ARGUMENT_NAMES, combination))}: "
+                f"{expected} != {result}"
+            )
+
+
+def _per_pixel(predicate: ScalarPredicate) -> ArrayPredicate:
+    vectorized = np.vectorize(predicate, otypes=[np.int64])
+
+    def per_pixel(*neighbours: np.ndarray) -> np.ndarray:
+        return vectorized(*(neighbour.astype(np.int64) for neighbour in neighbours))
+
+    return per_pixel
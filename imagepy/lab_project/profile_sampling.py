@@ -0,0 +1,350 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, Final, Sequence
+
+import cv2
+import numpy as np
+
+from imagepy.utils.constants import InterpolationEnum
+from imagepy.utils.packed_binary import PackedBinaryImage
+
+logger = logging.getLogger(__name__)
+
+# same kernel parameter OpenCV uses for INTER_CUBIC
+CUBIC_A: Final = -0.75
+CSV_SEPARATOR: Final = ";"
+REMAP_MAX_SIZE: Final = 32767
+REMAP_FLAGS: Final = {
+    InterpolationEnum.NEAREST: cv2.INTER_NEAREST,
+    InterpolationEnum.BILINEAR: cv2.INTER_LINEAR,
+    InterpolationEnum.BICUBIC: cv2.INTER_CUBIC,
+}
+
+
+@dataclass
+class ProfilePath:
+    """
+    Sample points of a profile line.
+
+    :param positions: float array of shape (n, 2) with (y, x) position of every sample
+    :param normals: unit vectors (y, x) perpendicular to the line at every sample
+    :param distances: distance of every sample from the line start, measured along the line
+    """
+
+    positions: np.ndarray
+    normals: np.ndarray
+    distances: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+
+def path_samples(
+    vertices: Sequence[tuple[int, int]], spacing: float = 1.0
+) -> ProfilePath:
+    """
+    Samples polyline at equal distances. Positions of all segments are computed at once
+    by looking up the segment each distance falls into.
+
+    :param vertices: (y, x) polyline vertices, at least one
+    :param spacing: distance between neighbouring samples
+    :return: sample points, the first one at the first vertex
+    """
+    if spacing <= 0:
+        raise ValueError(f"Sample spacing has to be positive! {spacing}")
+    points = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        raise ValueError("Profile line needs at least one vertex!")
+
+    segments = np.diff(points, axis=0)
+    lengths = np.hypot(segments[:, 0], segments[:, 1])
+    # repeated vertices would give segments without direction
+    keep = lengths > 0
+    starts, segments, lengths = points[:-1][keep], segments[keep], lengths[keep]
+    if not len(segments):
+        return ProfilePath(
+            positions=points[:1], normals=np.array([[0.0, 1.0]]), distances=np.zeros(1)
+        )
+
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    distances = np.arange(int(cumulative[-1] / spacing) + 1) * spacing
+    index = np.clip(
+        np.searchsorted(cumulative, distances, side="right") - 1, 0, len(segments) - 1
+    )
+    directions = segments / lengths[:, None]
+    along = (distances - cumulative[index])[:, None]
+    return ProfilePath(
+        positions=starts[index] + along * directions[index],
+        normals=np.stack([directions[index, 1], -directions[index, 0]], axis=1),
+        distances=distances,
+    )
+
+
+def interpolate(
+    image_array: np.ndarray | PackedBinaryImage,
+    ys: np.ndarray,
+    xs: np.ndarray,
+    interpolation: InterpolationEnum = InterpolationEnum.NEAREST,
+) -> np.ndarray:
+    """
+    Reads image values at fractional positions, like `map_coordinates`. Only the pixels around requested
+    positions are gathered, so the cost does not depend on image size. Positions outside of the image
+    read the nearest border pixel.
+
+    :param image_array: 2D image array or 3D array with channels last, packed binary images are read
+        without unpacking and give 0 and 1 values
+    :param ys: row positions
+    :param xs: column positions, same shape as ys
+    :param interpolation: nearest, bilinear or bicubic interpolation with OpenCV kernels
+    :return: float64 array of shape ys.shape, plus channel axis for 3D images
+    """
+    height, width = image_array.shape[:2]
+    channels = image_array.shape[2:]
+    read = _pixel_reader(image_array)
+    row_taps, row_weights = _taps(ys, interpolation)
+    column_taps, column_weights = _taps(xs, interpolation)
+    rows = [np.clip(taps, 0, height - 1) for taps in row_taps]
+    columns = [np.clip(taps, 0, width - 1) for taps in column_taps]
+
+    if interpolation == InterpolationEnum.NEAREST:
+        return read(rows[0], columns[0]).astype(np.float64)
+
+    channel_axes = (slice(None),) * ys.ndim + (None,) * len(channels)
+    result = np.zeros(ys.shape + channels, dtype=np.float64)
+    for row, row_weight in zip(rows, row_weights):
+        for column, column_weight in zip(columns, column_weights):
+            weight = (row_weight * column_weight)[channel_axes]
+            result += weight * read(row, column)
+    return result
+
+
+def _pixel_reader(
+    image_array: np.ndarray | PackedBinaryImage,
+) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+    """
+    Function gathering pixels at (row, column) indices.
+    """
+    if isinstance(image_array, PackedBinaryImage):
+        return image_array.take
+    height, width = image_array.shape[:2]
+    flat_image = image_array.reshape(height * width, *image_array.shape[2:])
+    return lambda rows, columns: flat_image[rows * width + columns]
+
+
+def remap(
+    image_array: np.ndarray,
+    ys: np.ndarray,
+    xs: np.ndarray,
+    interpolation: InterpolationEnum = InterpolationEnum.NEAREST,
+) -> np.ndarray:
+    """
+    Same as `interpolate`, but done by `cv2.remap`, which is several times faster for millions of positions.
+    OpenCV rounds positions to 1/32 of a pixel and results to the image dtype,
+    so it is meant for building new images rather than for measuring.
+
+    :param image_array: 2D image array or 3D array with channels last
+    :param ys: 2D array of row positions
+    :param xs: 2D array of column positions, same shape as ys
+    :param interpolation: nearest, bilinear or bicubic interpolation
+    :return: array of shape ys.shape in image dtype, plus channel axis for 3D images
+    """
+    map_y, map_x = ys.astype(np.float32), xs.astype(np.float32)
+    result = np.empty(ys.shape + image_array.shape[2:], dtype=image_array.dtype)
+    # OpenCV does not accept maps with a side longer than REMAP_MAX_SIZE
+    for top in range(0, ys.shape[0], REMAP_MAX_SIZE):
+        for left in range(0, ys.shape[1], REMAP_MAX_SIZE):
+            block = np.s_[top : top + REMAP_MAX_SIZE, left : left + REMAP_MAX_SIZE]
+            result[block] = cv2.remap(
+                image_array,
+                map_x[block],
+                map_y[block],
+                REMAP_FLAGS[interpolation],
+                borderMode=cv2.BORDER_REPLICATE,
+            ).reshape(result[block].shape)
+    return result
+
+
+def _taps(
+    positions: np.ndarray, interpolation: InterpolationEnum
+) -> tuple[list[np.ndarray], list[np.ndarray]]:
+    """
+    Integer pixel indices and weights of every kernel tap along one axis.
+    """
+    match interpolation:
+        case InterpolationEnum.NEAREST:
+            # halves are rounded to even like in OpenCV
+            return [np.rint(positions).astype(np.intp)], [
+                np.ones_like(positions, dtype=np.float64)
+            ]
+        case InterpolationEnum.BILINEAR:
+            base = np.floor(positions)
+            t = positions - base
+            base = base.astype(np.intp)
+            return [base, base + 1], [1 - t, t]
+        case InterpolationEnum.BICUBIC:
+            base = np.floor(positions)
+            t = positions - base
+            base = base.astype(np.intp)
+            w0 = ((CUBIC_A * (t + 1) - 5 * CUBIC_A) * (t + 1) + 8 * CUBIC_A) * (
+                t + 1
+            ) - 4 * CUBIC_A
+            w1 = ((CUBIC_A + 2) * t - (CUBIC_A + 3)) * t * t + 1
+            w2 = ((CUBIC_A + 2) * (1 - t) - (CUBIC_A + 3)) * (1 - t) * (1 - t) + 1
+            return [base - 1, base, base + 1, base + 2], [w0, w1, w2, 1 - w0 - w1 - w2]
+        case _:
+            raise ValueError(f"Unknown interpolation! {interpolation}")
+
+
+def sample_profile(
+    image_array: np.ndarray | PackedBinaryImage,
+    path: ProfilePath,
+    line_width: int = 1,
+    interpolation: InterpolationEnum = InterpolationEnum.NEAREST,
+) -> list[np.ndarray]:
+    """
+    Reads profile values along the path. Wide lines are sampled on `line_width` parallel paths
+    one pixel apart, centred on the drawn line, and averaged.
+
+    :param image_array: 2D image array or 3D array with channels last, or a packed binary image
+    :param path: sample points, see `path_samples`
+    :param line_width: number of averaged parallel paths
+    :param interpolation: interpolation used between pixel centres
+    :return: float64 profile of every channel, one value per sample
+    """
+    ys, xs = _profile_maps(path, np.zeros(1), line_width)
+    values = interpolate(image_array, ys, xs, interpolation).mean(axis=0)
+    if values.ndim == 1:
+        return [values]
+    return [values[:, channel] for channel in range(values.shape[1])]
+
+
+def sample_profiles(
+    image_array: np.ndarray,
+    path: ProfilePath,
+    offsets: Sequence[float] | np.ndarray,
+    line_width: int = 1,
+    interpolation: InterpolationEnum = InterpolationEnum.NEAREST,
+) -> np.ndarray:
+    """
+    Reads profiles along copies of the path shifted along its normals, all of them in one `remap` call.
+
+    :param image_array: 2D image array or 3D array with channels last
+    :param path: sample points, see `path_samples`
+    :param offsets: distance of every profile from the path, positive offsets are to the right of the path
+    :param line_width: number of averaged parallel paths of every profile
+    :param interpolation: interpolation used between pixel centres
+    :return: float32 array of shape (len(offsets), len(path)), plus channel axis for color images
+    """
+    ys, xs = _profile_maps(path, np.asarray(offsets, dtype=np.float32), line_width)
+    values = remap(image_array, ys, xs, interpolation)
+    return _average_width(values, line_width)
+
+
+def kymograph(
+    image_stack: np.ndarray,
+    path: ProfilePath,
+    line_width: int = 1,
+    interpolation: InterpolationEnum = InterpolationEnum.NEAREST,
+) -> np.ndarray:
+    """
+    Reads the same profile from every image of a stack, i.e. every frame of a time-lapse.
+    Sample positions are computed once and reused for all images.
+
+    :param image_stack: array of shape (n_images, height, width), plus channel axis for color images
+    :param path: sample points, see `path_samples`
+    :param line_width: number of averaged parallel paths
+    :param interpolation: interpolation used between pixel centres
+    :return: float32 array of shape (n_images, len(path)), plus channel axis for color images
+    """
+    ys, xs = _profile_maps(path, np.zeros(1, dtype=np.float32), line_width)
+    values = np.stack([remap(image, ys, xs, interpolation) for image in image_stack])
+    return _average_width(values.reshape(-1, *values.shape[2:]), line_width)
+
+
+def parallel_offsets(n_profiles: int, spacing: float) -> np.ndarray:
+    """
+    Offsets of `n_profiles` paths `spacing` pixels apart, centred on the drawn path.
+    """
+    if n_profiles < 1:
+        raise ValueError(f"Number of profiles has to be at least 1! {n_profiles}")
+    return (np.arange(n_profiles) - (n_profiles - 1) / 2) * spacing
+
+
+def _profile_maps(
+    path: ProfilePath, offsets: np.ndarray, line_width: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Row and column positions of shape (len(offsets) * line_width, len(path)) in dtype of offsets,
+    parallel paths of one profile are in consecutive rows.
+    """
+    if line_width < 1:
+        raise ValueError(f"Line width has to be at least 1! {line_width}")
+    width_offsets = np.arange(line_width, dtype=offsets.dtype) - (line_width - 1) / 2
+    shifts = (offsets[:, None] + width_offsets[None, :]).reshape(-1, 1)
+    positions = path.positions.astype(offsets.dtype)
+    normals = path.normals.astype(offsets.dtype)
+    ys = positions[:, 0] + shifts * normals[:, 0]
+    xs = positions[:, 1] + shifts * normals[:, 1]
+    return ys, xs
+
+
+def _average_width(values: np.ndarray, line_width: int) -> np.ndarray:
+    """
+    Averages groups of `line_width` consecutive rows.
+    """
+    grouped = values.reshape(-1, line_width, *values.shape[1:])
+    if line_width == 1:
+        return grouped[:, 0].astype(np.float32)
+    return grouped.mean(axis=1, dtype=np.float32)
+
+
+def decimate_profile(
+    profile: np.ndarray, start: int, stop: int, n_columns: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Reduces visible part of a profile to at most two points per plot column, the minimum and the maximum of
+    samples falling into the column. The polyline through them covers the same plot pixels as the full data.
+
+    :param profile: values of all samples
+    :param start: index of the first visible sample
+    :param stop: index after the last visible sample
+    :param n_columns: plot width in pixels
+    :return: sample positions (may be fractional) and values of polyline points
+    """
+    visible = profile[start:stop]
+    if len(visible) <= 2 * n_columns:
+        return np.arange(start, start + len(visible), dtype=np.float64), visible
+
+    bounds = np.arange(n_columns) * len(visible) // n_columns
+    ends = np.append(bounds[1:], len(visible))
+    mins = np.minimum.reduceat(visible, bounds)
+    maxs = np.maximum.reduceat(visible, bounds)
+    # columns starting near their minimum are rising, so the minimum is drawn first
+    rising = visible[bounds] - mins <= maxs - visible[bounds]
+    values = np.stack(
+        [np.where(rising, mins, maxs), np.where(rising, maxs, mins)], axis=1
+    )
+    positions = start + (bounds + ends - 1) / 2
+    return np.repeat(positions, 2), values.ravel()
+
+
+def save_profile_csv(
+    save_path: str,
+    path: ProfilePath,
+    profiles: Sequence[np.ndarray],
+    channel_names: Sequence[str],
+) -> None:
+    """
+    Writes one row per sample: distance, position and value of every channel.
+    """
+    columns = ("distance", "y", "x", *channel_names)
+    with open(save_path, "w") as file:
+        file.write(f'"sep={CSV_SEPARATOR}"\n')
+        file.write(CSV_SEPARATOR.join(columns) + "\n")
+        # noinspection PyTypeChecker
+        np.savetxt(
+            file,
+            np.column_stack([path.distances, path.positions, *profiles]),
+            fmt=" %1.4f",
+            delimiter=CSV_SEPARATOR,
+        )
@@ -0,0 +1,515 @@
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from imagepy.lab6.measures_export import CSV_SEPARATOR, open_exporter
+from imagepy.lab6.shape_measures import (
+    MEASURE_COLUMNS,
+    MeasureTable,
+    iter_table_chunks,
+    measure_image,
+    table_length,
+)
+from imagepy.pipeline.optimizer import (
+    describe_pipeline,
+    explain_optimization,
+    optimize_pipeline,
+)
+from imagepy.pipeline.out_of_core import (
+    check_out_of_core,
+    open_greyscale_store,
+    run_tiled,
+)
+from imagepy.pipeline.pipeline import Pipeline
+from imagepy.utils.constants import (
+    BATCH_FILES_IN_FLIGHT_PER_WORKER,
+    BATCH_IMAGE_SUFFIXES,
+    BATCH_REPORT_NAME,
+    OUT_OF_CORE_TILE_SIZE,
+    WORKER_START_METHOD,
+    ImageModeEnum,
+    MeasuresFormatEnum,
+    OptimizationLevelEnum,
+)
+from imagepy.utils.image_buffer import ImageBuffer, normalize_image
+from imagepy.utils.tiled_store import measure_store, save_store
+
+logger = logging.getLogger(__name__)
+
+# pipeline of the worker process, sent once by the pool initializer instead of with every file
+_worker_pipeline: Pipeline | None = None
+
+
+@dataclass
+class FileReport:
+    """
+    Outcome and timings of a single processed file.
+    """
+
+    path: str
+    output_path: str
+    error: str | None = None
+    width: int = 0
+    height: int = 0
+    objects: int | None = None
+    load_seconds: float = 0.0
+    save_seconds: float = 0.0
+    step_seconds: list[float] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def process_seconds(self) -> float:
+        return sum(self.step_seconds)
+
+    @property
+    def total_seconds(self) -> float:
+        return self.load_seconds + self.process_seconds + self.save_seconds
+
+
+def iter_input_files(
+    inputs: Iterable[str], suffixes: Sequence[str] = BATCH_IMAGE_SUFFIXES
+) -> Iterator[tuple[Path, Path]]:
+    """
+    Files to process, directories are searched recursively for images. Paths are generated lazily,
+    so huge directories are not listed up front.
+
+    :param inputs: files and directories
+    :param suffixes: image file extensions looked for in directories
+    :return: pairs of file path and its path relative to the output directory, see `result_path`
+    """
+    for input_path in map(Path, inputs):
+        if input_path.is_dir():
+            for root, dirs, files in os.walk(input_path):
+                dirs.sort()
+                for file_name in sorted(files):
+                    path = Path(root, file_name)
+                    if path.suffix.lower() in suffixes:
+                        yield path, path.relative_to(input_path)
+        else:
+            yield input_path, Path(input_path.name)
+
+
+def result_path(output_path: str | Path, output_format: str) -> Path:
+    """
+    Path of a processed image. The source extension is kept, so `x.png` and `x.tif` from one directory
+    give `x.png.png` and `x.tif.png` instead of overwriting each other.
+
+    :param output_path: input path relative to the output directory, joined with it
+    :param output_format: extension of processed images
+    """
+    return Path(f"{output_path}.{output_format}")
+
+
+def _init_worker(pipeline: Pipeline) -> None:
+    global _worker_pipeline
+    _worker_pipeline = pipeline
+
+
+def load_greyscale(path: str | Path) -> np.ndarray:
+    """
+    Loads image as 8-bit greyscale. Modes are first converted the same way as in the GUI, see `normalize_image`.
+    16-bit images are scaled down by dropping their low byte, so the whole 16-bit range maps onto 8 bits
+    the same way in every file, instead of values above 255 being clipped by PIL conversion.
+
+    :raises ValueError: when the image mode is not supported
+    """
+    with Image.open(path) as image:
+        image = normalize_image(image)
+        if image.mode == ImageModeEnum.GREYSCALE_16:
+            return (np.asarray(image) >> 8).astype(np.uint8)
+        if image.mode != ImageModeEnum.GREYSCALE:
+            image = image.convert(ImageModeEnum.GREYSCALE)
+        return np.array(image)
+
+
+def process_file(
+    path: str, output_path: str, pipeline: Pipeline | None = None
+) -> FileReport:
+    """
+    Loads image as 8-bit greyscale, see `load_greyscale`, runs the pipeline and saves the result, with its measures if requested.
+    Only the small report is returned, so no image data goes back to the parent process.
+
+    :param path: input image
+    :param output_path: input path relative to the output directory, joined with it, see `result_path`
+    :param pipeline: pipeline to run, the one given to the worker process by default
+    :return: report, errors are stored in it instead of being raised
+    """
+    pipeline = pipeline or _worker_pipeline
+    assert pipeline is not None
+    output = result_path(output_path, pipeline.output_format)
+    report = FileReport(path, str(output))
+    try:
+        start = time.perf_counter()
+        image_array = load_greyscale(path)
+        report.height, report.width = image_array.shape
+        report.load_seconds = time.perf_counter() - start
+
+        result = pipeline.run(image_array, report.step_seconds)
+
+        start = time.perf_counter()
+        output.parent.mkdir(parents=True, exist_ok=True)
+        ImageBuffer(result).image.save(output)
+        if pipeline.measures:
+            report.objects = export_measures(
+                measure_image(result), output, pipeline.measures
+            )
+        report.save_seconds = time.perf_counter() - start
+    # any failure is recorded for its file only, so it does not abort the whole run
+    except Exception as e:
+        report.error = f"{type(e).__name__}: {e}"
+    return report
+
+
+def process_file_out_of_core(
+    path: str,
+    output_path: str,
+    pipeline: Pipeline,
+    workers: int | None = None,
+    tile_size: int = OUT_OF_CORE_TILE_SIZE,
+) -> FileReport:
+    """
+    Same as `process_file` for images bigger than memory. The image is opened as a store on disk, see
+    `open_greyscale_store`, processed tile by tile, see `run_tiled`, and measured strip by strip
+    in `workers` processes. TIFF results are written without loading them into memory.
+
+    :param path: input image
+    :param output_path: input path relative to the output directory, joined with it, see `result_path`
+    :param pipeline: pipeline to run, see `check_out_of_core`
+    :param workers: number of measuring processes, CPU count by default
+    :param tile_size: side of processed tiles
+    :return: report, errors are stored in it instead of being raised
+    """
+    output = result_path(output_path, pipeline.output_format)
+    report = FileReport(path, str(output))
+    try:
+        start = time.perf_counter()
+        with open_greyscale_store(path, tile_size) as source:
+            report.height, report.width = source.shape
+            report.load_seconds = time.perf_counter() - start
+
+            result = run_tiled(pipeline, source, report.step_seconds, tile_size)
+            try:
+                start = time.perf_counter()
+                output.parent.mkdir(parents=True, exist_ok=True)
+                save_store(result, output, tile_size)
+                if pipeline.measures:
+                    report.objects = export_measures(
+                        measure_store(result, workers), output, pipeline.measures
+                    )
+                report.save_seconds = time.perf_counter() - start
+            finally:
+                if result is not source:
+                    result.close()
+    # any failure is recorded for its file only, so it does not abort the whole run
+    except Exception as e:
+        report.error = f"{type(e).__name__}: {e}"
+    return report
+
+
+def export_measures(
+    table: MeasureTable, output: Path, measures_format: MeasuresFormatEnum
+) -> int:
+    """
+    Writes measures next to the processed image, with the extension of their format.
+
+    :return: number of measured objects
+    """
+    objects = table_length(table)
+    measures_path = output.with_suffix(f".{measures_format}")
+    with open_exporter(str(measures_path), MEASURE_COLUMNS, objects) as exporter:
+        for chunk in iter_table_chunks(table):
+            exporter.write(chunk)
+    return objects
+
+
+def claim_outputs(
+    files: Iterable[tuple[Path, Path]], output_dir: Path
+) -> Iterator[tuple[Path, Path, bool]]:
+    """
+    Joins output paths with the output directory and marks files whose results would overwrite
+    results of an earlier file, e.g. files with the same name given from different directories.
+
+    :return: input path, output path and whether the output path is already taken
+    """
+    outputs: set[Path] = set()
+    for path, relative_path in files:
+        output_path = output_dir / relative_path
+        yield path, output_path, output_path in outputs
+        outputs.add(output_path)
+
+
+def duplicate_report(path: Path, output_path: Path, pipeline: Pipeline) -> FileReport:
+    return FileReport(
+        str(path),
+        str(result_path(output_path, pipeline.output_format)),
+        "Output of an earlier file has the same path",
+    )
+
+
+def run_batch(
+    pipeline: Pipeline,
+    files: Iterable[tuple[Path, Path]],
+    output_dir: str | Path,
+    workers: int | None = None,
+    files_in_flight: int | None = None,
+) -> Iterator[FileReport]:
+    """
+    Runs pipeline on files in a process pool. At most `files_in_flight` files are submitted at once,
+    so memory use does not grow with the number of files. Results are written by the workers.
+    Files whose results would overwrite results of an earlier file, e.g. files with the same name
+    given from different directories, are reported as failed.
+
+    :param pipeline: pipeline to run
+    :param files: pairs of input path and output path relative to `output_dir`, see `iter_input_files`
+    :param output_dir: directory for results
+    :param workers: number of processes, CPU count by default
+    :param files_in_flight: maximum number of submitted, unfinished files
+    :return: reports in order of completion
+    """
+    workers = workers or os.cpu_count() or 1
+    files_in_flight = files_in_flight or workers * BATCH_FILES_IN_FLIGHT_PER_WORKER
+    files_iterator = claim_outputs(files, Path(output_dir))
+
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+        initializer=_init_worker,
+        initargs=(pipeline,),
+    ) as executor:
+        pending: set[Future[FileReport]] = set()
+        while True:
+            for path, output_path, taken in files_iterator:
+                if taken:
+                    yield duplicate_report(path, output_path, pipeline)
+                    continue
+                pending.add(executor.submit(process_file, str(path), str(output_path)))
+                if len(pending) >= files_in_flight:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def run_batch_out_of_core(
+    pipeline: Pipeline,
+    files: Iterable[tuple[Path, Path]],
+    output_dir: str | Path,
+    workers: int | None = None,
+) -> Iterator[FileReport]:
+    """
+    Runs pipeline on images bigger than memory one after another, see `process_file_out_of_core`.
+    Files whose results would overwrite results of an earlier file are reported as failed.
+
+    :param pipeline: pipeline to run, see `check_out_of_core`
+    :param files: pairs of input path and output path relative to `output_dir`, see `iter_input_files`
+    :param output_dir: directory for results
+    :param workers: number of measuring processes, CPU count by default
+    :return: reports in order of files
+    """
+    for path, output_path, taken in claim_outputs(files, Path(output_dir)):
+        if taken:
+            yield duplicate_report(path, output_path, pipeline)
+            continue
+        yield process_file_out_of_core(str(path), str(output_path), pipeline, workers)
+
+
+class TimingReport:
+    """
+    Per-file timing table written row by row as reports arrive, with totals for the summary.
+    """
+
+    def __init__(self, path: str | Path, pipeline: Pipeline):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file, delimiter=CSV_SEPARATOR)
+        self.step_names = [
+            f"step_{i}_{step.operation}" for i, step in enumerate(pipeline.steps)
+        ]
+        self.writer.writerow(
+            [
+                "file",
+                "output",
+                "status",
+                "width",
+                "height",
+                "objects",
+                "load_s",
+                *[f"{name}_s" for name in self.step_names],
+                "save_s",
+                "total_s",
+            ]
+        )
+        self.files = 0
+        self.failed = 0
+        self.pixels = 0
+        self.step_totals = [0.0] * len(self.step_names)
+        self.load_total = 0.0
+        self.save_total = 0.0
+
+    def add(self, report: FileReport) -> None:
+        self.files += 1
+        if report.ok:
+            self.pixels += report.width * report.height
+            self.load_total += report.load_seconds
+            self.save_total += report.save_seconds
+            for i, seconds in enumerate(report.step_seconds):
+                self.step_totals[i] += seconds
+        else:
+            self.failed += 1
+            logger.error(f"{report.path}: {report.error}")
+
+        step_seconds = report.step_seconds + [0.0] * (
+            len(self.step_names) - len(report.step_seconds)
+        )
+        self.writer.writerow(
+            [
+                report.path,
+                report.output_path,
+                "ok" if report.ok else report.error,
+                report.width,
+                report.height,
+                "" if report.objects is None else report.objects,
+                f"{report.load_seconds:.6f}",
+                *[f"{seconds:.6f}" for seconds in step_seconds],
+                f"{report.save_seconds:.6f}",
+                f"{report.total_seconds:.6f}",
+            ]
+        )
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def summary(self, wall_seconds: float) -> str:
+        processed = self.files - self.failed
+        lines = [
+            f"files: {self.files}, ok: {processed}, failed: {self.failed}",
+            f"wall time: {wall_seconds:.2f} s, "
+            f"{self.files / wall_seconds if wall_seconds else 0:.2f} files/s, "
+            f"{self.pixels / 2**20 / wall_seconds if wall_seconds else 0:.1f} MP/s",
+            f"{'stage':<32} {'total [s]':>10} {'per file [ms]':>14}",
+        ]
+        stages = [
+            ("load", self.load_total),
+            *zip(self.step_names, self.step_totals),
+            ("save", self.save_total),
+        ]
+        for name, total in stages:
+            per_file = total / processed * 1000 if processed else 0.0
+            lines.append(f"{name:<32} {total:10.3f} {per_file:14.2f}")
+        return "\n".join(lines)
+
+
+def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="imagepy-batch",
+        description="Runs an ImagePy pipeline on many images in parallel.",
+    )
+    parser.add_argument("pipeline", help="pipeline spec, JSON or TOML file")
+    parser.add_argument("inputs", nargs="+", help="image files or directories")
+    parser.add_argument(
+        "-o", "--output", required=True, help="directory for processed images"
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="number of processes"
+    )
+    parser.add_argument(
+        "--in-flight",
+        type=int,
+        default=None,
+        help="maximum number of files processed at once, "
+        f"{BATCH_FILES_IN_FLIGHT_PER_WORKER} per worker by default",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        help=f"timing report path, {BATCH_REPORT_NAME} in the output directory by default",
+    )
+    parser.add_argument(
+        "--optimize",
+        choices=list(OptimizationLevelEnum),
+        default=OptimizationLevelEnum.EXACT,
+        help="pipeline optimization, exact keeps results the same, "
+        "approximate also combines linear filters, exact by default",
+    )
+    parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="print estimated and measured passes of the original and the optimized pipeline "
+        "on the first input image",
+    )
+    parser.add_argument(
+        "--out-of-core",
+        action="store_true",
+        help="process images bigger than memory one at a time, tile by tile on disk, "
+        "workers measure their strips",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s %(name)s: %(message)s",
+    )
+    try:
+        pipeline = Pipeline.load(args.pipeline)
+        optimized = optimize_pipeline(pipeline, args.optimize)
+        if args.out_of_core:
+            check_out_of_core(optimized)
+    except (OSError, ValueError) as e:
+        logger.error(e)
+        return 2
+    logger.info(f"Pipeline: {pipeline}")
+    if optimized != pipeline:
+        logger.info(f"Optimized pipeline: {describe_pipeline(optimized)}")
+    if args.explain:
+        for path, _ in iter_input_files(args.inputs):
+            try:
+                print(explain_optimization(pipeline, optimized, load_greyscale(path)))
+            except (OSError, ValueError, cv2.error) as e:
+                logger.error(f"{path}: {e}")
+            break
+    pipeline = optimized
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    timing_report = TimingReport(
+        args.report or output_dir / BATCH_REPORT_NAME, pipeline
+    )
+    start = time.perf_counter()
+    try:
+        files = iter_input_files(args.inputs)
+        reports = (
+            run_batch_out_of_core(pipeline, files, output_dir, args.workers)
+            if args.out_of_core
+            else run_batch(pipeline, files, output_dir, args.workers, args.in_flight)
+        )
+        for report in reports:
+            timing_report.add(report)
+    finally:
+        timing_report.close()
+    print(timing_report.summary(time.perf_counter() - start))
+    return 1 if timing_report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,609 @@
+import inspect
+import logging
+import math
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any, Callable, Final, TypeVar
+
+import cv2
+import numpy as np
+
+from imagepy.lab4.filters import blur_filters, sharpen_filters
+from imagepy.lab4.rank_filters import range_filter, rank_filter
+from imagepy.lab6.morphology import StructuringElement, morphology
+from imagepy.lab_project.neighbourhood_lut import guo_hall_thinning, zhang_suen_thinning
+from imagepy.utils.border_fill import border_fill, border_fill_spec
+from imagepy.utils.constants import (
+    MAX_INTENSITY_LEVEL,
+    RANK_FILTER_MAX_SIZE,
+    BinaryOperationEnum,
+    BorderFillEnum,
+    StructuringElementEnum,
+)
+
+logger = logging.getLogger(__name__)
+
+E = TypeVar("E", bound=StrEnum)
+
+LUT_SIZE: Final = MAX_INTENSITY_LEVEL + 1
+# values every pointwise operation maps through its LUT
+LUT_VALUES: Final = np.arange(LUT_SIZE, dtype=np.int64)
+# same limit OpenCV uses to skip empty classes in Otsu threshold
+OTSU_EPSILON: Final = float(np.finfo(np.float32).eps)
+THINNING_METHODS: Final = ("zhang_suen", "guo_hall")
+
+# image_array, **params -> new uint8 image array
+OperationFunction = Callable[..., np.ndarray]
+# histogram (or None), **params -> uint8 array of LUT_SIZE new values
+LutFunction = Callable[..., np.ndarray]
+# **params with defaults filled in -> None, raises ValueError for invalid values
+ValidateFunction = Callable[..., None]
+
+
+@dataclass(frozen=True)
+class Operation:
+    """
+    Headless image operation usable in pipelines. Operations work on 8-bit greyscale arrays,
+    the same images the GUI widgets accept, and always return 8-bit greyscale arrays.
+
+    :param name: name used in pipeline specs
+    :param function: applies the operation to an image array
+    :param lut: for pointwise operations, builds the LUT the operation applies
+    :param uses_histogram: LUT depends on the histogram of the image, i.e. histogram equalization
+    :param validate: checks parameter values, so invalid specs are rejected before any image is processed
+    """
+
+    name: str
+    function: OperationFunction
+    lut: LutFunction | None = None
+    uses_histogram: bool = False
+    validate: ValidateFunction | None = None
+
+    @property
+    def pointwise(self) -> bool:
+        return self.lut is not None
+
+    def check_params(self, params: dict[str, Any]) -> None:
+        """
+        :raises ValueError: when parameters do not match the operation signature or have invalid values
+        """
+        try:
+            arguments = self.arguments(params)
+            if self.validate is not None:
+                self.validate(**arguments)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid parameters of operation {self.name}! {e}")
+
+    def arguments(self, params: dict[str, Any]) -> dict[str, Any]:
+        """
+        Parameters with defaults filled in for the ones left out.
+        """
+        bound = inspect.signature(self.lut or self.function).bind(None, **params)
+        bound.apply_defaults()
+        return dict(list(bound.arguments.items())[1:])
+
+    def __call__(self, image_array: np.ndarray, **params: Any) -> np.ndarray:
+        return self.function(image_array, **params)
+
+
+OPERATIONS: dict[str, Operation] = {}
+
+
+def register_operation(
+    name: str, validate: ValidateFunction | None = None
+) -> Callable[[OperationFunction], OperationFunction]:
+    def decorator(function: OperationFunction) -> OperationFunction:
+        OPERATIONS[name] = Operation(name, function, validate=validate)
+        return function
+
+    return decorator
+
+
+def register_pointwise_operation(
+    name: str, uses_histogram: bool = False, validate: ValidateFunction | None = None
+) -> Callable[[LutFunction], LutFunction]:
+    """
+    Registers operation given by a LUT builder. The LUT gets the image histogram when `uses_histogram` is set.
+    """
+
+    def decorator(lut: LutFunction) -> LutFunction:
+        def function(image_array: np.ndarray, **params: Any) -> np.ndarray:
+            histogram = image_histogram(image_array) if uses_histogram else None
+            return lut(histogram, **params)[image_array]
+
+        OPERATIONS[name] = Operation(name, function, lut, uses_histogram, validate)
+        return lut
+
+    return decorator
+
+
+def get_operation(name: str) -> Operation:
+    try:
+        return OPERATIONS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown operation! {name}, available operations: {', '.join(OPERATIONS)}"
+        )
+
+
+def image_histogram(image_array: np.ndarray) -> np.ndarray:
+    return np.bincount(image_array.ravel(), minlength=LUT_SIZE)
+
+
+def enum_value(enum: type[E], value: str) -> E:
+    """
+    Enum member by value or, ignoring case, by name, so specs may use "open" as well as "Open".
+    """
+    try:
+        return enum(value)
+    except ValueError:
+        pass
+    for member in enum:
+        if member.name.lower() == str(value).lower().replace("-", "_"):
+            return member
+    raise ValueError(f"Unknown {enum.__name__} value! {value}")
+
+
+def _check_int(
+    name: str, value: Any, lower: float = -math.inf, upper: float = math.inf
+) -> None:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"Parameter {name} has to be an integer! {value!r}")
+    _check_number(name, value, lower, upper)
+
+
+def _check_number(
+    name: str, value: Any, lower: float = -math.inf, upper: float = math.inf
+) -> None:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Parameter {name} has to be a number! {value!r}")
+    if not lower <= value <= upper:
+        raise ValueError(
+            f"Parameter {name} has to be in range [{lower}, {upper}]! {value}"
+        )
+
+
+def _check_border(border: str, border_constant: int) -> None:
+    border_fill_spec(border, border_constant)
+    # not limited to 8-bit values, steps are also recorded for 16-bit windows
+    _check_int("border_constant", border_constant)
+
+
+def _check_boundaries(lower: int, upper: int) -> None:
+    _check_int("lower", lower, 0, MAX_INTENSITY_LEVEL)
+    _check_int("upper", upper, 0, MAX_INTENSITY_LEVEL)
+
+
+def _check_kernel(kernel: Any) -> np.ndarray:
+    """
+    :return: kernel as a float array
+    :raises ValueError: when kernel is not a square numeric matrix with odd size
+    """
+    kernel_array = np.asarray(kernel, dtype=np.float64)
+    if (
+        kernel_array.ndim != 2
+        or kernel_array.shape[0] != kernel_array.shape[1]
+        or not kernel_array.shape[0] % 2
+    ):
+        raise ValueError(f"Kernel has to be square with odd size! {kernel_array.shape}")
+    return kernel_array
+
+
+def _to_uint8(lut: np.ndarray) -> np.ndarray:
+    return np.clip(lut, 0, MAX_INTENSITY_LEVEL).astype(np.uint8)
+
+
+@register_pointwise_operation("invert")
+def invert_lut(_histogram: np.ndarray | None) -> np.ndarray:
+    return _to_uint8(MAX_INTENSITY_LEVEL - LUT_VALUES)
+
+
+def _check_gamma(gamma: float) -> None:
+    _check_number("gamma", gamma)
+    if gamma <= 0:
+        raise ValueError(f"Gamma coefficient has to be positive! {gamma}")
+
+
+@register_pointwise_operation("gamma", validate=_check_gamma)
+def gamma_lut(_histogram: np.ndarray | None, gamma: float = 1.0) -> np.ndarray:
+    """
+    Same mapping as `GammaCorrectionWidget`.
+    """
+    _check_gamma(gamma)
+    return _to_uint8(
+        np.round(
+            (LUT_VALUES / MAX_INTENSITY_LEVEL) ** (1 / gamma) * MAX_INTENSITY_LEVEL
+        )
+    )
+
+
+@register_pointwise_operation(
+    "linear_stretch", uses_histogram=True, validate=_check_boundaries
+)
+def linear_stretch_lut(
+    histogram: np.ndarray, lower: int = 0, upper: int = MAX_INTENSITY_LEVEL
+) -> np.ndarray:
+    """
+    Same mapping as `LinearAdjustmentWidget`: the range between the boundaries, clipped to the range
+    of image values, is stretched to the full intensity range.
+    """
+    present = np.flatnonzero(histogram)
+    if not len(present):
+        return _to_uint8(LUT_VALUES)
+    min_out = max(lower, int(present[0]))
+    max_out = min(upper, int(present[-1]))
+    if max_out == min_out:
+        stretched = LUT_VALUES
+    else:
+        stretched = np.round(
+            (LUT_VALUES - min_out) * (MAX_INTENSITY_LEVEL / (max_out - min_out))
+        )
+    lut = np.where(LUT_VALUES < min_out, 0, stretched)
+    return _to_uint8(np.where(LUT_VALUES > max_out, MAX_INTENSITY_LEVEL, lut))
+
+
+@register_pointwise_operation("equalize", uses_histogram=True)
+def equalize_lut(histogram: np.ndarray) -> np.ndarray:
+    """
+    Same mapping as `histogram_equalization`. Images with a single value are left as they are.
+    """
+    cumulative = np.cumsum(histogram)
+    total = int(cumulative[-1])
+    present = cumulative[cumulative > 0]
+    if not len(present) or int(present[0]) == total:
+        return _to_uint8(LUT_VALUES)
+    cumulative_min = int(present[0])
+    return _to_uint8(
+        (cumulative - cumulative_min) * MAX_INTENSITY_LEVEL // (total - cumulative_min)
+    )
+
+
+def _check_threshold(lower: int, upper: int, binary: bool) -> None:
+    _check_boundaries(lower, upper)
+    if not isinstance(binary, bool):
+        raise ValueError(f"Parameter binary has to be a boolean! {binary!r}")
+
+
+@register_pointwise_operation("threshold", validate=_check_threshold)
+def threshold_lut(
+    _histogram: np.ndarray | None,
+    lower: int = 0,
+    upper: int = MAX_INTENSITY_LEVEL,
+    binary: bool = False,
+) -> np.ndarray:
+    """
+    Same mapping as `ThresholdWidget`: values between the boundaries are kept, or set to maximum
+    for binary threshold, other values are set to zero.
+    """
+    inside = (LUT_VALUES >= lower) & (LUT_VALUES <= upper)
+    return _to_uint8(np.where(inside, MAX_INTENSITY_LEVEL if binary else LUT_VALUES, 0))
+
+
+def otsu_level(histogram: np.ndarray) -> int:
+    """
+    Otsu threshold computed from a histogram, picks the same level as `cv2.THRESH_OTSU`.
+    """
+    probabilities = histogram / max(int(histogram.sum()), 1)
+    q1 = np.cumsum(probabilities)
+    q2 = 1 - q1
+    mu = np.cumsum(probabilities * LUT_VALUES)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mu1 = mu / q1
+        mu2 = (mu[-1] - mu) / q2
+        sigma = q1 * q2 * (mu1 - mu2) ** 2
+    valid = (np.minimum(q1, q2) >= OTSU_EPSILON) & (
+        np.maximum(q1, q2) <= 1 - OTSU_EPSILON
+    )
+    sigma = np.where(valid, sigma, 0.0)
+    return int(np.argmax(sigma)) if sigma.any() else 0
+
+
+@register_pointwise_operation("otsu_threshold", uses_histogram=True)
+def otsu_threshold_lut(histogram: np.ndarray) -> np.ndarray:
+    """
+    Binary threshold with the lower boundary picked by Otsu method, like the button of `ThresholdWidget`.
+    """
+    return threshold_lut(histogram, otsu_level(histogram), MAX_INTENSITY_LEVEL, True)
+
+
+def _check_adaptive_threshold(block_size: int, c: float) -> None:
+    _check_int("block_size", block_size, 3)
+    if not block_size % 2:
+        raise ValueError(f"Parameter block_size has to be odd! {block_size}")
+    _check_number("c", c)
+
+
+@register_operation("adaptive_threshold", validate=_check_adaptive_threshold)
+def adaptive_threshold(
+    image_array: np.ndarray, block_size: int = 11, c: float = 2
+) -> np.ndarray:
+    return cv2.adaptiveThreshold(
+        image_array,
+        MAX_INTENSITY_LEVEL,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY,
+        block_size,
+        c,
+    )
+
+
+def _check_convolve(kernel: Any, border: str, border_constant: int) -> None:
+    _check_kernel(kernel)
+    _check_border(border, border_constant)
+
+
+@register_operation("convolve", validate=_check_convolve)
+def convolve(
+    image_array: np.ndarray,
+    kernel: list[list[float]],
+    border: str = BorderFillEnum.CONSTANT,
+    border_constant: int = 0,
+) -> np.ndarray:
+    """
+    Linear filter with a square kernel of odd size, same as the filter widgets.
+    """
+    kernel_array = _check_kernel(kernel)
+    pad_size = (kernel_array.shape[0] - 1) // 2
+    result = border_fill(
+        image_array,
+        pad_size,
+        border_fill_spec(border, border_constant),
+        cv2.filter2D,
+        ddepth=-1,
+        kernel=kernel_array,
+    )
+    return result.astype(np.uint8, copy=False)
+
+
+def blur_kernel(kernel: int = 0, weight: int = 8) -> np.ndarray:
+    """
+    Normalized kernel of `BlurWidget`.
+
+    :param kernel: index of the kernel in `blur_filters`
+    :param weight: centre weight of the kernel with index 1
+    """
+    kernel_array = np.array(blur_filters[kernel], dtype=np.float64)
+    if kernel == 1:
+        kernel_array[1, 1] = weight
+    kernel_sum = kernel_array.sum()
+    return kernel_array / kernel_sum if kernel_sum else kernel_array
+
+
+def sharpen_kernel(kernel: int = 0) -> np.ndarray:
+    """
+    :param kernel: index of the kernel in `sharpen_filters`
+    """
+    return np.array(sharpen_filters[kernel], dtype=np.float64)
+
+
+def _check_blur(kernel: int, weight: int, border: str, border_constant: int) -> None:
+    _check_int("kernel", kernel, 0, len(blur_filters) - 1)
+    _check_number("weight", weight)
+    _check_border(border, border_constant)
+
+
+@register_operation("blur", validate=_check_blur)
+def blur(
+    image_array: np.ndarray,
+    kernel: int = 0,
+    weight: int = 8,
+    border: str = BorderFillEnum.CONSTANT,
+    border_constant: int = 0,
+) -> np.ndarray:
+    return convolve(
+        image_array, blur_kernel(kernel, weight).tolist(), border, border_constant
+    )
+
+
+def _check_sharpen(kernel: int, border: str, border_constant: int) -> None:
+    _check_int("kernel", kernel, 0, len(sharpen_filters) - 1)
+    _check_border(border, border_constant)
+
+
+@register_operation("sharpen", validate=_check_sharpen)
+def sharpen(
+    image_array: np.ndarray,
+    kernel: int = 0,
+    border: str = BorderFillEnum.CONSTANT,
+    border_constant: int = 0,
+) -> np.ndarray:
+    return convolve(
+        image_array, sharpen_kernel(kernel).tolist(), border, border_constant
+    )
+
+
+def _check_rank(
+    size: int, percentile: float, border: str, border_constant: int
+) -> None:
+    _check_int("size", size, 2, RANK_FILTER_MAX_SIZE)
+    _check_number("percentile", percentile, 0, 100)
+    _check_border(border, border_constant)
+
+
+@register_operation("rank_filter", validate=_check_rank)
+def rank(
+    image_array: np.ndarray,
+    size: int = 3,
+    percentile: float = 50,
+    border: str = BorderFillEnum.CONSTANT,
+    border_constant: int = 0,
+) -> np.ndarray:
+    """
+    Median, min, max or any percentile filter, same as `MedianBlurWidget`. Even sizes are rounded up.
+    """
+    size |= 1
+    return border_fill(
+        image_array,
+        (size - 1) // 2,
+        border_fill_spec(border, border_constant),
+        rank_filter,
+        size=size,
+        percentile=percentile,
+    ).astype(np.uint8, copy=False)
+
+
+def _check_range(size: int, border: str, border_constant: int) -> None:
+    _check_int("size", size, 2, RANK_FILTER_MAX_SIZE)
+    _check_border(border, border_constant)
+
+
+@register_operation("range_filter", validate=_check_range)
+def value_range(
+    image_array: np.ndarray,
+    size: int = 3,
+    border: str = BorderFillEnum.CONSTANT,
+    border_constant: int = 0,
+) -> np.ndarray:
+    size |= 1
+    return border_fill(
+        image_array,
+        (size - 1) // 2,
+        border_fill_spec(border, border_constant),
+        range_filter,
+        size=size,
+    ).astype(np.uint8, copy=False)
+
+
+def _structuring_element(
+    element: str,
+    size: int,
+    height: int | None,
+    angle: int,
+    custom_kernel: list[list[int]] | None,
+) -> StructuringElement:
+    return StructuringElement(
+        enum_value(StructuringElementEnum, element),
+        size=size,
+        height=height,
+        angle=angle,
+        custom_kernel=(
+            tuple(tuple(row) for row in custom_kernel) if custom_kernel else None
+        ),
+    )
+
+
+def _check_morphology(
+    method: str,
+    element: str,
+    size: int,
+    height: int | None,
+    angle: int,
+    custom_kernel: list[list[int]] | None,
+    iterations: int,
+) -> None:
+    enum_value(BinaryOperationEnum, method)
+    _check_int("size", size, 1)
+    if height is not None:
+        _check_int("height", height, 1)
+    _check_int("angle", angle, 0)
+    if custom_kernel is not None and np.array(custom_kernel, dtype=np.uint8).ndim != 2:
+        raise ValueError(f"Custom kernel has to be a matrix! {custom_kernel}")
+    _check_int("iterations", iterations, 1)
+    _structuring_element(element, size, height, angle, custom_kernel)
+
+
+@register_operation("morphology", validate=_check_morphology)
+def morphology_operation(
+    image_array: np.ndarray,
+    method: str = BinaryOperationEnum.OPEN,
+    element: str = StructuringElementEnum.CROSS,
+    size: int = 3,
+    height: int | None = None,
+    angle: int = 0,
+    custom_kernel: list[list[int]] | None = None,
+    iterations: int = 1,
+) -> np.ndarray:
+    """
+    Same as `BinaryOperationsWidget`, see `morphology` and `StructuringElement` for parameters.
+
+    :param method: morphological operation, named so it does not clash with the operation key of specs
+    """
+    return morphology(
+        image_array,
+        enum_value(BinaryOperationEnum, method),
+        _structuring_element(element, size, height, angle, custom_kernel),
+        iterations,
+    ).astype(np.uint8, copy=False)
+
+
+def _check_thinning(method: str) -> None:
+    if method not in THINNING_METHODS:
+        raise ValueError(
+            f"Unknown thinning method! {method}, use one of {list(THINNING_METHODS)}"
+        )
+
+
+@register_operation("thinning", validate=_check_thinning)
+def thinning(image_array: np.ndarray, method: str = "zhang_suen") -> np.ndarray:
+    """
+    Thinning of the foreground (non-zero pixels), the skeleton is returned as an 8-bit mask.
+
+    :param method: "zhang_suen" or "guo_hall"
+    """
+    match method:
+        case "zhang_suen":
+            skeleton = zhang_suen_thinning(image_array)
+        case "guo_hall":
+            skeleton = guo_hall_thinning(image_array)
+        case _:
+            raise ValueError(f"Unknown thinning method! {method}")
+    return skeleton.astype(np.uint8) * MAX_INTENSITY_LEVEL
+
+
+def histogram_after_lut(histogram: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """
+    Histogram of an image after applying `lut`, computed without touching the image.
+    """
+    return np.bincount(lut, weights=histogram, minlength=LUT_SIZE).astype(np.int64)
+
+
+def chain_uses_histogram(steps: list[dict[str, Any]]) -> bool:
+    return any(get_operation(step["operation"]).uses_histogram for step in steps)
+
+
+def chain_lut(histogram: np.ndarray | None, steps: list[dict[str, Any]]) -> np.ndarray:
+    """
+    Single LUT doing the work of consecutive pointwise steps. Steps depending on the histogram get
+    the histogram of their own input, derived from the image histogram, so the result is exactly
+    the same as running the steps one by one.
+
+    :param histogram: histogram of the input image, required when any step uses it
+    :param steps: pointwise steps in pipeline spec form, `{"operation": name, **params}`
+    """
+    lut = LUT_VALUES.astype(np.uint8)
+    for step in steps:
+        params = dict(step)
+        operation = get_operation(params.pop("operation"))
+        if operation.lut is None:
+            raise ValueError(f"Operation {operation.name} is not pointwise!")
+        step_histogram = None
+        if operation.uses_histogram:
+            if histogram is None:
+                raise ValueError(f"Operation {operation.name} requires histogram!")
+            step_histogram = histogram_after_lut(histogram, lut)
+        lut = operation.lut(step_histogram, **params)[lut]
+    return lut
+
+
+def _check_chain(steps: list[dict[str, Any]]) -> None:
+    if not isinstance(steps, list):
+        raise ValueError(f"Parameter steps has to be a list! {steps!r}")
+    for step in steps:
+        params = dict(step)
+        operation = get_operation(params.pop("operation", None))
+        if operation.lut is None:
+            raise ValueError(f"Operation {operation.name} is not pointwise!")
+        operation.check_params(params)
+
+
+def _apply_chain_lut(
+    image_array: np.ndarray, steps: list[dict[str, Any]]
+) -> np.ndarray:
+    histogram = image_histogram(image_array) if chain_uses_histogram(steps) else None
+    return chain_lut(histogram, steps)[image_array]
+
+
+# pointwise steps fused by the pipeline optimizer, the histogram is only computed when a step needs it
+OPERATIONS["lut_chain"] = Operation(
+    "lut_chain", _apply_chain_lut, chain_lut, validate=_check_chain
+)
@@ -0,0 +1,422 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Final
+
+import numpy as np
+
+from imagepy.pipeline.operations import (
+    LUT_VALUES,
+    blur_kernel,
+    chain_uses_histogram,
+    enum_value,
+    sharpen_kernel,
+)
+from imagepy.pipeline.pipeline import Pipeline, PipelineStep
+from imagepy.utils.constants import (
+    MAX_INTENSITY_LEVEL,
+    PIPELINE_PROFILE_REPEATS,
+    BinaryOperationEnum,
+    BorderFillEnum,
+    OptimizationLevelEnum,
+    StructuringElementEnum,
+)
+
+logger = logging.getLogger(__name__)
+
+LUT_CHAIN: Final = "lut_chain"
+# borders padding the image with a constant, the constant has to be kept by LUTs moved across the filter
+CONSTANT_BORDERS: Final = (BorderFillEnum.CONSTANT, BorderFillEnum.CONSTANT_AFTER)
+# min and max based operations, they give the same result whether a non-decreasing LUT is applied before or after
+ORDER_MORPHOLOGY: Final = (
+    BinaryOperationEnum.ERODE,
+    BinaryOperationEnum.DILATE,
+    BinaryOperationEnum.OPEN,
+    BinaryOperationEnum.CLOSE,
+)
+MORPHOLOGY_EXTREMA: Final = {
+    BinaryOperationEnum.ERODE: 1,
+    BinaryOperationEnum.DILATE: 1,
+    BinaryOperationEnum.OPEN: 2,
+    BinaryOperationEnum.CLOSE: 2,
+    BinaryOperationEnum.GRADIENT: 2,
+    BinaryOperationEnum.TOP_HAT: 2,
+    BinaryOperationEnum.BLACK_HAT: 2,
+}
+# fused kernels grow with every fused filter, larger ones cost more than the passes they save
+MAX_FUSED_KERNEL_SIZE: Final = 5
+
+
+def uses_histogram(step: PipelineStep) -> bool:
+    if step.operation == LUT_CHAIN:
+        return chain_uses_histogram(step.params["steps"])
+    return step.get_operation().uses_histogram
+
+
+def static_lut(step: PipelineStep) -> np.ndarray | None:
+    """
+    LUT of a pointwise step which does not depend on the image, None for other steps.
+    """
+    operation = step.get_operation()
+    if operation.lut is None or uses_histogram(step):
+        return None
+    return operation.lut(None, **step.params)
+
+
+def linear_kernel(step: PipelineStep) -> np.ndarray | None:
+    """
+    Kernel of a linear filter step, None for other steps.
+    """
+    params = step.get_operation().arguments(step.params)
+    match step.operation:
+        case "convolve":
+            return np.asarray(params["kernel"], dtype=np.float64)
+        case "blur":
+            return blur_kernel(params["kernel"], params["weight"])
+        case "sharpen":
+            return sharpen_kernel(params["kernel"])
+        case _:
+            return None
+
+
+def _border(step: PipelineStep) -> tuple[str, int]:
+    params = step.get_operation().arguments(step.params)
+    return params["border"], params["border_constant"]
+
+
+def is_identity(step: PipelineStep) -> bool:
+    lut = static_lut(step)
+    if lut is not None:
+        return bool(np.array_equal(lut, LUT_VALUES))
+    kernel = linear_kernel(step)
+    if kernel is None or _border(step)[0] == BorderFillEnum.CONSTANT_AFTER:
+        return False
+    identity = np.zeros_like(kernel)
+    identity[kernel.shape[0] // 2, kernel.shape[1] // 2] = 1
+    return bool(np.array_equal(kernel, identity))
+
+
+def commutes_with_lut(step: PipelineStep, lut: np.ndarray) -> bool:
+    """
+    Checks whether applying a non-decreasing LUT before the step gives the same result as applying it after.
+    Rank filters pick one of the kernel values and morphology their min or max, so their order does not
+    change, as long as padded borders are not altered by the LUT.
+    """
+    params = step.get_operation().arguments(step.params)
+    match step.operation:
+        case "rank_filter":
+            border, constant = _border(step)
+            return border not in CONSTANT_BORDERS or int(lut[constant]) == constant
+        case "morphology":
+            # elements without their centre may only see padding, which is the min or max intensity
+            return (
+                enum_value(BinaryOperationEnum, params["method"]) in ORDER_MORPHOLOGY
+                and lut[0] == 0
+                and lut[MAX_INTENSITY_LEVEL] == MAX_INTENSITY_LEVEL
+            )
+        case _:
+            return False
+
+
+def _flatten(steps: list[PipelineStep]) -> list[PipelineStep]:
+    flat_steps: list[PipelineStep] = []
+    for step in steps:
+        if step.operation == LUT_CHAIN:
+            flat_steps.extend(map(PipelineStep.from_dict, step.params["steps"]))
+        else:
+            flat_steps.append(step)
+    return flat_steps
+
+
+def _move_pointwise_steps(steps: list[PipelineStep]) -> list[PipelineStep]:
+    """
+    Moves non-decreasing pointwise steps in front of rank filters and morphology,
+    when it puts them next to another pointwise step they can be fused with.
+    """
+    steps = list(steps)
+    for i in range(len(steps)):
+        lut = static_lut(steps[i])
+        if lut is None or np.any(np.diff(lut.astype(np.int64)) < 0):
+            continue
+        j = i
+        while j > 0 and commutes_with_lut(steps[j - 1], lut):
+            j -= 1
+        if 0 < j < i and steps[j - 1].get_operation().pointwise:
+            logger.debug(f"Moving {steps[i]} in front of {steps[j]}")
+            steps.insert(j, steps.pop(i))
+    return steps
+
+
+def _drop_cancelling_steps(steps: list[PipelineStep]) -> list[PipelineStep]:
+    """
+    Drops pairs of adjacent pointwise steps which undo each other, i.e. double negation.
+    """
+    kept_steps: list[PipelineStep] = []
+    for step in steps:
+        lut = static_lut(step)
+        previous_lut = static_lut(kept_steps[-1]) if kept_steps else None
+        if (
+            lut is not None
+            and previous_lut is not None
+            and np.array_equal(lut[previous_lut], LUT_VALUES)
+        ):
+            logger.debug(f"Dropping {kept_steps[-1]} cancelled by {step}")
+            kept_steps.pop()
+        else:
+            kept_steps.append(step)
+    return kept_steps
+
+
+def _fuse_pointwise_steps(steps: list[PipelineStep]) -> list[PipelineStep]:
+    fused_steps: list[PipelineStep] = []
+    group: list[PipelineStep] = []
+    for step in [*steps, None]:
+        if step is not None and step.get_operation().pointwise:
+            group.append(step)
+            continue
+        if len(group) > 1:
+            fused_steps.append(
+                PipelineStep(LUT_CHAIN, {"steps": [item.to_dict() for item in group]})
+            )
+        else:
+            fused_steps.extend(group)
+        group = []
+        if step is not None:
+            fused_steps.append(step)
+    return fused_steps
+
+
+def combine_kernels(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Kernel doing the work of filtering with `first` and then with `second`. Filters correlate the image
+    with the kernel, so the combined kernel is the full convolution of both kernels.
+    """
+    size = first.shape[0] + second.shape[0] - 1
+    combined = np.zeros((size, size), dtype=np.float64)
+    for (row, column), weight in np.ndenumerate(second):
+        combined[row : row + first.shape[0], column : column + first.shape[1]] += (
+            weight * first
+        )
+    return combined
+
+
+def _fuse_linear_steps(steps: list[PipelineStep]) -> list[PipelineStep]:
+    """
+    Replaces consecutive linear filters with the same border by a single convolution. The result is not
+    exactly the same, intermediate results are no longer rounded and clipped to 8 bits and the border
+    is extended only once.
+    """
+    fused_steps: list[PipelineStep] = []
+    for step in steps:
+        previous = fused_steps[-1] if fused_steps else None
+        kernel = linear_kernel(step)
+        previous_kernel = linear_kernel(previous) if previous else None
+        if (
+            previous is not None
+            and kernel is not None
+            and previous_kernel is not None
+            and _border(step) == _border(previous)
+            and _border(step)[0] != BorderFillEnum.CONSTANT_AFTER
+            and previous_kernel.shape[0] + kernel.shape[0] - 1 <= MAX_FUSED_KERNEL_SIZE
+        ):
+            border, constant = _border(step)
+            fused_steps[-1] = PipelineStep(
+                "convolve",
+                {
+                    "kernel": combine_kernels(previous_kernel, kernel).tolist(),
+                    "border": str(border),
+                    "border_constant": constant,
+                },
+            )
+        else:
+            fused_steps.append(step)
+    return fused_steps
+
+
+def optimize_pipeline(
+    pipeline: Pipeline,
+    level: OptimizationLevelEnum | str = OptimizationLevelEnum.EXACT,
+) -> Pipeline:
+    """
+    Rewrites the pipeline to make fewer passes over the image:
+    pointwise steps undoing each other are dropped, consecutive pointwise steps are fused into a single LUT,
+    non-decreasing LUTs are moved across rank filters and morphology to be fused with other LUTs
+    and steps which do not change the image are dropped. All of it keeps the result exactly the same.
+    The approximate level also combines consecutive linear filters into a single kernel.
+
+    :param pipeline: pipeline to optimize, it is not modified
+    :param level: optimization level
+    :return: new pipeline with the same output format and measures
+    """
+    level = OptimizationLevelEnum(level)
+    steps = list(pipeline.steps)
+    if level != OptimizationLevelEnum.NONE:
+        steps = _flatten(steps)
+        steps = _move_pointwise_steps(steps)
+        steps = _drop_cancelling_steps(steps)
+        steps = _fuse_pointwise_steps(steps)
+        if level == OptimizationLevelEnum.APPROXIMATE:
+            steps = _fuse_linear_steps(steps)
+        steps = [step for step in steps if not is_identity(step)]
+    return Pipeline(steps, pipeline.output_format, pipeline.measures)
+
+
+def describe_step(step: PipelineStep) -> str:
+    """
+    Short description of a step for reports, fused LUTs list their steps and kernels show only their size.
+    """
+    match step.operation:
+        case "lut_chain":
+            chain = " -> ".join(
+                map(str, map(PipelineStep.from_dict, step.params["steps"]))
+            )
+            return f"{LUT_CHAIN}({chain})"
+        case "convolve":
+            height, width = np.shape(step.params["kernel"])
+            params = [f"kernel={height}x{width}"] + [
+                f"{name}={value!r}"
+                for name, value in step.params.items()
+                if name != "kernel"
+            ]
+            return f"convolve({', '.join(params)})"
+        case _:
+            return str(step)
+
+
+def describe_pipeline(pipeline: Pipeline) -> str:
+    return " -> ".join(map(describe_step, pipeline.steps)) or str(pipeline)
+
+
+def estimate_passes(step: PipelineStep) -> float:
+    """
+    Estimated number of full passes over the image made by the step. Filters extend the border
+    in a copy of the image before filtering. Thinning repeats its passes until the skeleton stops
+    changing, only the first iteration is counted.
+    """
+    operation = step.get_operation()
+    if operation.pointwise:
+        return 1 + uses_histogram(step)
+    params = operation.arguments(step.params)
+    match step.operation:
+        case "convolve" | "blur" | "sharpen" | "rank_filter" | "range_filter":
+            return 2
+        case "adaptive_threshold" | "thinning":
+            return 2
+        case "morphology":
+            # cross is a min or max of two lines, applied once per iteration
+            extremum_passes = (
+                3 * params["iterations"]
+                if enum_value(StructuringElementEnum, params["element"])
+                == StructuringElementEnum.CROSS
+                else params["iterations"]
+            )
+            morphology_operation = enum_value(BinaryOperationEnum, params["method"])
+            subtract = morphology_operation not in ORDER_MORPHOLOGY
+            return MORPHOLOGY_EXTREMA[morphology_operation] * extremum_passes + subtract
+        case _:
+            return 1
+
+
+@dataclass(frozen=True)
+class StepProfile:
+    """
+    Estimated and measured cost of a single step. Measured passes are the step time
+    in units of a single LUT pass over the same image.
+    """
+
+    step: str
+    estimated_passes: float
+    seconds: float
+    pass_seconds: float
+
+    @property
+    def measured_passes(self) -> float:
+        return self.seconds / self.pass_seconds if self.pass_seconds else 0.0
+
+
+def _best_time(
+    repeats: int, function: Callable[[], np.ndarray]
+) -> tuple[float, np.ndarray]:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def profile_pipeline(
+    pipeline: Pipeline,
+    image_array: np.ndarray,
+    repeats: int = PIPELINE_PROFILE_REPEATS,
+) -> tuple[list[StepProfile], np.ndarray]:
+    """
+    Runs pipeline step by step, every step is timed `repeats` times.
+
+    :param pipeline: pipeline to profile
+    :param image_array: 8-bit greyscale image array
+    :param repeats: runs of every step, the fastest one is reported
+    :return: profiles of steps and the result
+    """
+    identity = LUT_VALUES.astype(np.uint8)
+    pass_seconds, _ = _best_time(repeats, lambda: identity[image_array])
+    profiles = []
+    for step in pipeline.steps:
+        step_input = image_array
+        seconds, image_array = _best_time(repeats, lambda: step.run(step_input))
+        profiles.append(
+            StepProfile(
+                describe_step(step), estimate_passes(step), seconds, pass_seconds
+            )
+        )
+    return profiles, image_array
+
+
+def format_profiles(profiles: list[StepProfile]) -> str:
+    lines = [f"{'step':<48} {'estimated':>9} {'measured':>9} {'time [ms]':>10}"]
+    for profile in profiles:
+        step = profile.step if len(profile.step) <= 48 else profile.step[:45] + "..."
+        lines.append(
+            f"{step:<48} {profile.estimated_passes:9.0f} "
+            f"{profile.measured_passes:9.1f} {profile.seconds * 1000:10.2f}"
+        )
+    lines.append(
+        f"{'total':<48} {sum(p.estimated_passes for p in profiles):9.0f} "
+        f"{sum(p.measured_passes for p in profiles):9.1f} "
+        f"{sum(p.seconds for p in profiles) * 1000:10.2f}"
+    )
+    return "\n".join(lines)
+
+
+def explain_optimization(
+    pipeline: Pipeline,
+    optimized: Pipeline,
+    image_array: np.ndarray,
+    repeats: int = PIPELINE_PROFILE_REPEATS,
+) -> str:
+    """
+    Report of estimated and measured passes of the original and the optimized pipeline
+    on a sample image, with the largest difference of their results.
+    """
+    original_profiles, original_result = profile_pipeline(
+        pipeline, image_array, repeats
+    )
+    optimized_profiles, optimized_result = profile_pipeline(
+        optimized, image_array, repeats
+    )
+    if original_result.shape == optimized_result.shape:
+        difference = np.abs(
+            original_result.astype(np.int16) - optimized_result.astype(np.int16)
+        )
+        comparison = f"largest difference of results: {int(difference.max(initial=0))}"
+    else:
+        comparison = f"result shapes differ: {original_result.shape} and {optimized_result.shape}"
+    return "\n".join(
+        [
+            f"original: {describe_pipeline(pipeline)}",
+            format_profiles(original_profiles),
+            f"optimized: {describe_pipeline(optimized)}",
+            format_profiles(optimized_profiles),
+            comparison,
+        ]
+    )
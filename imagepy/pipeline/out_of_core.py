@@ -0,0 +1,160 @@
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from imagepy.lab6.morphology import StructuringElement
+from imagepy.pipeline.operations import blur_kernel, enum_value, sharpen_kernel
+from imagepy.pipeline.optimizer import uses_histogram
+from imagepy.pipeline.pipeline import Pipeline, PipelineStep
+from imagepy.utils.constants import (
+    MAX_INTENSITY_LEVEL,
+    OUT_OF_CORE_DIR,
+    OUT_OF_CORE_TILE_SIZE,
+    BinaryOperationEnum,
+    BorderFillEnum,
+    ImageModeEnum,
+    StructuringElementEnum,
+)
+from imagepy.utils.tiled_store import TiledStore, histogram, map_tiles
+
+logger = logging.getLogger(__name__)
+
+
+def step_halo(step: PipelineStep) -> int:
+    """
+    Neighbourhood radius of a step, the halo its tiles need to give the same result as the whole image.
+
+    :raises ValueError: when the result of the step can not be computed tile by tile
+    """
+    operation = step.get_operation()
+    if operation.pointwise:
+        return 0
+    params = operation.arguments(step.params)
+    if params.get("border") is not None and (
+        enum_value(BorderFillEnum, params["border"]) == BorderFillEnum.WRAP
+    ):
+        raise ValueError(
+            f"Wrapped border of {step.operation} joins opposite image edges, it can not be run tile by tile!"
+        )
+    match step.operation:
+        case "convolve":
+            return int(max(np.shape(params["kernel"]))) // 2
+        case "blur":
+            return max(blur_kernel(params["kernel"], params["weight"]).shape) // 2
+        case "sharpen":
+            return max(sharpen_kernel(params["kernel"]).shape) // 2
+        case "rank_filter" | "range_filter":
+            return int(params["size"]) // 2
+        case "adaptive_threshold":
+            return int(params["block_size"]) // 2
+        case "morphology":
+            element = StructuringElement(
+                enum_value(StructuringElementEnum, params["element"]),
+                size=params["size"],
+                height=params["height"],
+                angle=params["angle"],
+                custom_kernel=(
+                    tuple(tuple(row) for row in params["custom_kernel"])
+                    if params["custom_kernel"]
+                    else None
+                ),
+            )
+            # opening and closing erode and dilate one after the other, so their reach adds up
+            single = enum_value(BinaryOperationEnum, params["method"]) in (
+                BinaryOperationEnum.ERODE,
+                BinaryOperationEnum.DILATE,
+                BinaryOperationEnum.GRADIENT,
+            )
+            return element.radius(params["iterations"]) * (1 if single else 2)
+        case _:
+            raise ValueError(
+                f"Operation {step.operation} depends on the whole image, it can not be run tile by tile!"
+            )
+
+
+def check_out_of_core(pipeline: Pipeline) -> None:
+    """
+    :raises ValueError: when some step can not be run tile by tile
+    """
+    for step in pipeline.steps:
+        step_halo(step)
+
+
+def _to_greyscale(pixels: np.ndarray) -> np.ndarray:
+    match pixels.dtype, pixels.ndim:
+        case np.uint8, 2:
+            return pixels
+        case np.uint16, 2:
+            return (pixels >> 8).astype(np.uint8)
+        case np.bool_, 2:
+            return pixels.view(np.uint8) * np.uint8(MAX_INTENSITY_LEVEL)
+        case _:
+            return np.array(Image.fromarray(pixels).convert(ImageModeEnum.GREYSCALE))
+
+
+def open_greyscale_store(
+    path: str | Path,
+    tile_size: int = OUT_OF_CORE_TILE_SIZE,
+    directory: str | Path | None = OUT_OF_CORE_DIR,
+) -> TiledStore:
+    """
+    Opens image as an 8-bit greyscale store, converted tile by tile the same way `load_greyscale` converts
+    images loaded into memory. 8-bit greyscale images are mapped as they are.
+    """
+    store = TiledStore.open(path, directory)
+    if store.dtype == np.uint8 and len(store.shape) == 2:
+        return store
+    with store:
+        return map_tiles(store, _to_greyscale, 0, tile_size, directory)
+
+
+def run_tiled(
+    pipeline: Pipeline,
+    source: TiledStore,
+    timings: list[float] | None = None,
+    tile_size: int = OUT_OF_CORE_TILE_SIZE,
+    directory: str | Path | None = OUT_OF_CORE_DIR,
+) -> TiledStore:
+    """
+    Same as `Pipeline.run` for images kept on disk. Pointwise steps apply their LUT tile by tile,
+    LUTs depending on the histogram get the histogram of the whole store. Neighbourhood steps read
+    tiles with a halo of their neighbourhood radius, so results are identical to in-memory ones.
+    Intermediate stores are deleted as soon as the next step is done.
+
+    :param pipeline: pipeline to run, see `check_out_of_core`
+    :param source: 8-bit greyscale image, it is not closed
+    :param timings: if given, seconds spent in every step are appended to it
+    :param tile_size: side of processed tiles
+    :param directory: directory for intermediate and result stores
+    :return: result store, `source` itself for pipelines without steps
+    """
+    current = source
+    try:
+        for step in pipeline.steps:
+            start = time.perf_counter()
+            operation = step.get_operation()
+            if operation.lut is not None:
+                step_histogram = (
+                    histogram(current, tile_size) if uses_histogram(step) else None
+                )
+                lut = operation.lut(step_histogram, **step.params)
+                result = map_tiles(
+                    current, lambda pixels: lut[pixels], 0, tile_size, directory
+                )
+            else:
+                result = map_tiles(
+                    current, step.run, step_halo(step), tile_size, directory
+                )
+            if current is not source:
+                current.close()
+            current = result
+            if timings is not None:
+                timings.append(time.perf_counter() - start)
+    except Exception:
+        if current is not source:
+            current.close()
+        raise
+    return current
@@ -0,0 +1,141 @@
+import json
+import logging
+import time
+import tomllib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from imagepy.pipeline.operations import Operation, get_operation
+from imagepy.utils.constants import MeasuresFormatEnum
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT_FORMAT = "png"
+
+
+@dataclass
+class PipelineStep:
+    """
+    Single operation of a pipeline with its parameters, written in specs as
+    `{"operation": "gamma", "gamma": 1.5}`.
+    """
+
+    operation: str
+    params: dict[str, Any] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self.get_operation().check_params(self.params)
+
+    def get_operation(self) -> Operation:
+        return get_operation(self.operation)
+
+    def run(self, image_array: np.ndarray) -> np.ndarray:
+        return self.get_operation()(image_array, **self.params)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "PipelineStep":
+        params = dict(data)
+        try:
+            operation = params.pop("operation")
+        except KeyError:
+            raise ValueError(f"Pipeline step has no operation! {data}")
+        return cls(str(operation), params)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"operation": self.operation, **self.params}
+
+    def __str__(self) -> str:
+        params = ", ".join(f"{name}={value!r}" for name, value in self.params.items())
+        return f"{self.operation}({params})"
+
+
+@dataclass
+class Pipeline:
+    """
+    Sequence of headless operations applied to 8-bit greyscale images. Specs are JSON or TOML files:
+
+        output_format = "png"
+        measures = "csv"
+
+        [[steps]]
+        operation = "threshold"
+        lower = 100
+        binary = true
+
+    :param steps: operations in order
+    :param output_format: file extension of processed images
+    :param measures: format of shape measures exported for every processed image, none by default
+    """
+
+    steps: list[PipelineStep] = field(default_factory=list)
+    output_format: str = DEFAULT_OUTPUT_FORMAT
+    measures: MeasuresFormatEnum | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Pipeline":
+        unknown_keys = set(data) - {"steps", "output_format", "measures"}
+        if unknown_keys:
+            raise ValueError(f"Unknown pipeline keys! {sorted(unknown_keys)}")
+        steps = data.get("steps", [])
+        if not isinstance(steps, list):
+            raise ValueError("Pipeline steps have to be a list!")
+        measures = data.get("measures")
+        return cls(
+            [PipelineStep.from_dict(step) for step in steps],
+            str(data.get("output_format", DEFAULT_OUTPUT_FORMAT)).lstrip("."),
+            MeasuresFormatEnum(measures) if measures else None,
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        data: dict[str, Any] = {"output_format": self.output_format}
+        if self.measures:
+            data["measures"] = str(self.measures)
+        data["steps"] = [step.to_dict() for step in self.steps]
+        return data
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Pipeline":
+        """
+        Reads pipeline spec, files with .toml extension are parsed as TOML, other files as JSON.
+        """
+        path = Path(path)
+        try:
+            if path.suffix.lower() == ".toml":
+                with open(path, "rb") as toml_file:
+                    data = tomllib.load(toml_file)
+            else:
+                with open(path, encoding="utf-8") as json_file:
+                    data = json.load(json_file)
+        except (tomllib.TOMLDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Invalid pipeline spec {path}! {e}")
+        if not isinstance(data, dict):
+            raise ValueError(f"Pipeline spec has to be an object! {path}")
+        return cls.from_dict(data)
+
+    def save(self, path: str | Path) -> None:
+        """
+        Writes pipeline spec as JSON.
+        """
+        with open(path, "w", encoding="utf-8") as json_file:
+            json.dump(self.to_dict(), json_file, indent=2)
+
+    def run(
+        self, image_array: np.ndarray, timings: list[float] | None = None
+    ) -> np.ndarray:
+        """
+        :param image_array: 8-bit greyscale image array
+        :param timings: if given, seconds spent in every step are appended to it
+        :return: result array
+        """
+        for step in self.steps:
+            start = time.perf_counter()
+            image_array = step.run(image_array)
+            if timings is not None:
+                timings.append(time.perf_counter() - start)
+        return image_array
+
+    def __str__(self) -> str:
+        return " -> ".join(map(str, self.steps)) or "(empty pipeline)"
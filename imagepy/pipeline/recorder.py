@@ -0,0 +1,132 @@
+import logging
+import weakref
+from dataclasses import dataclass
+from typing import Any
+
+from imagepy.pipeline.pipeline import Pipeline, PipelineStep
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RecordedChange:
+    """
+    Change of an image window as seen by the recorder.
+
+    :param steps: operations reproducing the change, None when it can not be replayed
+    :param source: widget which applied the change, its later previews replace this change
+    """
+
+    steps: tuple[PipelineStep, ...] | None
+    source: weakref.ref[Any] | None = None
+
+    @property
+    def replayable(self) -> bool:
+        return self.steps is not None
+
+    def made_by(self, source: object | None) -> bool:
+        return (
+            source is not None and self.source is not None and self.source() is source
+        )
+
+
+MacroState = tuple[RecordedChange, ...]
+
+
+class MacroRecorder:
+    """
+    Records operations applied to an image window as a pipeline which can be replayed without the GUI.
+    Widgets show previews by applying their operation to the image they were opened with, so a new change
+    from the same widget replaces its previous one and a reset of the widget removes it. States are saved
+    at the same points as the undo history, so undo and redo restore the matching recording.
+    """
+
+    def __init__(self, changes: MacroState = ()):
+        self.changes: MacroState = changes
+        self.undo_states: list[MacroState] = []
+        self.redo_states: list[MacroState] = []
+
+    def record(
+        self,
+        step: PipelineStep | Pipeline | None,
+        source: object | None = None,
+        merge: bool = False,
+    ) -> None:
+        """
+        :param step: operation which changed the image, None if the change can not be replayed
+        :param source: widget which applied the operation
+        :param merge: change was merged with the previous one in undo history
+        """
+        self._checkpoint(merge)
+        changes = list(self.changes)
+        if changes and changes[-1].made_by(source):
+            changes.pop()
+        steps = (
+            None
+            if step is None
+            else tuple(step.steps) if isinstance(step, Pipeline) else (step,)
+        )
+        changes.append(
+            RecordedChange(steps, weakref.ref(source) if source is not None else None)
+        )
+        self.changes = tuple(changes)
+
+    def revert(self, source: object, merge: bool = False) -> None:
+        """
+        Removes the change of a widget which restored the image it was opened with.
+        """
+        if not self.changes or not self.changes[-1].made_by(source):
+            # the image was changed after the widget applied its operation, so reverting is a new change
+            self.record(None, merge=merge)
+            return None
+        self._checkpoint(merge)
+        self.changes = self.changes[:-1]
+
+    def _checkpoint(self, merge: bool) -> None:
+        # same rule as in UndoHistory.record, so both keep the same number of steps
+        if not merge or not self.undo_states or self.redo_states:
+            self.undo_states.append(self.changes)
+        self.redo_states.clear()
+
+    def undo(self) -> None:
+        if self.undo_states:
+            self.redo_states.append(self.changes)
+            self.changes = self.undo_states.pop()
+
+    def redo(self) -> None:
+        if self.redo_states:
+            self.undo_states.append(self.changes)
+            self.changes = self.redo_states.pop()
+
+    def trim(self, undo_steps: int, redo_steps: int) -> None:
+        """
+        Drops states older than the ones the undo history can still reach.
+        """
+        del self.undo_states[: max(len(self.undo_states) - undo_steps, 0)]
+        del self.redo_states[: max(len(self.redo_states) - redo_steps, 0)]
+
+    def clear(self) -> None:
+        self.changes = ()
+        self.undo_states.clear()
+        self.redo_states.clear()
+
+    def copy(self) -> "MacroRecorder":
+        """
+        Recorder of a duplicated window, it starts with the same changes and no undo states.
+        """
+        return MacroRecorder(self.changes)
+
+    @property
+    def unreplayable(self) -> int:
+        """
+        Number of recorded changes which are not part of the pipeline.
+        """
+        return sum(not change.replayable for change in self.changes)
+
+    def pipeline(self) -> Pipeline:
+        """
+        Pipeline of all replayable changes, in order.
+        """
+        return Pipeline(
+            [step for change in self.changes for step in change.steps or ()]
+        )
@@ -0,0 +1,104 @@
+import logging
+from typing import Any, Callable, Final
+
+import cv2
+import numpy as np
+
+from imagepy.utils.constants import BorderFillEnum
+
+logger = logging.getLogger(__name__)
+
+# border type and, for user constant fills, the constant; border type None pads the result after filtering
+BorderFill = tuple[int | None] | tuple[int | None, int]
+
+BORDER_FILL_TYPES: Final[dict[BorderFillEnum, int | None]] = {
+    BorderFillEnum.CONSTANT: cv2.BORDER_CONSTANT,
+    BorderFillEnum.CONSTANT_AFTER: None,
+    BorderFillEnum.REFLECT: cv2.BORDER_REFLECT,
+    BorderFillEnum.WRAP: cv2.BORDER_WRAP,
+}
+USER_CONSTANT_FILLS: Final = (BorderFillEnum.CONSTANT, BorderFillEnum.CONSTANT_AFTER)
+
+
+def border_fill_spec(border: BorderFillEnum | str, constant: int = 0) -> BorderFill:
+    """
+    Border fill given by name, as used by pipelines.
+
+    :param border: border fill name
+    :param constant: value of user constant fills, ignored by other fills
+    """
+    try:
+        border = BorderFillEnum(border)
+    except ValueError:
+        raise ValueError(
+            f"Unknown border fill! {border}, use one of {[b.value for b in BorderFillEnum]}"
+        )
+    if border in USER_CONSTANT_FILLS:
+        return BORDER_FILL_TYPES[border], constant
+    return (BORDER_FILL_TYPES[border],)
+
+
+def border_fill_name(border_fill_type_tuple: BorderFill) -> tuple[BorderFillEnum, int]:
+    """
+    Inverse of `border_fill_spec`.
+
+    :return: border fill name and constant
+    """
+    border_type = border_fill_type_tuple[0]
+    user_constant = len(border_fill_type_tuple) == 2
+    for border, fill_type in BORDER_FILL_TYPES.items():
+        if (
+            fill_type == border_type
+            and (border in USER_CONSTANT_FILLS) == user_constant
+        ):
+            constant = (
+                border_fill_type_tuple[1] if len(border_fill_type_tuple) == 2 else 0
+            )
+            return border, int(constant)
+    raise ValueError(f"Unknown border fill! {border_fill_type_tuple}")
+
+
+def border_fill(
+    image_array: np.ndarray,
+    pad_size: int,
+    border_fill_type_tuple: BorderFill,
+    filter_operation: Callable,
+    **filter_args: Any,
+) -> np.ndarray:
+    """
+    Applies filter to an image padded with given border fill, `BorderFillWidget.get`
+    and `border_fill_spec` give the fill.
+    """
+    if len(border_fill_type_tuple) == 1:
+        border_type = border_fill_type_tuple[0]
+        assert border_type is not None
+        padded_image_array = cv2.copyMakeBorder(
+            image_array, pad_size, pad_size, pad_size, pad_size, border_type
+        )
+        modified_image_array = filter_operation(padded_image_array, **filter_args)
+        modified_image_array = modified_image_array[
+            pad_size:-pad_size, pad_size:-pad_size
+        ]
+    else:
+        border_type, border_constant = border_fill_type_tuple
+        if border_type is not None:
+            image_array = cv2.copyMakeBorder(
+                image_array,
+                pad_size,
+                pad_size,
+                pad_size,
+                pad_size,
+                border_type,
+                value=(border_constant,),
+            )
+            modified_image_array = filter_operation(image_array, **filter_args)
+            modified_image_array = modified_image_array[
+                pad_size:-pad_size, pad_size:-pad_size
+            ]
+        else:
+            modified_image_array = filter_operation(image_array, **filter_args)
+            modified_image_array = np.pad(
+                modified_image_array, pad_size, constant_values=border_constant
+            )
+
+    return modified_image_array
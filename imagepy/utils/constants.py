@@ -1,14 +1,72 @@
+import os
 from dataclasses import dataclass
 from enum import Enum, StrEnum, unique
 from typing import Final, TypedDict
 
 MAX_INTENSITY_LEVEL: Final = 255
+MAX_INTENSITY_LEVEL_16: Final = 65535
 MIN_INTENSITY_LEVEL: Final = 0
 FILE_TYPES: Final = (("Obraz", "*.bmp *tif *png *jpg"),)
+PIPELINE_FILE_TYPES: Final = (("Pipeline", "*.json *.toml"),)
 DEBUG: Final = False
+RANK_FILTER_MAX_SIZE: Final = 255
+RESULT_CACHE_MEMORY_LIMIT: Final = 512 * 2**20
+RESULT_CACHE_DISK_LIMIT: Final = 4 * 2**30
+# set to a directory path to keep operation results between sessions
+RESULT_CACHE_DIR: Final[str | None] = None
+# number of contours measured and written to an export file at once
+MEASURES_CHUNK_SIZE: Final = 10_000
+# images with at least this many pixels are measured in worker processes
+PARALLEL_MEASURES_MIN_PIXELS: Final = 16 * 2**20
+# side of square tiles the displayed image is rendered in
+DISPLAY_TILE_SIZE: Final = 256
+# image window canvas never grows beyond this part of the screen, bigger images are scrolled
+DISPLAY_MAX_SCREEN_FRACTION: Final = 0.8
+# memory shared by reduced resolution levels of all displayed images, least recently used levels are dropped
+PYRAMID_MEMORY_LIMIT: Final = 512 * 2**20
+# how often the display checks whether a pyramid level it waits for is ready, in ms
+PYRAMID_POLL_INTERVAL: Final = 50
+# zoom factor change of a single mouse wheel step and the zoom limits
+ZOOM_STEP: Final = 1.1
+MIN_ZOOM: Final = 0.02
+MAX_ZOOM: Final = 32.0
+# undo history of all windows together, older steps are moved to disk and then forgotten
+UNDO_MEMORY_LIMIT: Final = 256 * 2**20
+UNDO_DISK_LIMIT: Final = 2 * 2**30
+# directory for undo steps moved out of memory, a temporary directory is used when not set
+UNDO_DIR: Final[str | None] = None
+# side of square tiles compared to find the changed part of an image
+UNDO_TILE_SIZE: Final = 64
+# image updates closer in time than this, in seconds, are undone as a single step, i.e. slider moves
+UNDO_MERGE_INTERVAL: Final = 0.5
+# images with more pixels open with a reduced resolution preview while the full image is decoded
+PREVIEW_MIN_PIXELS: Final = 16 * 2**20
+# the preview is reduced by a power of two until it has at most this many pixels
+PREVIEW_MAX_PIXELS: Final = 4 * 2**20
+# how often a window checks whether its full resolution image was decoded, in ms
+DECODE_POLL_INTERVAL: Final = 100
+# directory for memory-mapped images processed out of core, a temporary directory is used when not set
+OUT_OF_CORE_DIR: Final[str | None] = None
+# side of square tiles out of core images are processed in
+OUT_OF_CORE_TILE_SIZE: Final = 2048
+# out of core images are measured in strips of at most this many pixels
+OUT_OF_CORE_STRIP_PIXELS: Final = 64 * 2**20
+# threads running background jobs, jobs of different windows run at the same time
+JOB_WORKERS: Final = max(2, os.cpu_count() or 1)
+# how often finished jobs and progress are checked from the Tk main loop, in ms
+JOB_POLL_INTERVAL: Final = 50
+# worker processes are started fresh, forking while job threads hold locks could deadlock them
+WORKER_START_METHOD: Final = "spawn"
+# files submitted to every batch worker process at once, bounds memory of queued work
+BATCH_FILES_IN_FLIGHT_PER_WORKER: Final = 2
+BATCH_IMAGE_SUFFIXES: Final = (".bmp", ".tif", ".tiff", ".png", ".jpg", ".jpeg")
+BATCH_REPORT_NAME: Final = "timings.csv"
+# runs of every step when profiling a pipeline, the fastest one is reported
+PIPELINE_PROFILE_REPEATS: Final = 3
 
 FileDialogArgs: Final = TypedDict(
-    "FileDialogArgs", {"filetypes": tuple[tuple[str, str]], "defaultextension": str}
+    "FileDialogArgs",
+    {"filetypes": tuple[tuple[str, str], ...], "defaultextension": str},
 )
 
 
@@ -16,6 +74,7 @@ FileDialogArgs: Final = TypedDict(
 class ImageModeEnum(StrEnum):
     COLOR: str = "RGB"
     GREYSCALE: str = "L"
+    GREYSCALE_16: str = "I;16"
     BINARY: str = "1"
 
 
@@ -45,6 +104,18 @@ class BinaryOperationEnum(StrEnum):
     CLOSE: str = "Close"
     ERODE: str = "Erode"
     DILATE: str = "Dilate"
+    GRADIENT: str = "Gradient"
+    TOP_HAT: str = "Top-hat"
+    BLACK_HAT: str = "Black-hat"
+
+
+@unique
+class StructuringElementEnum(StrEnum):
+    RECTANGLE: str = "Rectangle"
+    DISK: str = "Disk"
+    LINE: str = "Line"
+    CROSS: str = "Cross"
+    CUSTOM: str = "Custom"
 
 
 @unique
@@ -52,3 +123,56 @@ class LogicFilterEnum(StrEnum):
     HORIZONTAL: str = "Horizontal lines and isolated points"
     VERTICAL: str = "Vertical lines and isolated points"
     ISOLATED_POINTS: str = "Only isolated points"
+
+
+@unique
+class LutFilterEnum(StrEnum):
+    ZHANG_SUEN: str = "Zhang-Suen thinning"
+    GUO_HALL: str = "Guo-Hall thinning"
+    HIT_OR_MISS: str = "Hit-or-miss"
+    REMOVE_MATCHES: str = "Remove template matches until stable"
+
+
+@unique
+class RankFilterEnum(StrEnum):
+    MEDIAN: str = "Median"
+    PERCENTILE: str = "Percentile"
+    MIN: str = "Min"
+    MAX: str = "Max"
+    RANGE: str = "Range"
+
+
+@unique
+class MeasuresFormatEnum(StrEnum):
+    CSV: str = "csv"
+    NPY: str = "npy"
+    NPZ: str = "npz"
+    SQLITE: str = "sqlite"
+
+
+@unique
+class BorderFillEnum(StrEnum):
+    CONSTANT: str = "constant"
+    CONSTANT_AFTER: str = "constant_after"
+    REFLECT: str = "reflect"
+    WRAP: str = "wrap"
+
+
+@unique
+class OptimizationLevelEnum(StrEnum):
+    NONE: str = "none"
+    EXACT: str = "exact"
+    APPROXIMATE: str = "approximate"
+
+
+@unique
+class InterpolationEnum(StrEnum):
+    NEAREST: str = "Nearest"
+    BILINEAR: str = "Bilinear"
+    BICUBIC: str = "Bicubic"
+
+
+@unique
+class BatchProfileEnum(StrEnum):
+    PARALLEL: str = "Parallel profiles"
+    KYMOGRAPH: str = "Kymograph of open images"
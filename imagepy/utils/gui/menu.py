@@ -20,11 +20,23 @@ from imagepy.lab4.filter_operations import filter_calculation
 from imagepy.lab4.median_blur_filter import median_blur
 from imagepy.lab6.binary_operations import binary_calculation
 from imagepy.lab6.measures import calculate_measures
+from imagepy.lab_project.batch_profile import batch_profile
 from imagepy.lab_project.logic_filter import logic_filter
+from imagepy.lab_project.lut_filter import lut_filter
 from imagepy.lab_project.plot_profile import plot_profile, show_plot_info
 from imagepy.utils.constants import DEBUG
 from imagepy.utils.image_manager import ImageManager
-from imagepy.utils.utils import duplicate_image, open_file, save_file_as
+from imagepy.utils.utils import (
+    clear_macro,
+    duplicate_image,
+    open_file,
+    redo_image,
+    run_pipeline,
+    save_file_as,
+    save_macro,
+    show_macro,
+    undo_image,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -79,6 +91,21 @@ def create_menu(root: tk.Toplevel | tk.Tk) -> tk.Menu:
     menubar.add_cascade(label="File", menu=file_menu)
 
     edit_menu = tk.Menu(menubar, tearoff=0)
+    edit_menu.add_command(
+        label="Undo",
+        command=lambda: undo_image(ImageManager.get_focus_window()),
+        accelerator="Ctrl+Z",
+        font=custom_font,
+    )
+    edit_menu.add_command(
+        label="Redo",
+        command=lambda: redo_image(ImageManager.get_focus_window()),
+        accelerator="Ctrl+Y",
+        font=custom_font,
+    )
+
+    edit_menu.add_separator()
+
     edit_menu.add_command(
         label="Duplicate",
         command=lambda: duplicate_image(ImageManager.get_focus_window()),
@@ -279,6 +306,11 @@ def create_menu(root: tk.Toplevel | tk.Tk) -> tk.Menu:
         command=lambda: plot_profile(ImageManager.get_focus_window()),
         font=custom_font,
     )
+    plot_profile_menu.add_command(
+        label="Batch profiles",
+        command=lambda: batch_profile(ImageManager.get_focus_window()),
+        font=custom_font,
+    )
     plot_profile_menu.add_separator()
     plot_profile_menu.add_command(
         label="Info", command=show_plot_info, font=custom_font
@@ -291,8 +323,39 @@ def create_menu(root: tk.Toplevel | tk.Tk) -> tk.Menu:
         command=lambda: logic_filter(ImageManager.get_focus_window()),
         font=custom_font,
     )
+    project_menu.add_command(
+        label="Neighbourhood LUT filters",
+        command=lambda: lut_filter(ImageManager.get_focus_window()),
+        font=custom_font,
+    )
     menubar.add_cascade(label="Project", menu=project_menu)
 
+    macro_menu = tk.Menu(menubar, tearoff=0)
+    macro_menu.add_command(
+        label="Show recorded pipeline",
+        command=lambda: show_macro(ImageManager.get_focus_window()),
+        font=custom_font,
+    )
+    macro_menu.add_command(
+        label="Save recorded pipeline...",
+        command=lambda: save_macro(ImageManager.get_focus_window()),
+        font=custom_font,
+    )
+    macro_menu.add_command(
+        label="Clear recording",
+        command=lambda: clear_macro(ImageManager.get_focus_window()),
+        font=custom_font,
+    )
+
+    macro_menu.add_separator()
+
+    macro_menu.add_command(
+        label="Run pipeline...",
+        command=lambda: run_pipeline(ImageManager.get_focus_window()),
+        font=custom_font,
+    )
+    menubar.add_cascade(label="Macro", menu=macro_menu)
+
     if DEBUG:
         menubar.add_cascade(label="Debug", menu=create_debug_menu(menubar))
 
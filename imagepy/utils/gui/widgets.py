@@ -8,7 +8,9 @@ from typing import Any, Callable
 import cv2
 import numpy as np
 
+from imagepy.utils.border_fill import BorderFill, border_fill
 from imagepy.utils.constants import MAX_INTENSITY_LEVEL, MIN_INTENSITY_LEVEL
+from imagepy.utils.jobs import Job, JobExecutor, job_executor
 from imagepy.utils.utils import ColorIterator
 
 logger = logging.getLogger(__name__)
@@ -112,7 +114,7 @@ class BorderFillWidget(tk.Frame):
         else:
             self.user_constant_entry.config(state="normal")
 
-    def get(self) -> tuple[int | None] | tuple[int | None, int]:
+    def get(self) -> BorderFill:
         border_fill_entry = border_fill_types.get(self.chosen_border.get())
         if not border_fill_entry:
             raise ValueError()
@@ -130,38 +132,54 @@ class BorderFillWidget(tk.Frame):
         filter_operation: Callable,
         **filter_args: Any,
     ) -> np.ndarray:
-        border_fill_type_tuple = self.get()
-
-        if len(border_fill_type_tuple) == 1:
-            border_type = border_fill_type_tuple[0]
-            assert border_type is not None
-            padded_image_array = cv2.copyMakeBorder(
-                image_array, pad_size, pad_size, pad_size, pad_size, border_type
-            )
-            modified_image_array = filter_operation(padded_image_array, **filter_args)
-            modified_image_array = modified_image_array[
-                pad_size:-pad_size, pad_size:-pad_size
-            ]
+        return border_fill(
+            image_array, pad_size, self.get(), filter_operation, **filter_args
+        )
+
+
+class JobStatusBar(tk.Frame):
+    """
+    Shows the running background jobs with their progress and lets the user cancel them.
+    """
+
+    def __init__(
+        self, root: tk.Tk | tk.BaseWidget, executor: JobExecutor = job_executor
+    ):
+        super().__init__(root)
+        self.executor = executor
+        self.label = tk.Label(self, text="Ready", anchor=tk.W)
+        self.label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = tk.Button(
+            self, text="Cancel", command=self.executor.cancel, state=tk.DISABLED
+        )
+        self.cancel_button.pack(side=tk.RIGHT)
+        self.progress_bar = ttk.Progressbar(self, length=120, maximum=1.0)
+        self.progress_bar.pack(side=tk.RIGHT, padx=5)
+        self.executor.listeners.append(self.update_status)
+        self.bind("<Destroy>", self._on_destroy)
+
+    def update_status(self, jobs: list[Job[Any]]) -> None:
+        if not jobs:
+            self.label.config(text="Ready")
+            self.progress_bar.stop()
+            self.progress_bar.config(mode="determinate", value=0.0)
+            self.cancel_button.config(state=tk.DISABLED)
+            return None
+
+        job = jobs[0]
+        text = job.name if len(jobs) == 1 else f"{job.name} (+{len(jobs) - 1})"
+        if job.token.message:
+            text += f": {job.token.message}"
+        self.label.config(text=text)
+        self.cancel_button.config(state=tk.NORMAL)
+        if job.progress is None:
+            if str(self.progress_bar.cget("mode")) != "indeterminate":
+                self.progress_bar.config(mode="indeterminate")
+                self.progress_bar.start()
         else:
-            border_type, border_constant = border_fill_type_tuple
-            if border_type is not None:
-                image_array = cv2.copyMakeBorder(
-                    image_array,
-                    pad_size,
-                    pad_size,
-                    pad_size,
-                    pad_size,
-                    border_type,
-                    value=(border_constant,),
-                )
-                modified_image_array = filter_operation(image_array, **filter_args)
-                modified_image_array = modified_image_array[
-                    pad_size:-pad_size, pad_size:-pad_size
-                ]
-            else:
-                modified_image_array = filter_operation(image_array, **filter_args)
-                modified_image_array = np.pad(
-                    modified_image_array, pad_size, constant_values=border_constant
-                )
-
-        return modified_image_array
+            self.progress_bar.stop()
+            self.progress_bar.config(mode="determinate", value=job.progress)
+
+    def _on_destroy(self, event: tk.Event) -> None:
+        if event.widget is self and self.update_status in self.executor.listeners:
+            self.executor.listeners.remove(self.update_status)
@@ -0,0 +1,281 @@
+import logging
+import weakref
+from collections import Counter
+from typing import Any, Final
+
+import numpy as np
+from PIL import Image
+from PIL.Image import Image as PILImage
+
+from imagepy.utils.constants import MAX_INTENSITY_LEVEL_16, ImageModeEnum
+from imagepy.utils.packed_binary import PackedBinaryImage
+
+logger = logging.getLogger(__name__)
+
+# modes PIL can map onto an existing buffer without copying it
+ZERO_COPY_MODES: Final = (ImageModeEnum.GREYSCALE, ImageModeEnum.GREYSCALE_16)
+# modes converted on load to a supported mode, alpha and extra channels are dropped
+CONVERTED_MODES: Final = {
+    "RGBA": ImageModeEnum.COLOR,
+    "RGBa": ImageModeEnum.COLOR,
+    "RGBX": ImageModeEnum.COLOR,
+    "CMYK": ImageModeEnum.COLOR,
+    "YCbCr": ImageModeEnum.COLOR,
+    "LAB": ImageModeEnum.COLOR,
+    "HSV": ImageModeEnum.COLOR,
+    "LA": ImageModeEnum.GREYSCALE,
+    "La": ImageModeEnum.GREYSCALE,
+}
+PALETTE_MODES: Final = ("P", "PA")
+MODE_PIXEL_BYTES: Final = {
+    ImageModeEnum.COLOR: 3,
+    ImageModeEnum.GREYSCALE: 1,
+    ImageModeEnum.GREYSCALE_16: 2,
+}
+# 32-bit integer, float and non-native byte order greyscale modes, stored as native 16-bit
+WIDE_GREYSCALE_MODES: Final = ("I", "F", "I;16B", "I;16L", "I;16N")
+
+
+class CopyCounter:
+    """
+    Counts whole image buffer copies, grouped by the place they were made in,
+    so it can be checked which conversions still happen.
+    """
+
+    def __init__(self) -> None:
+        self.copies: Counter[str] = Counter()
+        self.copied_bytes: Counter[str] = Counter()
+
+    def add(self, reason: str, nbytes: int) -> None:
+        self.copies[reason] += 1
+        self.copied_bytes[reason] += nbytes
+        logger.debug(f"Image buffer copy: {reason} ({nbytes} B)")
+
+    def reset(self) -> None:
+        self.copies.clear()
+        self.copied_bytes.clear()
+
+    @property
+    def total(self) -> int:
+        return sum(self.copies.values())
+
+    def __repr__(self) -> str:
+        counts = ", ".join(
+            f"{reason}: {count}x {self.copied_bytes[reason]} B"
+            for reason, count in self.copies.most_common()
+        )
+        return f"CopyCounter({counts})"
+
+
+copy_counter = CopyCounter()
+
+
+def array_mode(image_array: np.ndarray) -> ImageModeEnum:
+    """
+    PIL mode of an array in `np.array(image)` layout.
+    """
+    match image_array.dtype, image_array.ndim:
+        case np.bool_, 2:
+            return ImageModeEnum.BINARY
+        case np.uint8, 2:
+            return ImageModeEnum.GREYSCALE
+        case np.uint16, 2:
+            return ImageModeEnum.GREYSCALE_16
+        case np.uint8, 3 if image_array.shape[2] == 3:
+            return ImageModeEnum.COLOR
+        case _:
+            raise ValueError(
+                f"Array can not be shown as an image! {image_array.dtype} {image_array.shape}"
+            )
+
+
+def _palette_is_grey(image: PILImage) -> bool:
+    palette = np.array(image.getpalette() or [], dtype=np.uint8).reshape(-1, 3)
+    return bool(np.all(palette == palette[:, :1]))
+
+
+def _to_16bit(image_array: np.ndarray) -> np.ndarray:
+    """
+    Values which fit 16-bit integers are kept, other ones are stretched to the full 16-bit range.
+    """
+    if image_array.size and (
+        image_array.min() < 0
+        or image_array.max() > MAX_INTENSITY_LEVEL_16
+        or not np.array_equal(image_array, np.rint(image_array))
+    ):
+        low, high = float(image_array.min()), float(image_array.max())
+        scale = MAX_INTENSITY_LEVEL_16 / (high - low) if high > low else 0.0
+        image_array = (image_array - low) * scale
+    return np.rint(image_array).astype(np.uint16)
+
+
+def normalize_image(image: PILImage) -> PILImage:
+    """
+    Converts image to a mode image buffers support. Palette images become greyscale when their palette
+    is grey and color otherwise, so palette indices are never taken for intensities.
+
+    :param image: image in any mode
+    :return: the same image if its mode is supported, converted copy otherwise
+    :raises ValueError: when the mode can not be converted
+    """
+    match image.mode:
+        case (
+            ImageModeEnum.COLOR
+            | ImageModeEnum.GREYSCALE
+            | ImageModeEnum.GREYSCALE_16
+            | ImageModeEnum.BINARY
+        ):
+            return image
+        case mode if mode in PALETTE_MODES:
+            converted = image.convert(
+                ImageModeEnum.GREYSCALE
+                if _palette_is_grey(image)
+                else ImageModeEnum.COLOR
+            )
+        case mode if mode in CONVERTED_MODES:
+            converted = image.convert(CONVERTED_MODES[mode])
+        case mode if mode in WIDE_GREYSCALE_MODES:
+            converted = Image.fromarray(_to_16bit(np.asarray(image)))
+        case _:
+            raise ValueError(f"Unsupported image mode! {image.mode}")
+    logger.debug(f"Image converted from {image.mode} to {converted.mode}")
+    copy_counter.add(
+        "mode conversion",
+        converted.width
+        * converted.height
+        * MODE_PIXEL_BYTES[ImageModeEnum(converted.mode)],
+    )
+    return converted
+
+
+class ImageBuffer:
+    """
+    Canonical pixel data of an image: a read-only C-contiguous array with the same layout as `np.array(image)`,
+    i.e. uint8 of shape (height, width, 3) for color images. Binary images are stored packed, 8 pixels per byte,
+    and their bool array is unpacked only when it is asked for. Buffers are never modified,
+    operations create new ones, so PIL views and arrays taken from a buffer stay valid.
+    """
+
+    def __init__(self, image_array: np.ndarray | PackedBinaryImage):
+        """
+        :param image_array: pixel data, the buffer takes ownership of it and makes it read-only,
+            bool arrays are packed
+        """
+        self._array: np.ndarray | None = None
+        self._packed: PackedBinaryImage | None = None
+        # unpacked binary pixels, kept only while some consumer holds them
+        self._unpacked: weakref.ref[np.ndarray] | None = None
+        if isinstance(image_array, PackedBinaryImage):
+            self.mode = ImageModeEnum.BINARY
+            self._packed = image_array
+        else:
+            self.mode = array_mode(image_array)
+            if self.mode == ImageModeEnum.BINARY:
+                self._packed = PackedBinaryImage.from_array(image_array)
+                copy_counter.add("pack binary", self._packed.nbytes)
+                image_array.flags.writeable = False
+                self._unpacked = weakref.ref(image_array)
+            else:
+                if not image_array.flags.c_contiguous:
+                    copy_counter.add("contiguous buffer", image_array.nbytes)
+                    image_array = np.ascontiguousarray(image_array)
+                image_array.flags.writeable = False
+                self._array = image_array
+        if self._packed is not None:
+            self._packed.words.flags.writeable = False
+        self._image: PILImage | None = None
+
+    @classmethod
+    def from_image(cls, image: PILImage) -> "ImageBuffer":
+        """
+        :raises ValueError: when the image mode is not supported, see `normalize_image`
+        """
+        image = normalize_image(image)
+        if image.mode == ImageModeEnum.BINARY:
+            # PIL keeps mode "1" images unpacked, its raw data is packed like the buffer
+            packed = PackedBinaryImage.from_image(image)
+            copy_counter.add("PIL to packed", packed.nbytes)
+            buffer = cls(packed)
+        else:
+            buffer = cls(cls._image_array(image))
+        # the cached view has to show the same pixels as the buffer
+        if image.mode == buffer.mode:
+            buffer._image = image
+        return buffer
+
+    @staticmethod
+    def _image_array(image: PILImage) -> np.ndarray:
+        image_array = np.array(image)
+        copy_counter.add("PIL to array", image_array.nbytes)
+        return image_array
+
+    @property
+    def array(self) -> np.ndarray:
+        """
+        Read-only pixels in `np.array(image)` layout. Bool arrays of binary buffers are unpacked on first use
+        and shared until the last consumer drops them, so only buffers in use cost a byte per pixel.
+        """
+        if self._array is not None:
+            return self._array
+        image_array = self._unpacked() if self._unpacked is not None else None
+        if image_array is None:
+            image_array = self.packed.to_array()
+            copy_counter.add("unpack binary", image_array.nbytes)
+            image_array.flags.writeable = False
+            self._unpacked = weakref.ref(image_array)
+        return image_array
+
+    @property
+    def packed(self) -> PackedBinaryImage:
+        """
+        Packed pixels of a binary buffer.
+
+        :raises ValueError: when the buffer is not binary
+        """
+        if self._packed is None:
+            raise ValueError(f"Only binary images are stored packed! {self.mode}")
+        return self._packed
+
+    @property
+    def image(self) -> PILImage:
+        """
+        PIL image with the buffer content, created on first use. Greyscale images share memory with the buffer,
+        other modes are copied once, because PIL stores them in its own layout.
+        """
+        if self._image is None:
+            if self._packed is not None:
+                copy_counter.add("packed to PIL", self._packed.nbytes)
+                self._image = self._packed.to_image()
+            elif self.mode in ZERO_COPY_MODES:
+                width, height = self.size
+                # noinspection PyTypeChecker
+                self._image = Image.frombuffer(
+                    self.mode, (width, height), self.array, "raw", self.mode, 0, 1
+                )
+            else:
+                copy_counter.add("array to PIL", self.array.nbytes)
+                self._image = Image.fromarray(self.array)
+        return self._image
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """
+        PIL style (width, height) size.
+        """
+        if self._packed is not None:
+            return self._packed.size
+        return self.array.shape[1], self.array.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        if self._packed is not None:
+            return self._packed.nbytes
+        return int(self.array.nbytes)
+
+    def pixel(self, x: int, y: int) -> Any:
+        """
+        Value of a single pixel, read without unpacking binary buffers.
+        """
+        if self._packed is not None:
+            return self._packed.pixel(x, y)
+        return self.array[y, x]
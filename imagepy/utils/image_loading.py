@@ -0,0 +1,124 @@
+import logging
+import math
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Final
+
+import cv2
+import numpy as np
+from PIL import Image
+from PIL.Image import Image as PILImage
+
+from imagepy.utils.constants import (
+    PREVIEW_MAX_PIXELS,
+    PREVIEW_MIN_PIXELS,
+    ImageModeEnum,
+)
+from imagepy.utils.image_buffer import ImageBuffer, normalize_image
+
+logger = logging.getLogger(__name__)
+
+# modes a preview can be decoded in, a preview has to have the same mode as the full image
+PREVIEW_MODES: Final = (ImageModeEnum.GREYSCALE, ImageModeEnum.COLOR)
+# OpenCV decodes images reduced by these factors, JPEGs directly from scaled DCT coefficients
+REDUCED_READ_FLAGS: Final = {
+    ImageModeEnum.GREYSCALE: {
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    },
+    ImageModeEnum.COLOR: {
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    },
+}
+MAX_REDUCTION: Final = 8
+
+# full resolution images are decoded one at a time, so previews of other opened images are not delayed
+decode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decoder")
+
+
+@dataclass
+class PendingImage:
+    """
+    Full resolution image being decoded in the background.
+
+    :param future: resolves to the decoded buffer
+    :param size: (width, height) of the image, known from the file header
+    """
+
+    future: Future[ImageBuffer]
+    size: tuple[int, int]
+
+
+def preview_reduction(size: tuple[int, int]) -> int:
+    """
+    Smallest power of two reduction bringing the image under PREVIEW_MAX_PIXELS, at most MAX_REDUCTION.
+    """
+    width, height = size
+    reduction = 1
+    while (
+        reduction < MAX_REDUCTION and width * height > PREVIEW_MAX_PIXELS * reduction**2
+    ):
+        reduction *= 2
+    return reduction
+
+
+def decode_preview(path: str, image: PILImage, reduction: int) -> np.ndarray | None:
+    """
+    Decodes image at reduced resolution without decoding it fully first, where the format allows it.
+
+    :param path: image file path
+    :param image: opened, not yet loaded image
+    :param reduction: power of two the image size is divided by
+    :return: preview array or None if the image can not be decoded reduced
+    """
+    if image.format == "JPEG":
+        # JPEG draft mode picks the smallest DCT scale giving at least the requested size
+        image.draft(
+            image.mode,
+            (math.ceil(image.width / reduction), math.ceil(image.height / reduction)),
+        )
+        return np.array(image)
+
+    preview = cv2.imread(path, REDUCED_READ_FLAGS[ImageModeEnum(image.mode)][reduction])
+    if preview is None:
+        return None
+    if image.mode == ImageModeEnum.COLOR:
+        preview = cv2.cvtColor(preview, cv2.COLOR_BGR2RGB)
+    return preview
+
+
+def decode_full(path: str) -> ImageBuffer:
+    with Image.open(path) as image:
+        image.load()
+        return ImageBuffer.from_image(image)
+
+
+def open_image(path: str) -> tuple[PILImage | np.ndarray, PendingImage | None]:
+    """
+    Opens image file. Big greyscale and color images are returned as a reduced resolution preview,
+    decoding of the full image continues in the background. Other modes are converted to supported ones.
+
+    :param path: image file path
+    :return: image or preview and pending full resolution image if a preview was returned
+    :raises ValueError: when the image mode is not supported
+    """
+    image = Image.open(path)
+    if (
+        image.mode not in PREVIEW_MODES
+        or image.width * image.height < PREVIEW_MIN_PIXELS
+    ):
+        return normalize_image(image), None
+
+    # draft mode changes the reported size, so the full one is kept first
+    size = image.size
+    reduction = preview_reduction(size)
+    preview = decode_preview(path, image, reduction)
+    if preview is None:
+        logger.debug(f"Reduced decoding is not supported for {path}")
+        return normalize_image(Image.open(path)), None
+
+    logger.debug(f"Preview of {size} image decoded at {preview.shape[1::-1]}")
+    return preview, PendingImage(decode_executor.submit(decode_full, path), size)
@@ -1,18 +1,30 @@
-import copy
 import logging
 import os
 import time
 import tkinter as tk
+import weakref
 from datetime import datetime
 from tkinter import ttk
-from typing import Literal
+from typing import Any, Literal
 
 import numpy as np
-from PIL import ImageTk
 from PIL.Image import Image as PILImage
-from PIL.Image import Resampling
 
-from imagepy.utils.constants import ZoomEnum
+from imagepy.pipeline.pipeline import Pipeline, PipelineStep
+from imagepy.pipeline.recorder import MacroRecorder
+from imagepy.utils.constants import (
+    DECODE_POLL_INTERVAL,
+    DISPLAY_MAX_SCREEN_FRACTION,
+    MAX_ZOOM,
+    MIN_ZOOM,
+    UNDO_MERGE_INTERVAL,
+    ZOOM_STEP,
+    ZoomEnum,
+)
+from imagepy.utils.image_buffer import ImageBuffer
+from imagepy.utils.image_loading import PendingImage
+from imagepy.utils.tiled_display import TiledRenderer
+from imagepy.utils.undo_history import UndoHistory
 
 logger = logging.getLogger(__name__)
 
@@ -27,34 +39,35 @@ def bresenham(start: Point, end: Point) -> list[Point]:
     :param end: line ending point
     :return: list of points on given line
     """
-    x, y = start
-    x1, y1 = end
-    points_in_line = []
-    dx = abs(x1 - x)
-    dy = abs(y1 - y)
-    sx = -1 if x > x1 else 1
-    sy = -1 if y > y1 else 1
-
-    if dx > dy:  # determine direction
-        err = dx / 2
-        while x != x1:
-            points_in_line.append((x, y))
-            err -= dy
-            if err < 0:
-                y += sy
-                err += dx
-            x += sx
-    else:
-        err = dy / 2
-        while y != y1:
-            points_in_line.append((x, y))
-            err -= dx
-            if err < 0:
-                x += sx
-                err += dy
-            y += sy
-    points_in_line.append((x, y))
-    return points_in_line
+    return [(int(x), int(y)) for x, y in bresenham_array(start, end)]
+
+
+def bresenham_array(start: Point, end: Point) -> np.ndarray:
+    """
+    Vectorized Bresenham line, the same points as a step by step implementation with error term starting
+    at half of the major axis length.
+
+    :param start: line starting point
+    :param end: line ending point
+    :return: int array of shape (n, 2) with points on given line, in the same coordinate order as input
+    """
+    start_array, end_array = np.asarray(start), np.asarray(end)
+    delta = np.abs(end_array - start_array)
+    step = np.where(start_array > end_array, -1, 1)
+    # major axis moves every step, minor axis moves when accumulated error drops below zero
+    major = 0 if delta[0] > delta[1] else 1
+    minor = 1 - major
+    major_length, minor_length = int(delta[major]), int(delta[minor])
+
+    k = np.arange(major_length)
+    minor_steps = np.maximum(
+        0, -((major_length - 2 * k * minor_length) // (2 * major_length or 1))
+    )
+    points = np.empty((major_length + 1, 2), dtype=np.int64)
+    points[:-1, major] = start_array[major] + step[major] * k
+    points[:-1, minor] = start_array[minor] + step[minor] * minor_steps
+    points[-1] = end_array
+    return points
 
 
 class ImageWindow(tk.Toplevel):
@@ -62,42 +75,64 @@ class ImageWindow(tk.Toplevel):
     Main class representing window with an image. It is selectable, zoomable and has drawing functionality.
     """
 
-    def __init__(self, image: PILImage, source_path: str | None = None):
+    def __init__(
+        self,
+        image: PILImage | np.ndarray | ImageBuffer,
+        source_path: str | None = None,
+        pending_image: PendingImage | None = None,
+    ):
+        """
+        :param image: pixel data, or a reduced resolution preview when `pending_image` is given
+        :param source_path: file the image was opened from
+        :param pending_image: full resolution image still being decoded
+        """
         super().__init__()
         # image OS absolute path
         self.source_path: str | None = source_path
-        self.image: PILImage = image
-        # make a copy of original image to prevent changing it
-        self.displayed_image = copy.deepcopy(image)
-        # define zoom order and possible options
-        self.zoom_options = [
-            ZoomEnum.ZOOM_10,
-            ZoomEnum.ZOOM_20,
-            ZoomEnum.ZOOM_25,
-            ZoomEnum.ZOOM_50,
-            ZoomEnum.ZOOM_100,
-            ZoomEnum.ZOOM_150,
-            ZoomEnum.ZOOM_200,
-            ZoomEnum.ZOOM_FULL,
-        ]
-        # set default zoom
-        self.current_resize = self.zoom_options.index(ZoomEnum.ZOOM_100)
+        # pixel data shared with operations, buffers are immutable so no defensive copy is needed
+        self._buffer: ImageBuffer
+        if isinstance(image, ImageBuffer):
+            self._buffer = image
+        elif isinstance(image, np.ndarray):
+            self._buffer = ImageBuffer(image)
+        else:
+            self._buffer = ImageBuffer.from_image(image)
+        self.pending_image = pending_image
+        # full resolution pixels per displayed buffer pixel, greater than 1 while a preview is shown
+        self.preview_scale = (
+            pending_image.size[0] / self._buffer.size[0] if pending_image else 1.0
+        )
+        self.history = UndoHistory()
+        # operations applied to the image, replayable as a pipeline
+        self.macro = MacroRecorder()
+        self.last_update_time = 0.0
+        # widget which made the last update, only its following updates are merged with it
+        self.last_update_source: weakref.ref[Any] | None = None
+        # display scale, any factor between MIN_ZOOM and MAX_ZOOM, previews open at their own resolution
+        self.zoom: float = ZoomEnum.ZOOM_100.value / self.preview_scale
         # unique window id number
         self.window_id: str = self.calculate_window_id()
         self.default_file_name: str = "Duplicated"
-        self._img = ImageTk.PhotoImage(self.displayed_image)
         self.widget_frame: ttk.Frame = ttk.Frame(self)
         self.img_canvas = tk.Canvas(
-            self.widget_frame, scrollregion=(0, 0, self.image.width, self.image.height)
+            self.widget_frame, scrollregion=(0, 0, *self._buffer.size)
         )
+        self.renderer = TiledRenderer(self.img_canvas)
         self.hbar = tk.Scrollbar(self.widget_frame, orient=tk.HORIZONTAL)
         self.hbar.pack(side=tk.BOTTOM, fill=tk.X)
-        self.hbar.config(command=self.img_canvas.xview)
+        self.hbar.config(command=self.scroll_x)
         self.vbar = tk.Scrollbar(self.widget_frame, orient=tk.VERTICAL)
         self.vbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.vbar.config(command=self.img_canvas.yview)
+        self.vbar.config(command=self.scroll_y)
+        self.img_canvas.config(
+            xscrollcommand=self.hbar.set, yscrollcommand=self.vbar.set
+        )
         self.img_canvas.pack()
-        self.update_image(self.image)
+        # tiles uncovered by resizing the window have to be rendered
+        self.img_canvas.bind("<Configure>", self.renderer.update)
+        self.show_buffer(self._buffer)
+        if self.pending_image:
+            self.after(DECODE_POLL_INTERVAL, self.poll_pending_image)
 
         self.widget_frame.pack()
         self.window_title = self.source_path  # type: ignore
@@ -109,15 +144,22 @@ class ImageWindow(tk.Toplevel):
         self.bind("<FocusIn>", lambda _: ImageManager.set_focus(self))
         self.bind("<Destroy>", lambda _: ImageManager.delete_window(self))
         self.bind("<Control-MouseWheel>", self.resize)
+        self.bind("<Control-z>", lambda _: self.undo())
+        self.bind("<Control-y>", lambda _: self.redo())
+        self.bind("<Control-Z>", lambda _: self.redo())
         self.bind(
             "<MouseWheel>",
-            lambda e: self.img_canvas.yview_scroll(-1 * (e.delta // 120), "units"),
+            lambda e: self.scroll_y("scroll", -1 * (e.delta // 120), "units"),
         )
 
         # project
         self.previous_coords: tuple[int, int] | None = None
+        # canvas position of previous_coords, lines are drawn in scrolled and scaled canvas coordinates
+        self.previous_canvas_coords: tuple[float, float] = (0.0, 0.0)
         self.lines: list[int] = []
         self.drawn_coords: list[tuple[int, int]] = []
+        # (y, x) points clicked or passed by mouse, drawn_coords are pixels of lines between them
+        self.drawn_vertices: list[tuple[int, int]] = []
         # define line parameters for tk.Canvas.create_line() method
         self._line_width = 2
         self._line_fill_color = "#f5e505"
@@ -143,6 +185,25 @@ class ImageWindow(tk.Toplevel):
             self.img_canvas.delete(line)
         self.lines = []
         self.drawn_coords = []
+        self.drawn_vertices = []
+
+    @property
+    def full_size(self) -> tuple[int, int]:
+        """
+        (width, height) of the full resolution image, known before its decoding finishes.
+        """
+        return self.pending_image.size if self.pending_image else self._buffer.size
+
+    def canvas_to_image(self, canvas_x: float, canvas_y: float) -> Point:
+        """
+        Pixel of the full resolution image shown at given canvas coordinates, clipped to the image.
+        A preview is displayed at zoom × preview_scale and each of its pixels covers preview_scale
+        full resolution pixels, so zoom alone maps the canvas to the full image.
+        """
+        width, height = self.full_size
+        x = int(canvas_x / self.zoom)
+        y = int(canvas_y / self.zoom)
+        return min(max(x, 0), width - 1), min(max(y, 0), height - 1)
 
     def mouse_draw(self, event: tk.Event) -> None:
         """
@@ -150,37 +211,46 @@ class ImageWindow(tk.Toplevel):
 
         :param event: tkinter event from bind method
         """
-        current_coords = (event.x, event.y)
-        logger.debug(
-            [
-                *current_coords,
-                np.array(self.image)[current_coords[::-1]],
-                datetime.now(),
-            ]
+        # event position is relative to the visible part of the scrolled canvas
+        canvas_coords = (
+            self.img_canvas.canvasx(event.x),
+            self.img_canvas.canvasy(event.y),
         )
+        current_coords = self.canvas_to_image(*canvas_coords)
+        x, y = current_coords
+        # logged from the displayed buffer, reading `array` would wait for a pending full resolution image
+        buffer_width, buffer_height = self._buffer.size
+        buffer_x = min(int(x / self.preview_scale), buffer_width - 1)
+        buffer_y = min(int(y / self.preview_scale), buffer_height - 1)
+        logger.debug([x, y, self._buffer.pixel(buffer_x, buffer_y), datetime.now()])
         if self.previous_coords is not None:
             self.lines.append(
                 self.img_canvas.create_line(
-                    self.previous_coords,
-                    current_coords,
+                    self.previous_canvas_coords,
+                    canvas_coords,
                     width=self._line_width,
                     fill=self._line_fill_color,
                 )
             )
-            coords_bresenham = bresenham(self.previous_coords, current_coords)
+            # points are given by (x, y) but it should be reverted (y, x) for future numpy array indexing
+            coords_bresenham = bresenham_array(self.previous_coords, current_coords)[
+                :, ::-1
+            ]
 
             # last item in draw_coords is previous_coords from previous iteration,
             # so it have to be removed to avoid duplicates
             if len(self.drawn_coords) > 0:
                 self.drawn_coords.pop()
+            else:
+                self.drawn_vertices.append(self.previous_coords[::-1])
 
-            # points are given by (x, y) but it should be reverted (y, x) for future numpy array indexing
-            coords_bresenham = [c[::-1] for c in coords_bresenham]
-            self.drawn_coords.extend(coords_bresenham)
+            self.drawn_coords.extend(map(tuple, coords_bresenham.tolist()))
+            self.drawn_vertices.append(current_coords[::-1])
         else:
             self.clear_canvas()
 
         self.previous_coords = current_coords
+        self.previous_canvas_coords = canvas_coords
 
     def point_move(self) -> None:
         """
@@ -209,9 +279,34 @@ class ImageWindow(tk.Toplevel):
         # clear previous coordinates when LMB is released
         self.img_canvas.bind("<ButtonRelease-1>", clear_previous_coords_when_released)
 
+    @property
+    def buffer(self) -> ImageBuffer:
+        """
+        Full resolution pixel data. While the image is still being decoded, accessing it waits for the decoder,
+        so operations never see the preview.
+        """
+        if self.pending_image:
+            self.swap_pending_image()
+        return self._buffer
+
     @property
     def mode(self) -> str:
-        return self.image.mode
+        # previews have the same mode as the full image, so there is no need to wait for it
+        return self._buffer.mode
+
+    @property
+    def image(self) -> PILImage:
+        """
+        PIL view of the current buffer, use `array` for pixel operations.
+        """
+        return self.buffer.image
+
+    @property
+    def array(self) -> np.ndarray:
+        """
+        Read-only pixel array of the current buffer, in `np.array(image)` layout.
+        """
+        return self.buffer.array
 
     @staticmethod
     def calculate_window_id() -> str:
@@ -229,15 +324,11 @@ class ImageWindow(tk.Toplevel):
 
     @property
     def window_title(self) -> str:
-        resize_option = self.zoom_options[self.current_resize].value
-        if isinstance(resize_option, str):
-            image_size = resize_option
-        else:
-            image_size = f"{int(resize_option * 100)}%"
+        image_size = f"{round(self.zoom * 100)}%"
         return (
             f"{self.window_id} "
             f"{os.path.split(self.source_path)[-1] if self.source_path else self.default_file_name} "
-            f"{self.image.mode} "
+            f"{self.mode} "
             f"{image_size}"
         )
 
@@ -246,47 +337,182 @@ class ImageWindow(tk.Toplevel):
         self.source_path = source_path
         self.title(self.window_title)
 
-    def update_image(self, image: PILImage) -> None:
-        self.image = image
-        resize_scale = self.zoom_options[self.current_resize]
-        self.resize_image(resize_scale.value)
+    def update_image(
+        self,
+        image: PILImage,
+        step: PipelineStep | Pipeline | None = None,
+        source: object | None = None,
+    ) -> None:
+        self.update_buffer(ImageBuffer.from_image(image), step, source)
+
+    def update_array(
+        self,
+        image_array: np.ndarray,
+        step: PipelineStep | Pipeline | None = None,
+        source: object | None = None,
+    ) -> None:
+        """
+        Shows new pixel data, the array is taken over by the window without copying.
+        """
+        self.update_buffer(ImageBuffer(image_array), step, source)
+
+    def update_buffer(
+        self,
+        buffer: ImageBuffer,
+        step: PipelineStep | Pipeline | None = None,
+        source: object | None = None,
+    ) -> None:
+        """
+        Shows new pixel data and records the change in undo history and in the macro.
+
+        :param buffer: new pixel data
+        :param step: operation which produced the data, changes without it can not be replayed
+        :param source: widget which applied the operation, its next change replaces this one in the macro
+        """
+        merge = self._record_history(buffer, source)
+        if merge is not None:
+            self.macro.record(step, source, merge)
+            self.trim_macro()
+        self.show_buffer(buffer)
+
+    def reset_buffer(self, buffer: ImageBuffer, source: object) -> None:
+        """
+        Restores the image a widget was opened with and removes the change of the widget from the macro.
+        """
+        merge = self._record_history(buffer, source)
+        if merge is not None:
+            self.macro.revert(source, merge)
+            self.trim_macro()
+        self.show_buffer(buffer)
+
+    def trim_macro(self) -> None:
+        """
+        Steps dropped from undo history can not be reached in the macro either.
+        """
+        self.macro.trim(len(self.history.undo_patches), len(self.history.redo_patches))
+
+    def _record_history(
+        self, buffer: ImageBuffer, source: object | None
+    ) -> bool | None:
+        """
+        Records change to `buffer` in undo history. Updates of the same widget following each other quickly,
+        like previews of a moved slider, are recorded as a single step. Changes without a source widget,
+        i.e. applied from the menu, are always separate steps.
+
+        :return: whether the change was merged with the previous one, None if nothing changed
+        """
+        if buffer is self.buffer:
+            return None
+        now = time.monotonic()
+        merge = (
+            source is not None
+            and self.last_update_source is not None
+            and self.last_update_source() is source
+            and now - self.last_update_time < UNDO_MERGE_INTERVAL
+        )
+        self.history.record(self.buffer, buffer, merge=merge)
+        self.last_update_time = now
+        self.last_update_source = weakref.ref(source) if source is not None else None
+        return merge
+
+    def show_buffer(self, buffer: ImageBuffer) -> None:
+        self._buffer = buffer
+        self.resize_image(self.zoom)
+
+    def poll_pending_image(self) -> None:
+        if not self.pending_image:
+            return None
+        if self.pending_image.future.done():
+            self.swap_pending_image()
+        else:
+            self.after(DECODE_POLL_INTERVAL, self.poll_pending_image)
+
+    def swap_pending_image(self) -> None:
+        """
+        Replaces the preview with the full resolution image, waiting for its decoding if necessary.
+        If decoding fails, the preview becomes the image.
+        """
+        assert self.pending_image is not None
+        future, self.pending_image = self.pending_image.future, None
+        try:
+            buffer = future.result()
+        except (OSError, ValueError) as e:
+            logger.error(e)
+            self.zoom *= self.preview_scale
+        else:
+            self._buffer = buffer
+        self.preview_scale = 1.0
+        self.resize_image(self.zoom)
+
+    def undo(self) -> None:
+        previous = self.history.undo(self.buffer)
+        if previous is None:
+            logger.debug("Nothing to undo")
+            return None
+        self.macro.undo()
+        self.last_update_time = 0.0
+        self.show_buffer(previous)
+
+    def redo(self) -> None:
+        following = self.history.redo(self.buffer)
+        if following is None:
+            logger.debug("Nothing to redo")
+            return None
+        self.macro.redo()
+        self.last_update_time = 0.0
+        self.show_buffer(following)
 
     def refresh_display_image(self) -> None:
-        self._img.paste(self.displayed_image)
-        self.img_canvas.config(height=self._img.height(), width=self._img.width())
-        self.img_canvas.create_image(0, 0, image=self._img, anchor=tk.NW)
+        display_width, display_height = self.renderer.display_size
+        max_width = int(self.winfo_screenwidth() * DISPLAY_MAX_SCREEN_FRACTION)
+        max_height = int(self.winfo_screenheight() * DISPLAY_MAX_SCREEN_FRACTION)
         self.img_canvas.config(
-            xscrollcommand=self.hbar.set, yscrollcommand=self.vbar.set
+            width=min(display_width, max_width), height=min(display_height, max_height)
         )
         self.window_title = self.source_path  # type: ignore
-        self.img_canvas.config(
-            scrollregion=(0, 0, self.displayed_image.width, self.displayed_image.height)
-        )
+        self.renderer.update()
 
-    def resize(self, resize_event: tk.Event) -> None:
-        self.current_resize -= resize_event.delta // 120
-        if self.current_resize < 0:
-            self.current_resize = 0
-        elif self.current_resize >= len(self.zoom_options):
-            self.current_resize = len(self.zoom_options) - 1
+    def scroll_x(self, *args: Any) -> None:
+        """
+        Scrollbar command, renders tiles scrolled into view.
+        """
+        self.img_canvas.xview(*args)
+        self.renderer.update()
 
-        resize_scale = self.zoom_options[self.current_resize]
-        self.resize_image(resize_scale.value)
+    def scroll_y(self, *args: Any) -> None:
+        self.img_canvas.yview(*args)
+        self.renderer.update()
+
+    def resize(self, resize_event: tk.Event) -> None:
+        """
+        Zooms continuously by ZOOM_STEP per wheel step, keeping the image point under the cursor in place.
+        Only a fast preview is rendered here, so consecutive wheel steps do not wait for high quality tiles.
+        """
+        old_zoom = self.zoom
+        zoom = old_zoom * ZOOM_STEP ** (-resize_event.delta / 120)
+        zoom = min(max(zoom, MIN_ZOOM), MAX_ZOOM)
+        if zoom == old_zoom:
+            return None
+        # image coordinates of the cursor before zooming
+        image_x = self.img_canvas.canvasx(resize_event.x) / old_zoom
+        image_y = self.img_canvas.canvasy(resize_event.y) / old_zoom
+        self.resize_image(zoom)
+        display_width, display_height = self.renderer.display_size
+        self.img_canvas.xview_moveto((image_x * zoom - resize_event.x) / display_width)
+        self.img_canvas.yview_moveto((image_y * zoom - resize_event.y) / display_height)
+        self.renderer.update()
 
     def resize_image(self, resize_scale: float | Literal[ZoomEnum.ZOOM_FULL]) -> None:
         if (
             resize_scale == ZoomEnum.ZOOM_FULL
             or resize_scale == ZoomEnum.ZOOM_FULL.value
         ):
-            resize_scale = self.winfo_screenwidth() / self.image.width
-
-        self.displayed_image = self.image.resize(
-            (
-                round(self.image.width * resize_scale),
-                round(self.image.height * resize_scale),
-            ),
-            Resampling.LANCZOS,
-        )
+            resize_scale = self.winfo_screenwidth() / (
+                self._buffer.size[0] * self.preview_scale
+            )
+
+        self.zoom = float(resize_scale)
+        self.renderer.show(self._buffer, self.zoom * self.preview_scale)
         self.refresh_display_image()
 
 
@@ -0,0 +1,180 @@
+import logging
+import math
+import threading
+import weakref
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from imagepy.utils.constants import DISPLAY_TILE_SIZE, PYRAMID_MEMORY_LIMIT
+from imagepy.utils.image_buffer import ImageBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class PyramidMemory:
+    """
+    Keeps total size of pyramid levels of all images under a limit by dropping least recently used levels.
+    Dropped levels are rebuilt when they are needed again.
+    """
+
+    def __init__(self, memory_limit: int = PYRAMID_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.memory_bytes = 0
+        self._levels: OrderedDict[
+            tuple[int, int], tuple[weakref.ref["ImagePyramid"], int]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, pyramid: "ImagePyramid", level: int, nbytes: int) -> None:
+        with self._lock:
+            self._levels[id(pyramid), level] = (weakref.ref(pyramid), nbytes)
+            self.memory_bytes += nbytes
+            evicted = self._evict()
+        for evicted_pyramid, evicted_level in evicted:
+            evicted_pyramid.drop(evicted_level)
+
+    def touch(self, pyramid: "ImagePyramid", level: int) -> None:
+        with self._lock:
+            if (id(pyramid), level) in self._levels:
+                self._levels.move_to_end((id(pyramid), level))
+
+    def forget(self, pyramid_id: int) -> None:
+        """
+        Removes every level of a pyramid which does not exist anymore.
+        """
+        with self._lock:
+            for key in [key for key in self._levels if key[0] == pyramid_id]:
+                self.memory_bytes -= self._levels.pop(key)[1]
+
+    def _evict(self) -> list[tuple["ImagePyramid", int]]:
+        evicted = []
+        # the level added last is never evicted, even when it does not fit alone
+        while self.memory_bytes > self.memory_limit and len(self._levels) > 1:
+            (_pyramid_id, level), (reference, nbytes) = self._levels.popitem(last=False)
+            self.memory_bytes -= nbytes
+            pyramid = reference()
+            if pyramid is not None:
+                evicted.append((pyramid, level))
+        return evicted
+
+
+pyramid_memory = PyramidMemory()
+
+
+class ImagePyramid:
+    """
+    Reduced resolution versions of an image buffer. Level k is the image halved k times with area averaging,
+    level 0 is the buffer itself. Levels are built on demand in a background thread, each from the nearest
+    finer level, so displaying a zoomed out image never resamples the full resolution one again.
+    Use `ImagePyramid.of` to share a pyramid between all windows showing the same buffer.
+    The pyramid refers to its buffer weakly, so it is freed together with the buffer.
+    """
+
+    _pyramids: "weakref.WeakKeyDictionary[ImageBuffer, ImagePyramid]" = (
+        weakref.WeakKeyDictionary()
+    )
+    _pyramids_lock = threading.Lock()
+
+    def __init__(self, buffer: ImageBuffer, memory: PyramidMemory = pyramid_memory):
+        self.memory = memory
+        # level 0 is not kept here, a strong reference would keep the buffer alive as a key of `_pyramids`
+        self._source = weakref.ref(buffer)
+        self.levels: dict[int, ImageBuffer] = {}
+        self.size = buffer.size
+        # halving stops when the whole image fits into a single display tile
+        self.max_level = max(
+            0, math.ceil(math.log2(max(self.size) / DISPLAY_TILE_SIZE))
+        )
+        self._target = 0
+        self._builder: threading.Thread | None = None
+        self._lock = threading.Lock()
+        weakref.finalize(self, memory.forget, id(self))
+
+    @classmethod
+    def of(cls, buffer: ImageBuffer) -> "ImagePyramid":
+        with cls._pyramids_lock:
+            if buffer not in cls._pyramids:
+                cls._pyramids[buffer] = cls(buffer)
+            return cls._pyramids[buffer]
+
+    def level_for_scale(self, scale: float) -> int:
+        """
+        Coarsest level which still has at least the resolution needed to display the image at given scale.
+        """
+        if scale >= 1:
+            return 0
+        return min(self.max_level, int(math.floor(-math.log2(scale) + 1e-9)))
+
+    def level_size(self, level: int) -> tuple[int, int]:
+        width, height = self.size
+        return max(1, width >> level), max(1, height >> level)
+
+    def get(self, scale: float) -> tuple[ImageBuffer, bool]:
+        """
+        Finest needed level for given scale. When it was not built yet, it is requested and the nearest finer
+        built level is returned instead.
+
+        :param scale: display scale relative to the full resolution image
+        :return: level buffer and whether it is the requested level
+        """
+        level = self.level_for_scale(scale)
+        with self._lock:
+            available = self._finest_built(level)
+            buffer = self._level(available)
+        # the buffer is alive as long as anyone asks for its pyramid
+        assert buffer is not None
+        if available == level:
+            self.memory.touch(self, level)
+            return buffer, True
+        self.request(level)
+        return buffer, False
+
+    def request(self, level: int) -> None:
+        """
+        Builds levels up to given one in the background thread, unless they exist already.
+        """
+        with self._lock:
+            self._target = max(self._target, min(level, self.max_level))
+            if self._builder is not None and self._builder.is_alive():
+                return None
+            self._builder = threading.Thread(
+                target=self._build, name="pyramid builder", daemon=True
+            )
+            self._builder.start()
+
+    def _finest_built(self, level: int) -> int:
+        return max(built for built in (0, *self.levels) if built <= level)
+
+    def _level(self, level: int) -> ImageBuffer | None:
+        return self._source() if level == 0 else self.levels[level]
+
+    def drop(self, level: int) -> None:
+        if level == 0:
+            return None
+        with self._lock:
+            self.levels.pop(level, None)
+
+    def _build(self) -> None:
+        while True:
+            with self._lock:
+                # intermediate levels evicted meanwhile are not rebuilt, only the chain to the target
+                finest = self._finest_built(self._target)
+                source = self._level(finest)
+                if finest == self._target or source is None:
+                    self._target = 0
+                    return None
+                level = finest + 1
+            halved = ImageBuffer(self._halve(source.array, self.level_size(level)))
+            with self._lock:
+                self.levels[level] = halved
+            self.memory.add(self, level, halved.nbytes)
+            logger.debug(f"Pyramid level {level} built: {halved.size}")
+
+    @staticmethod
+    def _halve(image_array: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+        if image_array.dtype == np.bool_:
+            # averaged binary pixels become grey, like the edges of a scaled down binary image
+            image_array = image_array.view(np.uint8) * np.uint8(255)
+        return cv2.resize(image_array, size, interpolation=cv2.INTER_AREA)
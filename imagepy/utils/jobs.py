@@ -0,0 +1,199 @@
+import logging
+import threading
+import tkinter as tk
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Any, Callable, Generic, TypeVar
+
+from imagepy.utils.constants import JOB_POLL_INTERVAL, JOB_WORKERS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class JobCancelledError(Exception):
+    pass
+
+
+class CancellationToken:
+    """
+    Passed to every job function. Long running jobs should call `report` (or `check`) regularly,
+    it raises JobCancelledError once the job was cancelled, so the job stops at the next safe point.
+    """
+
+    def __init__(self) -> None:
+        self._cancelled = threading.Event()
+        self.progress: float | None = None
+        self.message = ""
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise JobCancelledError()
+
+    def report(self, progress: float, message: str = "") -> None:
+        """
+        :param progress: done part of the job, from 0 to 1
+        :param message: what the job is doing now
+        """
+        self.check()
+        self.progress = min(max(progress, 0.0), 1.0)
+        self.message = message
+
+
+class Job(Generic[T]):
+    """
+    Handle of a submitted job, similar to a Future. `on_done` is called with the result in the Tk main loop,
+    unless the job was cancelled.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        future: Future[T],
+        token: CancellationToken,
+        on_done: Callable[[T], Any] | None,
+        owner: object | None,
+    ):
+        self.name = name
+        self.future = future
+        self.token = token
+        self.on_done = on_done
+        self.owner = owner
+
+    @property
+    def progress(self) -> float | None:
+        return self.token.progress
+
+    @property
+    def cancelled(self) -> bool:
+        return self.token.cancelled
+
+    def cancel(self) -> None:
+        self.token.cancel()
+        self.future.cancel()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout: float | None = None) -> T:
+        return self.future.result(timeout)
+
+    def __repr__(self) -> str:
+        return f"Job({self.name!r}, progress={self.progress})"
+
+
+JobListener = Callable[[list[Job[Any]]], None]
+
+
+class JobExecutor:
+    """
+    Runs long operations in worker threads, so the Tk main loop keeps responding. Image operations spend
+    most of their time in NumPy and OpenCV, which release the GIL, so jobs of different windows run in parallel.
+    A new job of the same owner, i.e. an image window, cancels the previous one, so results never arrive
+    out of order. Finished jobs are collected by polling from the main loop with `after`, so callbacks
+    updating widgets always run in the Tk thread.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="job")
+        self.jobs: list[Job[Any]] = []
+        self.listeners: list[JobListener] = []
+        self.root: tk.Misc | None = None
+        self._poll_id: str | None = None
+
+    def attach(self, root: tk.Misc) -> None:
+        """
+        Sets widget whose main loop receives job results. Without it, callbacks run in worker threads.
+        """
+        self.root = root
+
+    def submit(
+        self,
+        name: str,
+        function: Callable[[CancellationToken], T],
+        on_done: Callable[[T], Any] | None = None,
+        owner: object | None = None,
+    ) -> Job[T]:
+        """
+        :param name: shown by progress indicators
+        :param function: job body, gets the token of the job
+        :param on_done: called with the result in the Tk main loop
+        :param owner: object the job works for, its previous jobs are cancelled
+        :return: job handle
+        """
+        if owner is not None:
+            self.cancel(owner)
+        token = CancellationToken()
+        future = self._executor.submit(function, token)
+        job = Job(name, future, token, on_done, owner)
+        self.jobs.append(job)
+        logger.debug(f"Job submitted: {name}")
+
+        if self.root is None:
+            future.add_done_callback(lambda _: self._finish(job))
+        elif self._poll_id is None:
+            self._poll_id = self.root.after(JOB_POLL_INTERVAL, self._poll)
+        self._notify()
+        return job
+
+    def cancel(self, owner: object | None = None) -> None:
+        """
+        Cancels jobs of given owner, or all jobs.
+        """
+        for job in self.jobs:
+            if owner is None or job.owner is owner:
+                job.cancel()
+
+    def _poll(self) -> None:
+        self._poll_id = None
+        for job in [job for job in self.jobs if job.done()]:
+            self._finish(job)
+        self._notify()
+        if self.jobs and self.root is not None:
+            self._poll_id = self.root.after(JOB_POLL_INTERVAL, self._poll)
+
+    def _finish(self, job: Job[Any]) -> None:
+        if job in self.jobs:
+            self.jobs.remove(job)
+        try:
+            result = job.result()
+        except (CancelledError, JobCancelledError):
+            logger.debug(f"Job cancelled: {job.name}")
+            return None
+        except Exception as e:
+            logger.error(e)
+            return None
+        if job.cancelled:
+            logger.debug(f"Result of cancelled job discarded: {job.name}")
+            return None
+        if job.on_done is not None:
+            try:
+                job.on_done(result)
+            except (ValueError, tk.TclError) as e:
+                logger.error(e)
+
+    def _notify(self) -> None:
+        for listener in self.listeners:
+            listener(list(self.jobs))
+
+
+job_executor = JobExecutor()
+
+
+def run_job(
+    name: str,
+    function: Callable[[CancellationToken], T],
+    on_done: Callable[[T], Any] | None = None,
+    owner: object | None = None,
+) -> Job[T]:
+    """
+    Submits job to the shared executor, see `JobExecutor.submit`.
+    """
+    return job_executor.submit(name, function, on_done, owner)
@@ -0,0 +1,358 @@
+import logging
+from typing import Callable, Final, Sequence
+
+import numpy as np
+from PIL import Image
+from PIL.Image import Image as PILImage
+
+from imagepy.utils.constants import ImageModeEnum
+
+logger = logging.getLogger(__name__)
+
+# number of set bits of every byte value
+POPCOUNT_TABLE: Final = np.unpackbits(
+    np.arange(256, dtype=np.uint8)[:, None], axis=1
+).sum(axis=1, dtype=np.uint8)
+
+WordShift = Callable[[np.ndarray, int], np.ndarray]
+
+
+class PackedBinaryImage:
+    """
+    Binary image with 8 pixels per byte, in `np.packbits` layout: rows are packed separately,
+    the first pixel of each byte is its most significant bit and the last byte of a row is padded with zeros.
+    It is the same layout PIL uses for mode "1" images, so converting from and to PIL is a single copy.
+    Padding bits are always kept at zero.
+    """
+
+    def __init__(self, words: np.ndarray, width: int):
+        """
+        :param words: uint8 array of shape (height, ceil(width / 8))
+        :param width: image width in pixels
+        """
+        if words.dtype != np.uint8 or words.ndim != 2:
+            raise ValueError(f"Packed words have to be a 2D uint8 array! {words.dtype}")
+        if words.shape[1] != (width + 7) // 8:
+            raise ValueError(
+                f"Width does not match packed row length! {width} {words.shape[1]}"
+            )
+        self.words = words
+        self.width = width
+
+    @classmethod
+    def from_array(cls, image_array: np.ndarray) -> "PackedBinaryImage":
+        """
+        :param image_array: 2D array, non-zero values are foreground
+        """
+        return cls(np.packbits(image_array != 0, axis=1), image_array.shape[1])
+
+    @classmethod
+    def from_image(cls, image: PILImage) -> "PackedBinaryImage":
+        if image.mode != ImageModeEnum.BINARY:
+            image = image.convert(ImageModeEnum.BINARY)
+        width, height = image.size
+        words = np.frombuffer(image.tobytes(), dtype=np.uint8)
+        return cls(words.reshape(height, (width + 7) // 8).copy(), width)
+
+    def to_array(self) -> np.ndarray:
+        """
+        :return: bool array
+        """
+        return np.unpackbits(self.words, axis=1, count=self.width).view(bool)
+
+    def to_image(self) -> PILImage:
+        return Image.frombytes(ImageModeEnum.BINARY, self.size, self.words.tobytes())
+
+    @property
+    def height(self) -> int:
+        return int(self.words.shape[0])
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.height, self.width
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """
+        PIL style (width, height) size.
+        """
+        return self.width, self.height
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.words.nbytes)
+
+    def pixel(self, x: int, y: int) -> bool:
+        return bool(self.words[y, x >> 3] >> (7 - (x & 7)) & 1)
+
+    def take(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        """
+        Gathers pixels at given positions without unpacking the image.
+
+        :param ys: integer row indices
+        :param xs: integer column indices, same shape as ys
+        :return: bool array of ys shape
+        """
+        bits = self.words[ys, xs >> 3] >> (7 - (xs & 7)).astype(np.uint8)
+        return (bits & 1).astype(bool)
+
+    def count(self) -> int:
+        """
+        Number of foreground pixels.
+        """
+        return int(POPCOUNT_TABLE[self.words].sum(dtype=np.int64))
+
+    def row_counts(self) -> np.ndarray:
+        """
+        Number of foreground pixels in every row.
+        """
+        return POPCOUNT_TABLE[self.words].sum(axis=1, dtype=np.int64)
+
+    def __and__(self, other: "PackedBinaryImage") -> "PackedBinaryImage":
+        self._check_shape(other)
+        return PackedBinaryImage(self.words & other.words, self.width)
+
+    def __or__(self, other: "PackedBinaryImage") -> "PackedBinaryImage":
+        self._check_shape(other)
+        return PackedBinaryImage(self.words | other.words, self.width)
+
+    def __xor__(self, other: "PackedBinaryImage") -> "PackedBinaryImage":
+        self._check_shape(other)
+        return PackedBinaryImage(self.words ^ other.words, self.width)
+
+    def __invert__(self) -> "PackedBinaryImage":
+        words: np.ndarray = ~self.words
+        words[:, -1:] &= self._last_word_mask()
+        return PackedBinaryImage(words, self.width)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PackedBinaryImage):
+            return NotImplemented
+        return self.shape == other.shape and np.array_equal(self.words, other.words)
+
+    def shift(self, dy: int, dx: int) -> "PackedBinaryImage":
+        """
+        Moves image content by (dy, dx) pixels, pixels shifted in from outside are background.
+        """
+        return PackedBinaryImage(
+            self._shift_rows(self._shift_columns(self.words, dx), dy), self.width
+        )
+
+    def neighbour(
+        self, dy: int, dx: int, edge: np.ndarray | bool = False
+    ) -> "PackedBinaryImage":
+        """
+        Image of neighbours one pixel away, pixel (y, x) of the result is pixel (y + dy, x + dx) of the image.
+
+        :param dy: row offset, -1, 0 or 1
+        :param dx: column offset, -1, 0 or 1, only one of the offsets may be non-zero
+        :param edge: values of the row or column of neighbours beyond the image edge, or one value for all of them
+        """
+        if abs(dy) + abs(dx) != 1:
+            raise ValueError(f"Neighbour has to be one pixel away! {dy} {dx}")
+        neighbours = self.shift(-dy, -dx)
+        if dy:
+            neighbours._set_row(0 if dy < 0 else -1, edge)
+        else:
+            neighbours._set_column(0 if dx < 0 else self.width - 1, edge)
+        return neighbours
+
+    def with_frame(self, value: bool) -> "PackedBinaryImage":
+        """
+        Copy of the image with the outermost rows and columns set to `value`.
+        """
+        framed = PackedBinaryImage(self.words.copy(), self.width)
+        framed._set_row(0, value)
+        framed._set_row(-1, value)
+        framed._set_column(0, value)
+        framed._set_column(self.width - 1, value)
+        return framed
+
+    def row(self, y: int) -> np.ndarray:
+        """
+        :return: bool pixels of one row
+        """
+        return np.unpackbits(self.words[y], count=self.width).view(bool)
+
+    def column(self, x: int) -> np.ndarray:
+        """
+        :return: bool pixels of one column
+        """
+        return (self.words[:, x >> 3] >> (7 - (x & 7)) & 1).view(bool)
+
+    def dilate(self, height: int = 3, width: int = 3) -> "PackedBinaryImage":
+        """
+        Dilation with a rectangular structuring element anchored in its centre, like `cv2.dilate`.
+        Each direction costs O(log(size)) shifted word operations. Pixels outside of the image are background.
+
+        :param height: structuring element height
+        :param width: structuring element width
+        """
+        if height < 1 or width < 1:
+            raise ValueError(
+                f"Structuring element size has to be positive! {height}x{width}"
+            )
+        words = self._run_or(self.words, width, self._shift_columns)
+        words = self._run_or(words, height, self._shift_rows)
+        return PackedBinaryImage(words, self.width)
+
+    def erode(self, height: int = 3, width: int = 3) -> "PackedBinaryImage":
+        """
+        Erosion with a rectangular structuring element anchored in its centre, like `cv2.erode`.
+        Pixels outside of the image never erode the foreground.
+        """
+        return ~((~self).dilate(height, width))
+
+    def _check_shape(self, other: "PackedBinaryImage") -> None:
+        if self.shape != other.shape:
+            raise ValueError(
+                f"Images have different shapes! {self.shape} {other.shape}"
+            )
+
+    def _set_row(self, y: int, values: np.ndarray | bool) -> None:
+        """
+        Overwrites one row in place, only used on words the image owns.
+        """
+        pixels = np.broadcast_to(np.asarray(values, dtype=bool), (self.width,))
+        self.words[y] = np.packbits(pixels)
+
+    def _set_column(self, x: int, values: np.ndarray | bool) -> None:
+        """
+        Overwrites one column in place, only used on words the image owns.
+        """
+        bit = np.uint8(0x80 >> (x & 7))
+        pixels = np.broadcast_to(np.asarray(values, dtype=bool), (self.height,))
+        self.words[:, x >> 3] &= ~bit
+        self.words[:, x >> 3] |= pixels * bit
+
+    def _last_word_mask(self) -> np.uint8:
+        used_bits = self.width % 8 or 8
+        return np.uint8((0xFF << (8 - used_bits)) & 0xFF)
+
+    def _shift_columns(self, words: np.ndarray, dx: int) -> np.ndarray:
+        """
+        Pixel at x moves to x + dx.
+        """
+        if dx == 0:
+            return words
+        if abs(dx) >= self.width:
+            return np.zeros_like(words)
+        byte_shift, bit_shift = divmod(abs(dx), 8)
+        shifted = np.zeros_like(words)
+        if dx > 0:
+            # moving right means moving towards less significant bits
+            shifted[:, byte_shift:] = words[:, : words.shape[1] - byte_shift]
+            if bit_shift:
+                carry = np.zeros_like(shifted)
+                carry[:, 1:] = shifted[:, :-1] << (8 - bit_shift)
+                shifted = (shifted >> bit_shift) | carry
+            shifted[:, -1:] &= self._last_word_mask()
+        else:
+            shifted[:, : words.shape[1] - byte_shift] = words[:, byte_shift:]
+            if bit_shift:
+                carry = np.zeros_like(shifted)
+                carry[:, :-1] = shifted[:, 1:] >> (8 - bit_shift)
+                shifted = (shifted << bit_shift) | carry
+        return shifted
+
+    @staticmethod
+    def _shift_rows(words: np.ndarray, dy: int) -> np.ndarray:
+        """
+        Row y moves to y + dy.
+        """
+        if dy == 0:
+            return words
+        shifted = np.zeros_like(words)
+        if abs(dy) >= len(words):
+            return shifted
+        if dy > 0:
+            shifted[dy:] = words[:-dy]
+        else:
+            shifted[:dy] = words[-dy:]
+        return shifted
+
+    @staticmethod
+    def _run_or(words: np.ndarray, size: int, shift: WordShift) -> np.ndarray:
+        """
+        OR of `size` neighbours along one axis, `size // 2` of them before the pixel. Runs on both sides
+        of the pixel are built separately by doubling, so pixels near borders only see pixels inside the image.
+        """
+        anchor = size // 2
+        before = PackedBinaryImage._run_one_side(words, anchor + 1, shift, 1)
+        after = PackedBinaryImage._run_one_side(words, size - anchor, shift, -1)
+        return before | after
+
+    @staticmethod
+    def _run_one_side(
+        words: np.ndarray, length: int, shift: WordShift, direction: int
+    ) -> np.ndarray:
+        """
+        OR of `length` consecutive pixels starting at each pixel and going against `direction`.
+        """
+        run, covered = words, 1
+        while covered * 2 <= length:
+            run = run | shift(run, direction * covered)
+            covered *= 2
+        if covered < length:
+            run = run | shift(run, direction * (length - covered))
+        return run
+
+
+def apply_truth_table(
+    inputs: Sequence[PackedBinaryImage], table: np.ndarray
+) -> PackedBinaryImage:
+    """
+    Evaluates a boolean function of several images on packed words, 8 pixels per operation.
+    The table is split on one input at a time (Shannon expansion) and identical halves are evaluated once,
+    so simple functions take only a few word operations.
+
+    :param inputs: images of the same shape
+    :param table: function value for every combination of inputs, bit i of the index is the value of input i
+    :return: image of function values
+    """
+    if not inputs or len(table) != 2 ** len(inputs):
+        raise ValueError(
+            f"Truth table does not match number of inputs! {len(table)} {len(inputs)}"
+        )
+    for image in inputs[1:]:
+        inputs[0]._check_shape(image)
+    words = [image.words for image in inputs]
+    result = _select(words, tuple(bool(value) for value in table), {})
+    if isinstance(result, bool):
+        result = np.full_like(words[0], 0xFF if result else 0)
+    elif any(result is input_words for input_words in words):
+        result = result.copy()
+    result[:, -1:] &= inputs[0]._last_word_mask()
+    return PackedBinaryImage(result, inputs[0].width)
+
+
+def _select(
+    words: list[np.ndarray],
+    table: tuple[bool, ...],
+    cache: dict[tuple[bool, ...], np.ndarray | bool],
+) -> np.ndarray | bool:
+    """
+    Words of the function given by the table, or a bool when it is constant. Padding bits may be set.
+    """
+    if all(table) or not any(table):
+        return table[0]
+    if table in cache:
+        return cache[table]
+    half = len(table) // 2
+    # the highest index bit belongs to the last input of this subtable
+    selector = words[half.bit_length() - 1]
+    low = _select(words, table[:half], cache)
+    high = _select(words, table[half:], cache)
+    result: np.ndarray | bool
+    if table[:half] == table[half:]:
+        result = low
+    elif isinstance(high, bool) and isinstance(low, bool):
+        result = selector if high else ~selector
+    elif isinstance(high, bool):
+        result = selector | low if high else low & ~selector
+    elif isinstance(low, bool):
+        result = ~selector | high if low else selector & high
+    else:
+        result = low ^ (selector & (low ^ high))
+    cache[table] = result
+    return result
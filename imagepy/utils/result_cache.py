@@ -0,0 +1,209 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+
+from imagepy.utils.constants import (
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_DISK_LIMIT,
+    RESULT_CACHE_MEMORY_LIMIT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheStatistics:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    memory_bytes: int = 0
+    disk_bytes: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        requests = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / requests if requests else 0.0
+
+
+def _update_hash(hasher: Any, value: Any) -> None:
+    """
+    Feeds value into hasher in a canonical form. Arrays are hashed by their content, not by repr,
+    which would be truncated for bigger arrays.
+    """
+    if isinstance(value, np.ndarray):
+        hasher.update(f"ndarray{value.dtype.str}{value.shape}".encode())
+        hasher.update(np.ascontiguousarray(value).data)
+    elif isinstance(value, dict):
+        hasher.update(b"dict")
+        for key in sorted(value, key=repr):
+            _update_hash(hasher, key)
+            _update_hash(hasher, value[key])
+    elif isinstance(value, (list, tuple)):
+        hasher.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update_hash(hasher, item)
+    else:
+        hasher.update(f"{type(value).__name__}:{value!r};".encode())
+
+
+def cache_key(operation_id: str, image_array: np.ndarray, params: Any) -> str:
+    """
+    :param operation_id: unique operation name
+    :param image_array: operation input
+    :param params: operation parameters, may contain arrays, dicts, lists and tuples
+    :return: hex digest identifying operation result
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    _update_hash(hasher, operation_id)
+    _update_hash(hasher, image_array)
+    _update_hash(hasher, params)
+    return hasher.hexdigest()
+
+
+class ResultCache:
+    """
+    Two tier cache for operation results. Recently used results are kept in memory,
+    results evicted from memory may still be found on disk if disk directory is set.
+    """
+
+    def __init__(
+        self,
+        memory_limit: int = RESULT_CACHE_MEMORY_LIMIT,
+        disk_dir: str | Path | None = RESULT_CACHE_DIR,
+        disk_limit: int = RESULT_CACHE_DISK_LIMIT,
+    ):
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.statistics = CacheStatistics()
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self.statistics.disk_bytes = sum(
+                path.stat().st_size for path in self.disk_dir.glob("*.npy")
+            )
+
+    def get_or_compute(
+        self,
+        operation_id: str,
+        image_array: np.ndarray,
+        params: Any,
+        compute: Callable[[], np.ndarray],
+    ) -> np.ndarray:
+        """
+        Returns cached result or computes and stores it. Returned arrays are read-only,
+        because the same array may be returned again later.
+
+        :param operation_id: unique operation name
+        :param image_array: operation input
+        :param params: every parameter which changes operation result
+        :param compute: called on cache miss
+        :return: operation result
+        """
+        key = cache_key(operation_id, image_array, params)
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.statistics.memory_hits += 1
+                return self._memory[key]
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.statistics.misses += 1
+                return None
+            self.statistics.disk_hits += 1
+            self._store_memory(key, result)
+        return result
+
+    def put(self, key: str, result: np.ndarray) -> None:
+        result.setflags(write=False)
+        with self._lock:
+            self._store_memory(key, result)
+        self._write_disk(key, result)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self.statistics = CacheStatistics()
+            if self.disk_dir:
+                for path in self.disk_dir.glob("*.npy"):
+                    path.unlink(missing_ok=True)
+
+    def _store_memory(self, key: str, result: np.ndarray) -> None:
+        if result.nbytes > self.memory_limit:
+            return None
+        if key not in self._memory:
+            self._memory[key] = result
+            self.statistics.memory_bytes += result.nbytes
+        self._memory.move_to_end(key)
+        while self.statistics.memory_bytes > self.memory_limit:
+            _evicted_key, evicted = self._memory.popitem(last=False)
+            self.statistics.memory_bytes -= evicted.nbytes
+
+    def _disk_path(self, key: str) -> Path | None:
+        return self.disk_dir / f"{key}.npy" if self.disk_dir else None
+
+    def _read_disk(self, key: str) -> np.ndarray | None:
+        path = self._disk_path(key)
+        if not path or not path.exists():
+            return None
+        try:
+            result = np.load(path, allow_pickle=False)
+        except (OSError, ValueError) as e:
+            logger.error(e)
+            return None
+        # modification time is used as last access time for disk eviction
+        os.utime(path)
+        result.setflags(write=False)
+        return result
+
+    def _write_disk(self, key: str, result: np.ndarray) -> None:
+        path = self._disk_path(key)
+        if not path or path.exists() or result.nbytes > self.disk_limit:
+            return None
+        try:
+            # write to temporary file first, so other sessions never read half written results
+            temporary_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            with open(temporary_path, "wb") as f:
+                np.save(f, result, allow_pickle=False)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logger.error(e)
+            return None
+
+        with self._lock:
+            self.statistics.disk_bytes += path.stat().st_size
+            if self.statistics.disk_bytes > self.disk_limit:
+                self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        assert self.disk_dir is not None
+        paths = sorted(self.disk_dir.glob("*.npy"), key=lambda p: p.stat().st_mtime_ns)
+        for path in paths:
+            if self.statistics.disk_bytes <= self.disk_limit:
+                break
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:  # already removed by another session
+                continue
+            self.statistics.disk_bytes -= size
+
+
+result_cache = ResultCache()
@@ -0,0 +1,224 @@
+import logging
+import math
+import tkinter as tk
+from dataclasses import dataclass
+from typing import Final
+
+from PIL import ImageTk
+from PIL.Image import Image as PILImage
+from PIL.Image import Resampling
+
+from imagepy.utils.constants import DISPLAY_TILE_SIZE, PYRAMID_POLL_INTERVAL
+from imagepy.utils.image_buffer import ImageBuffer
+from imagepy.utils.image_pyramid import ImagePyramid
+
+logger = logging.getLogger(__name__)
+
+TILE_TAG: Final = "tile"
+
+TileKey = tuple[int, int]
+
+
+@dataclass
+class DisplayTile:
+    """
+    :param item: canvas image item showing the tile
+    :param photo: tile pixels, it has to be referenced for as long as the item shows it
+    :param refined: whether the tile was rendered with the high quality filter
+    """
+
+    item: int
+    photo: ImageTk.PhotoImage
+    refined: bool
+
+
+class TiledRenderer:
+    """
+    Shows an image buffer on a canvas as a grid of tiles at given scale. Only tiles intersecting the visible part
+    of the canvas are rendered, tiles scrolled out of view hand their canvas items over to newly visible ones,
+    so the cost of displaying depends on the window size, not on the image size.
+    Zoomed out tiles are resampled from the nearest level of the image pyramid. While that level is being built,
+    a finer one is shown and tiles are rendered again once it is ready.
+    Rendering is progressive: new tiles are first resampled with the fast filter, then refined one by one
+    with LANCZOS in idle time, so a zoom or scroll arriving meanwhile is handled before the refinement goes on.
+    """
+
+    def __init__(self, canvas: tk.Canvas, tile_size: int = DISPLAY_TILE_SIZE):
+        self.canvas = canvas
+        self.tile_size = tile_size
+        self.buffer: ImageBuffer | None = None
+        self.scale = 1.0
+        self.source: ImageBuffer | None = None
+        self._poll_id: str | None = None
+        self._refine_id: str | None = None
+        self.tiles: dict[TileKey, DisplayTile] = {}
+        self.spare_items: list[int] = []
+        # number of tiles rendered since creation, to check how much work scrolling and zooming does
+        self.rendered_tiles = 0
+
+    @property
+    def display_size(self) -> tuple[int, int]:
+        """
+        (width, height) of the whole scaled image.
+        """
+        if self.buffer is None:
+            return 0, 0
+        width, height = self.buffer.size
+        return max(1, round(width * self.scale)), max(1, round(height * self.scale))
+
+    def show(self, buffer: ImageBuffer, scale: float) -> None:
+        """
+        Shows buffer at given scale, tiles of the previous content are discarded when anything changed.
+        """
+        if buffer is not self.buffer or scale != self.scale:
+            self.buffer = buffer
+            self.scale = scale
+            self.canvas.config(scrollregion=(0, 0, *self.display_size))
+            self._release_all()
+            self._select_source()
+        self.update()
+
+    def _select_source(self) -> None:
+        """
+        Picks the pyramid level tiles are resampled from, discarding tiles rendered from another one.
+        """
+        assert self.buffer is not None
+        if self._poll_id is not None:
+            self.canvas.after_cancel(self._poll_id)
+            self._poll_id = None
+        source, ready = ImagePyramid.of(self.buffer).get(self.scale)
+        if source is not self.source:
+            self._release_all()
+            self.source = source
+        if not ready:
+            self._poll_id = self.canvas.after(PYRAMID_POLL_INTERVAL, self._poll_pyramid)
+
+    def _poll_pyramid(self) -> None:
+        self._poll_id = None
+        self._select_source()
+        self.update()
+
+    def update(self, *_: object) -> None:
+        """
+        Renders tiles which became visible and releases those which are not visible anymore.
+        Call it whenever the canvas is scrolled or resized.
+        """
+        if self.buffer is None:
+            return None
+        visible = self.visible_tiles()
+        for key in self.tiles.keys() - visible:
+            self._release(key)
+        for key in sorted(visible - self.tiles.keys()):
+            self._place(key, *self.render_tile(key, fast=True))
+        self._schedule_refinement()
+
+    def _schedule_refinement(self) -> None:
+        if self._refine_id is None and any(
+            not tile.refined for tile in self.tiles.values()
+        ):
+            self._refine_id = self.canvas.after_idle(self._refine_next)
+
+    def _refine_next(self) -> None:
+        """
+        Renders a single fast tile again with the high quality filter and schedules the next one.
+        """
+        self._refine_id = None
+        unrefined = sorted(key for key, tile in self.tiles.items() if not tile.refined)
+        if not unrefined:
+            return None
+        tile = self.tiles[unrefined[0]]
+        tile_image, tile.refined = self.render_tile(unrefined[0], fast=False)
+        tile.photo = ImageTk.PhotoImage(tile_image)
+        self.canvas.itemconfigure(tile.item, image=tile.photo)
+        self._schedule_refinement()
+
+    def visible_tiles(self) -> set[TileKey]:
+        """
+        (row, column) of every tile intersecting the visible canvas region.
+        """
+        display_width, display_height = self.display_size
+        # before the canvas is mapped its real size is not known yet, so the requested one is used
+        view_width = max(self.canvas.winfo_width(), int(self.canvas.cget("width")))
+        view_height = max(self.canvas.winfo_height(), int(self.canvas.cget("height")))
+        left = max(0.0, self.canvas.canvasx(0))
+        top = max(0.0, self.canvas.canvasy(0))
+        right = min(display_width, left + view_width)
+        bottom = min(display_height, top + view_height)
+        return {
+            (row, column)
+            for row in range(
+                int(top // self.tile_size), math.ceil(bottom / self.tile_size)
+            )
+            for column in range(
+                int(left // self.tile_size), math.ceil(right / self.tile_size)
+            )
+        }
+
+    def tile_box(self, key: TileKey) -> tuple[int, int, int, int]:
+        """
+        (left, top, right, bottom) of the tile in display coordinates.
+        """
+        row, column = key
+        display_width, display_height = self.display_size
+        left, top = column * self.tile_size, row * self.tile_size
+        return (
+            left,
+            top,
+            min(left + self.tile_size, display_width),
+            min(top + self.tile_size, display_height),
+        )
+
+    def render_tile(self, key: TileKey, fast: bool) -> tuple[PILImage, bool]:
+        """
+        Scales the part of the source level under the tile. Resampling a box of the whole level, instead of
+        a crop, makes the filter see pixels beyond tile borders, so tiles join without seams.
+
+        :param key: tile (row, column)
+        :param fast: use nearest neighbour instead of LANCZOS
+        :return: tile image and whether it is final quality
+        """
+        assert self.buffer is not None and self.source is not None
+        left, top, right, bottom = self.tile_box(key)
+        image = self.source.image
+        self.rendered_tiles += 1
+        if self.source is self.buffer and self.scale == 1:
+            return image.crop((left, top, right, bottom)), True
+        # levels are not exactly halved when the image size is odd, so each axis has its own scale
+        scale_x = self.scale * self.buffer.size[0] / self.source.size[0]
+        scale_y = self.scale * self.buffer.size[1] / self.source.size[1]
+        tile_image = image.resize(
+            (right - left, bottom - top),
+            Resampling.NEAREST if fast else Resampling.LANCZOS,
+            box=(left / scale_x, top / scale_y, right / scale_x, bottom / scale_y),
+        )
+        return tile_image, not fast
+
+    def _place(self, key: TileKey, tile_image: PILImage, refined: bool) -> None:
+        photo = ImageTk.PhotoImage(tile_image)
+        if self.spare_items:
+            item = self.spare_items.pop()
+            self.canvas.itemconfigure(item, image=photo, state=tk.NORMAL)
+        else:
+            item = self.canvas.create_image(
+                0, 0, image=photo, anchor=tk.NW, tags=TILE_TAG
+            )
+        left, top, _right, _bottom = self.tile_box(key)
+        self.canvas.coords(item, left, top)
+        # drawings made on the canvas stay above the image
+        self.canvas.tag_lower(item)
+        self.tiles[key] = DisplayTile(item, photo, refined)
+
+    def _release_all(self) -> None:
+        """
+        Discards every tile together with a pending refinement of them.
+        """
+        if self._refine_id is not None:
+            self.canvas.after_cancel(self._refine_id)
+            self._refine_id = None
+        for key in list(self.tiles):
+            self._release(key)
+
+    def _release(self, key: TileKey) -> None:
+        tile = self.tiles.pop(key)
+        self.canvas.itemconfigure(tile.item, image="", state=tk.HIDDEN)
+        self.spare_items.append(tile.item)
@@ -0,0 +1,355 @@
+import itertools
+import logging
+import struct
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Final, Iterator
+
+import numpy as np
+from PIL import Image, ImageFile
+
+from imagepy.lab6.parallel_measures import measure_image_parallel
+from imagepy.lab6.shape_measures import MeasureTable
+from imagepy.utils.constants import (
+    OUT_OF_CORE_DIR,
+    OUT_OF_CORE_STRIP_PIXELS,
+    OUT_OF_CORE_TILE_SIZE,
+    ImageModeEnum,
+)
+from imagepy.utils.image_buffer import normalize_image
+
+logger = logging.getLogger(__name__)
+
+# uncompressed PIL raw modes which can be memory-mapped straight from the image file
+RAW_MODE_DTYPES: Final[dict[str, np.dtype]] = {
+    ImageModeEnum.GREYSCALE: np.dtype(np.uint8),
+    ImageModeEnum.GREYSCALE_16: np.dtype("<u2"),
+    ImageModeEnum.COLOR: np.dtype(np.uint8),
+}
+
+TIFF_SUFFIXES: Final = (".tif", ".tiff")
+# classic TIFF addresses data with 32-bit offsets
+TIFF_MAX_BYTES: Final = 2**32 - 1
+TIFF_SHORT: Final = 3
+TIFF_LONG: Final = 4
+
+TileFunction = Callable[[np.ndarray], np.ndarray]
+Tile = tuple[slice, slice]
+
+
+class TiledStore:
+    """
+    Image too big for memory, kept in a memory-mapped file on local disk and processed tile by tile.
+    Only the tiles being processed are paged in, so memory use depends on the tile size, not on the image size.
+    """
+
+    _ids = itertools.count()
+
+    def __init__(self, array: np.memmap, path: Path, owned: bool):
+        """
+        :param array: memory-mapped pixels in `np.array(image)` layout
+        :param path: mapped file
+        :param owned: whether the file was created by the store and is deleted with it
+        """
+        self.array = array
+        self.path = path
+        self.owned = owned
+
+    @classmethod
+    def create(
+        cls,
+        shape: tuple[int, ...],
+        dtype: np.dtype | type,
+        directory: str | Path | None = OUT_OF_CORE_DIR,
+    ) -> "TiledStore":
+        """
+        New zero filled store in a .npy file, so it can be opened with `np.load(path, mmap_mode="r")` later.
+        """
+        directory = Path(directory or tempfile.gettempdir())
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"imagepy-store-{id(cls)}-{next(cls._ids)}.npy"
+        array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        return cls(array, path, owned=True)
+
+    @classmethod
+    def from_array(
+        cls, image_array: np.ndarray, directory: str | Path | None = OUT_OF_CORE_DIR
+    ) -> "TiledStore":
+        store = cls.create(image_array.shape, image_array.dtype, directory)
+        for tile in store.tiles():
+            store.array[tile] = image_array[tile]
+        return store
+
+    @classmethod
+    def open(
+        cls, image_path: str | Path, directory: str | Path | None = OUT_OF_CORE_DIR
+    ) -> "TiledStore":
+        """
+        Opens image file as a store. Uncompressed images, i.e. plain TIFFs, are mapped read-only straight from
+        the file without decoding. Other formats have to be decoded as a whole first and are copied into a new store,
+        their modes are converted as in the GUI, see `normalize_image`.
+        """
+        image_path = Path(image_path)
+        array = cls._map_raw(image_path)
+        if array is not None:
+            return cls(array, image_path, owned=False)
+
+        logger.warning(
+            f"{image_path} is not stored uncompressed, it is decoded into memory before it is stored"
+        )
+        with Image.open(image_path) as image:
+            return cls.from_array(np.array(normalize_image(image)), directory)
+
+    @staticmethod
+    def _map_raw(image_path: Path) -> np.memmap | None:
+        """
+        Maps pixels of an image stored as a single raw tile, top to bottom without row padding.
+        """
+        # only the header is read here, so the decompression bomb check of PIL does not apply
+        max_pixels, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+        try:
+            with Image.open(image_path) as image:
+                mode, (width, height) = image.mode, image.size
+                tiles = (
+                    image.tile if isinstance(image, ImageFile.ImageFile) else None
+                ) or []
+        finally:
+            Image.MAX_IMAGE_PIXELS = max_pixels
+
+        if len(tiles) != 1 or mode not in RAW_MODE_DTYPES:
+            return None
+        decoder, extents, offset, args = tiles[0]
+        if not (
+            decoder == "raw"
+            and extents == (0, 0, width, height)
+            and args in ((mode, 0, 1), (mode, 0))
+        ):
+            return None
+        shape: tuple[int, ...] = (height, width)
+        if mode == ImageModeEnum.COLOR:
+            shape += (3,)
+        return np.memmap(
+            image_path,
+            dtype=RAW_MODE_DTYPES[mode],
+            mode="r",
+            offset=offset,
+            shape=shape,
+        )
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(self.array.shape)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.array.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.array.nbytes)
+
+    def tiles(self, tile_size: int = OUT_OF_CORE_TILE_SIZE) -> Iterator[Tile]:
+        """
+        (rows, columns) slices of all tiles in raster order.
+        """
+        height, width = self.shape[:2]
+        for top in range(0, height, tile_size):
+            for left in range(0, width, tile_size):
+                yield slice(top, min(top + tile_size, height)), slice(
+                    left, min(left + tile_size, width)
+                )
+
+    def read(self, tile: Tile, halo: int = 0) -> tuple[np.ndarray, Tile]:
+        """
+        Reads tile into memory together with up to `halo` pixels around it which lie inside the image.
+
+        :return: pixels and slices of the tile itself within them
+        """
+        rows, columns = tile
+        height, width = self.shape[:2]
+        top, left = max(0, rows.start - halo), max(0, columns.start - halo)
+        bottom, right = min(height, rows.stop + halo), min(width, columns.stop + halo)
+        pixels = np.array(self.array[top:bottom, left:right])
+        inner = (
+            slice(rows.start - top, rows.stop - top),
+            slice(columns.start - left, columns.stop - left),
+        )
+        return pixels, inner
+
+    def flush(self) -> None:
+        if self.array.flags.writeable:
+            self.array.flush()
+
+    def close(self) -> None:
+        """
+        Unmaps the file, files created by the store are deleted.
+        """
+        mapping = getattr(self.array, "_mmap", None)
+        del self.array
+        if mapping is not None:
+            mapping.close()
+        if self.owned:
+            self.path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "TiledStore":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+
+def map_tiles(
+    source: TiledStore,
+    function: TileFunction,
+    halo: int = 0,
+    tile_size: int = OUT_OF_CORE_TILE_SIZE,
+    directory: str | Path | None = OUT_OF_CORE_DIR,
+) -> TiledStore:
+    """
+    Applies image operation tile by tile and stores results in a new store. Pointwise operations need no halo,
+    neighbourhood operations get `halo` extra pixels on every side, which has to be at least the radius
+    of their neighbourhood. At image borders there is no halo, so the operation handles borders exactly
+    as when applied to the whole image and the result is identical.
+
+    :param source: input image
+    :param function: operation taking and returning an array of the same height and width
+    :param halo: neighbourhood radius of the operation
+    :param tile_size: side of processed tiles
+    :param directory: directory for the result
+    :return: new store with the result
+    """
+    target: TiledStore | None = None
+    try:
+        for tile in source.tiles(tile_size):
+            pixels, inner = source.read(tile, halo)
+            result = np.asarray(function(pixels))
+            if result.shape[:2] != pixels.shape[:2]:
+                raise ValueError(
+                    f"Tile operation has to keep tile size! {pixels.shape} {result.shape}"
+                )
+            if target is None:
+                # result type is known only after the first tile
+                target = TiledStore.create(
+                    source.shape[:2] + result.shape[2:], result.dtype, directory
+                )
+            target.array[tile] = result[inner]
+    except Exception:
+        if target is not None:
+            target.close()
+        raise
+    assert target is not None
+    target.flush()
+    return target
+
+
+def reduce_tiles(
+    source: TiledStore,
+    function: Callable[[np.ndarray], Any],
+    combine: Callable[[Any, Any], Any],
+    tile_size: int = OUT_OF_CORE_TILE_SIZE,
+) -> Any:
+    """
+    Reduces image by reducing every tile and combining the partial results, i.e. `np.add` for sums.
+    """
+    partials = (function(source.read(tile)[0]) for tile in source.tiles(tile_size))
+    result = next(partials)
+    for partial in partials:
+        result = combine(result, partial)
+    return result
+
+
+def histogram(source: TiledStore, tile_size: int = OUT_OF_CORE_TILE_SIZE) -> np.ndarray:
+    """
+    Number of pixels of every intensity, per channel for color images.
+
+    :return: int64 array of shape (levels,) or (channels, levels)
+    """
+    levels = 2**16 if source.dtype == np.uint16 else 256
+
+    def tile_histogram(pixels: np.ndarray) -> np.ndarray:
+        channels = pixels.reshape(pixels.shape[0] * pixels.shape[1], -1).T
+        return np.stack(
+            [np.bincount(channel, minlength=levels) for channel in channels]
+        )
+
+    counts: np.ndarray = reduce_tiles(source, tile_histogram, np.add, tile_size)
+    return counts[0] if source.array.ndim == 2 else counts
+
+
+def measure_store(
+    source: TiledStore,
+    workers: int | None = None,
+    max_strip_pixels: int = OUT_OF_CORE_STRIP_PIXELS,
+) -> MeasureTable:
+    """
+    Measures contours of a binary store strip by strip, objects crossing strips are merged,
+    so the result is the same as for the whole image. Stores of bool masks are measured as well,
+    strips are viewed as uint8 in the workers.
+    """
+    return measure_image_parallel(source.array, workers, max_strip_pixels)
+
+
+def save_store(
+    source: TiledStore, path: str | Path, tile_size: int = OUT_OF_CORE_TILE_SIZE
+) -> None:
+    """
+    Saves store as an image file. TIFF files are written uncompressed in strips of tiles, so the image is never
+    held in memory and the file can be opened as a store again. Other formats are encoded by PIL from the whole image.
+
+    :param source: 8-bit or 16-bit image
+    :param path: image path, its extension gives the format
+    :param tile_size: height of strips written at once
+    """
+    path = Path(path)
+    if path.suffix.lower() in TIFF_SUFFIXES:
+        _write_raw_tiff(source, path, tile_size)
+        return None
+    logger.warning(
+        f"{path} is not a TIFF file, the whole image is loaded into memory to encode it"
+    )
+    Image.fromarray(np.asarray(source.array)).save(path)
+
+
+def _write_raw_tiff(source: TiledStore, path: Path, tile_size: int) -> None:
+    """
+    Baseline TIFF with a single uncompressed strip, the layout `TiledStore.open` maps without decoding.
+    """
+    if source.dtype not in (np.uint8, np.uint16):
+        raise ValueError(f"Only 8-bit and 16-bit images can be saved! {source.dtype}")
+    height, width = source.shape[:2]
+    samples = source.shape[2] if len(source.shape) == 3 else 1
+    bits = source.dtype.itemsize * 8
+    entry_count = 10
+    bits_offset = 8 + 2 + 12 * entry_count + 4
+    data_offset = bits_offset + (2 * samples if samples > 1 else 0)
+    if data_offset + source.nbytes > TIFF_MAX_BYTES:
+        raise ValueError(f"Image is too big for a TIFF file! {source.nbytes} B")
+    # (tag, type, count, value), values of more than one short are stored after the directory
+    entries = [
+        (256, TIFF_LONG, 1, width),
+        (257, TIFF_LONG, 1, height),
+        (258, TIFF_SHORT, samples, bits if samples == 1 else bits_offset),
+        # no compression
+        (259, TIFF_SHORT, 1, 1),
+        # black is zero or RGB
+        (262, TIFF_SHORT, 1, 1 if samples == 1 else 2),
+        (273, TIFF_LONG, 1, data_offset),
+        (277, TIFF_SHORT, 1, samples),
+        (278, TIFF_LONG, 1, height),
+        (279, TIFF_LONG, 1, source.nbytes),
+        # interleaved channels
+        (284, TIFF_SHORT, 1, 1),
+    ]
+    with open(path, "wb") as tiff_file:
+        tiff_file.write(struct.pack("<2sHIH", b"II", 42, 8, len(entries)))
+        for tag, value_type, count, value in entries:
+            if value_type == TIFF_SHORT and count == 1:
+                tiff_file.write(struct.pack("<HHIHH", tag, value_type, count, value, 0))
+            else:
+                tiff_file.write(struct.pack("<HHII", tag, value_type, count, value))
+        tiff_file.write(struct.pack("<I", 0))
+        if samples > 1:
+            tiff_file.write(struct.pack(f"<{samples}H", *[bits] * samples))
+        for top in range(0, height, tile_size):
+            strip = source.array[top : top + tile_size]
+            tiff_file.write(strip.astype(source.dtype.newbyteorder("<")).tobytes())
@@ -0,0 +1,329 @@
+import itertools
+import logging
+import tempfile
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from imagepy.utils.constants import (
+    UNDO_DIR,
+    UNDO_DISK_LIMIT,
+    UNDO_MEMORY_LIMIT,
+    UNDO_TILE_SIZE,
+)
+from imagepy.utils.image_buffer import ImageBuffer
+
+logger = logging.getLogger(__name__)
+
+# zlib level, fast compression matters more than ratio because patches are made on every image update
+COMPRESSION_LEVEL = 1
+
+
+class Patch:
+    """
+    Turns one image state into another by overwriting changed tiles. Tiles are stored zlib compressed,
+    a patch between images of different shape or type stores the whole target image as a single tile.
+    Compressed data may be moved to disk, the tile index always stays in memory.
+    """
+
+    _ids = itertools.count()
+
+    def __init__(
+        self,
+        shape: tuple[int, ...],
+        dtype: np.dtype,
+        tile_size: int,
+        tiles: np.ndarray,
+        data: bytes,
+        full: bool,
+    ):
+        """
+        :param shape: shape of the target image
+        :param dtype: type of the target image
+        :param tile_size: side of the tiles
+        :param tiles: int64 array of (row, column, compressed length) of every stored tile
+        :param data: concatenated compressed tiles
+        :param full: whether the patch stores the whole target image
+        """
+        self.id = next(self._ids)
+        self.shape = shape
+        self.dtype = dtype
+        self.tile_size = tile_size
+        self.tiles = tiles
+        self.full = full
+        self.nbytes = len(data)
+        self._data: bytes | None = data
+        self.path: Path | None = None
+
+    @property
+    def in_memory(self) -> bool:
+        return self._data is not None
+
+    @property
+    def data(self) -> bytes:
+        if self._data is not None:
+            return self._data
+        assert self.path is not None
+        return self.path.read_bytes()
+
+    def spill(self, directory: Path) -> None:
+        """
+        Moves compressed data to a file in given directory.
+        """
+        assert self._data is not None
+        path = directory / f"{self.id}.patch"
+        path.write_bytes(self._data)
+        self.path = path
+        self._data = None
+
+    def discard(self) -> None:
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+        self._data = None
+
+
+def make_patch(
+    base: np.ndarray, target: np.ndarray, tile_size: int = UNDO_TILE_SIZE
+) -> Patch:
+    """
+    Patch turning `base` into `target`, only tiles where they differ are stored.
+    """
+    if base.shape != target.shape or base.dtype != target.dtype:
+        data = zlib.compress(np.ascontiguousarray(target).data, COMPRESSION_LEVEL)
+        return Patch(
+            target.shape,
+            target.dtype,
+            max(target.shape[:2]),
+            np.array([[0, 0, len(data)]], dtype=np.int64),
+            data,
+            full=True,
+        )
+
+    height, width = target.shape[:2]
+    changed = (base != target).reshape(height, width, -1).any(axis=2)
+    # changed pixels counted per tile with a single pass over the difference mask
+    changed_tiles = np.add.reduceat(
+        np.add.reduceat(changed, np.arange(0, height, tile_size), axis=0),
+        np.arange(0, width, tile_size),
+        axis=1,
+    )
+    tiles, chunks = [], []
+    for row, column in zip(*np.nonzero(changed_tiles)):
+        tile = target[
+            row * tile_size : (row + 1) * tile_size,
+            column * tile_size : (column + 1) * tile_size,
+        ]
+        chunk = zlib.compress(np.ascontiguousarray(tile).data, COMPRESSION_LEVEL)
+        tiles.append((row, column, len(chunk)))
+        chunks.append(chunk)
+    return Patch(
+        target.shape,
+        target.dtype,
+        tile_size,
+        np.array(tiles, dtype=np.int64).reshape(-1, 3),
+        b"".join(chunks),
+        full=False,
+    )
+
+
+def apply_patch(base: np.ndarray, patch: Patch) -> np.ndarray:
+    """
+    :return: new array, `base` is not modified
+    """
+    data = patch.data
+    if patch.full:
+        return np.frombuffer(zlib.decompress(data), dtype=patch.dtype).reshape(
+            patch.shape
+        )
+
+    result = base.copy()
+    tile_size, offset = patch.tile_size, 0
+    for row, column, length in patch.tiles.tolist():
+        tile = result[
+            row * tile_size : (row + 1) * tile_size,
+            column * tile_size : (column + 1) * tile_size,
+        ]
+        tile[...] = np.frombuffer(
+            zlib.decompress(data[offset : offset + length]), dtype=patch.dtype
+        ).reshape(tile.shape)
+        offset += length
+    return result
+
+
+class HistoryMemory:
+    """
+    Keeps patches of all histories within memory and disk limits. The oldest patches are moved to disk first,
+    when the disk limit is exceeded too, the oldest ones are forgotten together with all steps behind them.
+    """
+
+    def __init__(
+        self,
+        memory_limit: int = UNDO_MEMORY_LIMIT,
+        disk_limit: int = UNDO_DISK_LIMIT,
+        disk_dir: str | Path | None = UNDO_DIR,
+    ):
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self._disk_dir = Path(disk_dir) if disk_dir else None
+        # patches in the order they were made, with their histories
+        self._patches: OrderedDict[int, tuple[Patch, weakref.ref["UndoHistory"]]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    @property
+    def disk_dir(self) -> Path:
+        if self._disk_dir is None:
+            self._disk_dir = Path(tempfile.mkdtemp(prefix="imagepy-undo-"))
+        self._disk_dir.mkdir(parents=True, exist_ok=True)
+        return self._disk_dir
+
+    def add(self, history: "UndoHistory", patch: Patch) -> None:
+        with self._lock:
+            self._patches[patch.id] = (patch, weakref.ref(history))
+            self.memory_bytes += patch.nbytes
+            forgotten = self._enforce_limits()
+        for forgotten_history, forgotten_patch in forgotten:
+            forgotten_history.forget(forgotten_patch)
+
+    def remove(self, patch: Patch) -> None:
+        with self._lock:
+            if self._patches.pop(patch.id, None) is None:
+                return None
+            if patch.in_memory:
+                self.memory_bytes -= patch.nbytes
+            else:
+                self.disk_bytes -= patch.nbytes
+        patch.discard()
+
+    def _enforce_limits(self) -> list[tuple["UndoHistory", Patch]]:
+        if self.memory_bytes > self.memory_limit:
+            for patch, _history in list(self._patches.values()):
+                if self.memory_bytes <= self.memory_limit:
+                    break
+                if not patch.in_memory:
+                    continue
+                try:
+                    patch.spill(self.disk_dir)
+                except OSError as e:
+                    logger.error(e)
+                    break
+                self.memory_bytes -= patch.nbytes
+                self.disk_bytes += patch.nbytes
+
+        forgotten = []
+        while self._patches and (
+            self.disk_bytes > self.disk_limit or self.memory_bytes > self.memory_limit
+        ):
+            _patch_id, (patch, reference) = self._patches.popitem(last=False)
+            if patch.in_memory:
+                self.memory_bytes -= patch.nbytes
+            else:
+                self.disk_bytes -= patch.nbytes
+            patch.discard()
+            history = reference()
+            if history is not None:
+                forgotten.append((history, patch))
+        return forgotten
+
+
+history_memory = HistoryMemory()
+
+
+class UndoHistory:
+    """
+    Undo and redo steps of a single window. Image buffers are immutable, so states are never copied
+    when recorded: each step is a patch turning the current buffer into the previous (undo) or the next (redo)
+    one, storing only tiles which differ between them.
+    """
+
+    def __init__(self, memory: HistoryMemory = history_memory):
+        self.memory = memory
+        self.undo_patches: list[Patch] = []
+        self.redo_patches: list[Patch] = []
+        weakref.finalize(
+            self, self._discard_all, memory, self.undo_patches, self.redo_patches
+        )
+
+    @property
+    def can_undo(self) -> bool:
+        return bool(self.undo_patches)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self.redo_patches)
+
+    def record(
+        self, before: ImageBuffer, after: ImageBuffer, merge: bool = False
+    ) -> None:
+        """
+        Records change of the image from `before` to `after`. Steps which could be redone are dropped.
+
+        :param merge: join the change with the last recorded one, so both are undone at once
+        """
+        before_array = before.array
+        if merge and self.undo_patches and not self.redo_patches:
+            last = self.undo_patches.pop()
+            before_array = apply_patch(before_array, last)
+            self.memory.remove(last)
+        self._clear(self.redo_patches)
+        self._push(self.undo_patches, make_patch(after.array, before_array))
+
+    def undo(self, current: ImageBuffer) -> ImageBuffer | None:
+        """
+        :return: previous state or None if there is nothing to undo
+        """
+        return self._step(current, self.undo_patches, self.redo_patches)
+
+    def redo(self, current: ImageBuffer) -> ImageBuffer | None:
+        """
+        :return: next state or None if there is nothing to redo
+        """
+        return self._step(current, self.redo_patches, self.undo_patches)
+
+    def clear(self) -> None:
+        self._clear(self.undo_patches)
+        self._clear(self.redo_patches)
+
+    def forget(self, patch: Patch) -> None:
+        """
+        Drops a patch removed by the memory together with all steps behind it, which can not be reached anymore.
+        """
+        for patches in (self.undo_patches, self.redo_patches):
+            if patch in patches:
+                index = patches.index(patch)
+                self._clear(patches[:index])
+                del patches[: index + 1]
+                logger.debug(f"Undo history shortened by {index + 1} steps")
+
+    def _step(
+        self, current: ImageBuffer, source: list[Patch], target: list[Patch]
+    ) -> ImageBuffer | None:
+        if not source:
+            return None
+        patch = source.pop()
+        restored = ImageBuffer(apply_patch(current.array, patch))
+        self.memory.remove(patch)
+        self._push(target, make_patch(restored.array, current.array))
+        return restored
+
+    def _push(self, patches: list[Patch], patch: Patch) -> None:
+        patches.append(patch)
+        self.memory.add(self, patch)
+
+    def _clear(self, patches: list[Patch]) -> None:
+        for patch in patches:
+            self.memory.remove(patch)
+        patches.clear()
+
+    @staticmethod
+    def _discard_all(memory: HistoryMemory, *patch_lists: list[Patch]) -> None:
+        for patches in patch_lists:
+            for patch in patches:
+                memory.remove(patch)
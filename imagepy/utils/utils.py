@@ -1,18 +1,26 @@
 import logging
 import os
 from tkinter import filedialog as fd
+from tkinter.messagebox import showinfo
 from typing import Self
 
-from PIL import Image, UnidentifiedImageError
+import numpy as np
+from PIL import UnidentifiedImageError
 from PIL.Image import Image as PILImage
 
+from imagepy.pipeline.optimizer import optimize_pipeline
+from imagepy.pipeline.pipeline import Pipeline
 from imagepy.utils.constants import (
     FILE_TYPES,
     MAX_INTENSITY_LEVEL,
+    PIPELINE_FILE_TYPES,
     ColorEnum,
     FileDialogArgs,
+    ImageModeEnum,
 )
+from imagepy.utils.image_loading import open_image
 from imagepy.utils.image_manager import ImageWindow
+from imagepy.utils.jobs import CancellationToken, run_job
 
 logger = logging.getLogger(__name__)
 
@@ -24,13 +32,13 @@ def open_file() -> None:
         return None
 
     try:
-        image = Image.open(filename)
-    except (UnidentifiedImageError, FileNotFoundError) as e:
+        image, pending_image = open_image(filename)
+    except (UnidentifiedImageError, FileNotFoundError, ValueError) as e:
         logger.error(e)
         return None
 
     # Put it in the display window
-    ImageWindow(source_path=filename, image=image)
+    ImageWindow(source_path=filename, image=image, pending_image=pending_image)
     logger.info(f"Image opened from {filename}")
 
 
@@ -74,12 +82,108 @@ def duplicate_image(
     if source_image:
         ImageWindow(source_image)
     elif source_window:
-        ImageWindow(source_window.image)
+        # buffers are immutable, so the duplicate shares pixel data with the source until either changes
+        duplicate = ImageWindow(source_window.buffer)
+        duplicate.macro = source_window.macro.copy()
     else:
         logger.debug("Image to duplicate is not selected")
         return None
 
 
+def undo_image(source_window: ImageWindow | None) -> None:
+    if not source_window:
+        logger.debug("Image to undo is not selected")
+        return None
+    source_window.undo()
+
+
+def redo_image(source_window: ImageWindow | None) -> None:
+    if not source_window:
+        logger.debug("Image to redo is not selected")
+        return None
+    source_window.redo()
+
+
+def show_macro(source_window: ImageWindow | None) -> None:
+    if not source_window:
+        logger.debug("Image with macro to show is not selected")
+        return None
+    message = "\n".join(map(str, source_window.macro.pipeline().steps))
+    if source_window.macro.unreplayable:
+        message += (
+            f"\n\n{source_window.macro.unreplayable} change(s) can not be replayed "
+            "and are left out."
+        )
+    showinfo(
+        title=f"Macro of {source_window.window_title}",
+        message=message or "No operations recorded",
+    )
+
+
+def save_macro(source_window: ImageWindow | None) -> None:
+    if not source_window:
+        logger.debug("Image with macro to save is not selected")
+        return None
+    pipeline = source_window.macro.pipeline()
+    if source_window.macro.unreplayable:
+        logger.warning(
+            f"{source_window.macro.unreplayable} change(s) of {source_window.window_title} "
+            "have no pipeline operation and are left out of the macro"
+        )
+    save_path = fd.asksaveasfilename(
+        filetypes=PIPELINE_FILE_TYPES, defaultextension="json"
+    )
+    if not save_path:
+        return None
+    try:
+        pipeline.save(save_path)
+    except OSError as e:
+        logger.error(e)
+        return None
+    logger.info(f"Macro saved at {save_path}")
+
+
+def clear_macro(source_window: ImageWindow | None) -> None:
+    if not source_window:
+        logger.debug("Image with macro to clear is not selected")
+        return None
+    source_window.macro.clear()
+
+
+def run_pipeline(source_window: ImageWindow | None) -> None:
+    """
+    Replays pipeline saved from a macro, or written for imagepy-batch, on the selected image.
+    """
+    if not source_window or source_window.mode != ImageModeEnum.GREYSCALE:
+        return None
+    pipeline_path = fd.askopenfilename(filetypes=PIPELINE_FILE_TYPES)
+    if not pipeline_path:
+        return None
+    try:
+        pipeline = Pipeline.load(pipeline_path)
+    except (OSError, ValueError) as e:
+        logger.error(e)
+        return None
+
+    source_array = source_window.buffer.array
+    # exact optimization gives the same result, the original pipeline is recorded in the macro
+    optimized = optimize_pipeline(pipeline)
+
+    def run(token: CancellationToken) -> np.ndarray:
+        image_array = source_array
+        for i, step in enumerate(optimized.steps):
+            token.report(i / len(optimized.steps), step.operation)
+            image_array = step.run(image_array)
+        return image_array
+
+    run_job(
+        "Pipeline",
+        run,
+        lambda result: source_window.update_array(result, pipeline),
+        owner=source_window,
+    )
+
+
 class ColorIterator:
     def __init__(
         self,
@@ -0,0 +1,65 @@
+import gc
+import weakref
+
+import cv2
+import numpy as np
+
+from imagepy.utils.image_buffer import ImageBuffer
+from imagepy.utils.image_pyramid import ImagePyramid, PyramidMemory
+
+
+def make_buffer(size: int = 1024) -> ImageBuffer:
+    rng = np.random.default_rng(0)
+    return ImageBuffer(rng.integers(0, 256, (size, size), dtype=np.uint8))
+
+
+def build_levels(pyramid: ImagePyramid, level: int) -> None:
+    pyramid.request(level)
+    assert pyramid._builder is not None
+    pyramid._builder.join()
+
+
+def test_dropped_buffers_and_pyramids_are_collected() -> None:
+    references = []
+    for _ in range(20):
+        buffer = make_buffer()
+        pyramid = ImagePyramid.of(buffer)
+        build_levels(pyramid, 2)
+        references.append((weakref.ref(buffer), weakref.ref(pyramid)))
+    del buffer, pyramid
+    gc.collect()
+
+    assert all(
+        buffer_ref() is None and pyramid_ref() is None
+        for buffer_ref, pyramid_ref in references
+    )
+
+
+def test_levels_of_collected_pyramid_are_forgotten() -> None:
+    memory = PyramidMemory()
+    buffer = make_buffer()
+    pyramid = ImagePyramid(buffer, memory)
+    build_levels(pyramid, 2)
+    assert memory.memory_bytes == 512 * 512 + 256 * 256
+
+    del buffer, pyramid
+    assert memory.memory_bytes == 0
+
+
+def test_pyramid_is_shared_while_buffer_lives() -> None:
+    buffer = make_buffer()
+    assert ImagePyramid.of(buffer) is ImagePyramid.of(buffer)
+
+
+def test_levels_are_built_from_finer_levels() -> None:
+    buffer = make_buffer()
+    pyramid = ImagePyramid.of(buffer)
+    level_0, ready = pyramid.get(1.0)
+    assert ready and level_0 is buffer
+
+    build_levels(pyramid, 2)
+    level_2, ready = pyramid.get(0.25)
+    halved = cv2.resize(buffer.array, (512, 512), interpolation=cv2.INTER_AREA)
+    expected = cv2.resize(halved, (256, 256), interpolation=cv2.INTER_AREA)
+    assert ready
+    assert np.array_equal(level_2.array, expected)